@@ -0,0 +1,227 @@
+import os
+import struct
+import numpy
+import ephem
+import eph_functions as JD
+import eph_twilight
+import eph_moon
+import eph_sun
+
+"""
+Module to keep a per observatory almanac of the nights over a span
+of years, so the engine, the calendar export and whatsUpTonight.py
+read the night's conditions rather than each working them out, e.g.
+
+	import eph_engine, eph_almanac
+	site = eph_engine.Read_observatories('observatories2')[0]
+	eph_almanac.Ensure('almanac', site, 2457388, 2458119)
+	almanac = eph_almanac.Open('almanac', site)
+	print(almanac.night(2457724.7))
+
+Each site has one <name>.alm file: a fixed size header then one fixed
+size little endian record per night, in night order, so the whole
+file can be memory mapped as a numpy array (or a record read with
+struct from the standard library) without any parsing. Nights are
+numbered as JD.Night_array, the integer JD at 12:00 UT on the date
+the night starts, which is also the night's local calendar date. The
+Sun times are those of eph_twilight (so the engine's results are the
+same with or without an almanac), the Moon's rise and set the first
+after the site's noontime from an eph_moon table, within three
+minutes of PyEphem, and its illumination is at the middle of the
+night (noontime plus 12 hours)
+"""
+
+# header: magic, first night, number of nights, latitude, longitude,
+# elevation and noontime (UT hours), padded to header_size bytes
+magic = b'EPHALM01'
+header_format = '<8sii4d'
+header_size = 64
+
+# one record per night, times are JDs (NaN when they don't happen in
+# the 24 hours from noontime), twi1/twi2 the UT hours of the dark time
+# as TwilightCache.hours and always its Always for the twilights
+night_dtype = numpy.dtype([('night', '<i4'), ('year', '<i2'), ('month', 'u1'), ('day', 'u1'),
+	('sunset', '<f8'), ('evening_twilight', '<f8'), ('morning_twilight', '<f8'), ('sunrise', '<f8'),
+	('moonrise', '<f8'), ('moonset', '<f8'), ('twi1', '<f8'), ('twi2', '<f8'),
+	('illumination', '<f4'), ('always', 'i1'), ('pad', 'V3')])
+night_format = '<ihBB8dfb3x'
+night_fields = ['night', 'year', 'month', 'day', 'sunset', 'evening_twilight', 'morning_twilight',
+	'sunrise', 'moonrise', 'moonset', 'twi1', 'twi2', 'illumination', 'always']
+
+# geometric altitude of the Moon's centre at moonrise/moonset, the
+# horizontal parallax less the refraction and semi-diameter
+moon_altitude = 0.125
+
+# step (days) of the Moon table the rise and set are found from, the
+# interpolation between points this far apart adds well under a
+# second to them
+moon_step = 0.25
+
+##################################
+
+def Filename(directory, site):
+	return os.path.join(directory, site['name'] + '.alm')
+
+##################################
+
+def Noon_hours(noontime):
+	return JD.Time_to_decimal(tuple(noontime.split(':')))
+
+##################################
+
+def Night_dates(JDs, noontime):
+	# (year, month, day) arrays of the date each JD's night starts on,
+	# for when there's no almanac
+	(d, m, y), hms = JD.Jul_date_array(numpy.atleast_1d(JD.Night_array(JDs, noontime)).astype(float))
+	return y, m, d
+
+##################################
+
+def Year_range(startJD, endJD):
+	# JDs of the start of the year of startJD and end of that of endJD
+	(d, m, y), hms = JD.Jul_date_array(numpy.array([startJD, endJD], dtype=float))
+	return (ephem.julian_date(ephem.Date('%d/1/1' % (y[0]))),
+		ephem.julian_date(ephem.Date('%d/12/31 23:59:59' % (y[1]))))
+
+##################################
+
+def Moon_altitude(moon, JD_times, latitude, longitude):
+	# geocentric altitude (degrees) of the Moon's centre at the JDs from
+	# a site, from the eph_moon.MoonTable
+	JD_times = numpy.asarray(JD_times, dtype=float)
+	xyz = moon.position(JD_times.reshape(-1))
+	ra = (numpy.degrees(numpy.arctan2(xyz[:,1], xyz[:,0])) / 15.) % 24.
+	dec = numpy.degrees(numpy.arcsin(numpy.clip(xyz[:,2], -1., 1.)))
+	HA = JD.HA_array(JD.Sid_time_array(JD_times.reshape(-1), longitude), ra)
+	return JD.Altitude(latitude, dec, HA).reshape(JD_times.shape)
+
+##################################
+
+def Build(site, startJD, endJD, store=None):
+	# eph_almanac records for the nights of the site from that of
+	# startJD to that of endJD. store is a twilight store (see
+	# eph_twilight.LoadStore) to reuse and keep the sun times in
+	first, last = JD.Night_array(numpy.array([startJD, endJD], dtype=float), site['noontime'])
+	nights = numpy.arange(first, last + 1)
+	noons = nights - 0.5 + Noon_hours(site['noontime']) / 24.
+	records = numpy.zeros(len(nights), dtype=night_dtype)
+	records['night'] = nights
+	(d, m, y), hms = JD.Jul_date_array(nights.astype(float))
+	records['year'], records['month'], records['day'] = y, m, d
+
+	# the sun times and twilight hours exactly as the engine has them
+	twilight = eph_twilight.TwilightCache(site['latitude'],site['longitude'],site['elev'],site['noontime'],store)
+	twilight.fill(noons[0], noons[-1])
+	times = numpy.array([twilight.nights[twilight.noon(date)[0]] for date in zip(d, m, y)]).reshape(-1, 5)
+	for i,field in enumerate(['sunset', 'evening_twilight', 'morning_twilight', 'sunrise']):
+		records[field] = times[:,i] + eph_twilight.dublin_jd
+	records['always'] = times[:,4]
+	hours = twilight.hours_array(noons, (d, m, y))
+	records['twi1'], records['twi2'] = hours[:,0], hours[:,1]
+
+	# the Moon over the 24 hours from each noontime
+	moon = eph_moon.MoonTable(noons[0], noons[-1] + 1., moon_step)
+	def altitude(JD_times, latitude, longitude):
+		return Moon_altitude(moon, JD_times, latitude, longitude)
+	grid, alts = eph_sun.Grid(noons, site['latitude'], site['longitude'], function=altitude)
+	records['moonrise'] = eph_sun.Crossings(grid, alts, site['latitude'], site['longitude'],
+		moon_altitude, rising=True, function=altitude)
+	records['moonset'] = eph_sun.Crossings(grid, alts, site['latitude'], site['longitude'],
+		moon_altitude, function=altitude)
+	records['illumination'] = moon.illumination(noons + 0.5)
+	return records
+
+##################################
+
+def Write(filename, site, records):
+	# write the almanac records (contiguous nights) for site
+	first = int(records['night'][0]) if len(records) else 0
+	header = struct.pack(header_format, magic, first, len(records), site['latitude'],
+		site['longitude'], site['elev'], Noon_hours(site['noontime']))
+	with open(filename, 'wb') as f:
+		f.write(header + b'\0' * (header_size - len(header)))
+		f.write(numpy.ascontiguousarray(records, dtype=night_dtype).tobytes())
+
+##################################
+
+def Open(directory, site):
+	# the site's Almanac from the directory, None if there isn't one or
+	# it was made for a different latitude, longitude, elevation or
+	# noontime
+	filename = Filename(directory, site)
+	if not os.path.exists(filename):
+		return None
+	almanac = Almanac(filename)
+	return almanac if almanac.matches(site) else None
+
+##################################
+
+def Ensure(directory, site, startJD, endJD, store=None):
+	# make sure the site has an almanac in the directory covering
+	# startJD to endJD, (re)building it for whole years if not and
+	# keeping any nights it already had. Returns the Almanac
+	almanac = Open(directory, site)
+	if almanac is not None and almanac.covers(startJD, endJD):
+		return almanac
+	startJD, endJD = Year_range(startJD, endJD)
+	if almanac is not None and len(almanac.nights):
+		noon = almanac.noon / 24. - 0.5
+		startJD = min(startJD, almanac.nights['night'][0] + noon)
+		endJD = max(endJD, almanac.nights['night'][-1] + noon)
+		del almanac
+	if not os.path.exists(directory):
+		os.makedirs(directory)
+	Write(Filename(directory, site), site, Build(site, startJD, endJD, store))
+	return Open(directory, site)
+
+##################################
+
+class Almanac(object):
+	"""
+	A site's almanac file, memory mapped. nights is the night_dtype
+	array, indexed by night number less first
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		with open(filename, 'rb') as f:
+			header = struct.unpack(header_format, f.read(struct.calcsize(header_format)))
+		if header[0] != magic:
+			raise ValueError("%s is not an almanac file" % (filename))
+		self.first, count, self.latitude, self.longitude, self.elev, self.noon = header[1:]
+		if count:
+			self.nights = numpy.memmap(filename, dtype=night_dtype, mode='r', offset=header_size, shape=(count,))
+		else:
+			self.nights = numpy.zeros(0, dtype=night_dtype)
+
+	def matches(self, site):
+		return (abs(self.latitude - site['latitude']) < 1e-6 and abs(self.longitude - site['longitude']) < 1e-6
+			and self.elev == site['elev'] and abs(self.noon - Noon_hours(site['noontime'])) < 1e-6)
+
+	def covers(self, startJD, endJD):
+		# whether every UT day from startJD to endJD has its night, as the
+		# twilight hours are looked up by the UT date (see hours_array)
+		return (len(self.nights) > 0 and numpy.floor(startJD + 0.5) >= self.first
+			and numpy.floor(endJD + 0.5) < self.first + len(self.nights))
+
+	def rows(self, JDs):
+		# index into nights of the night each JD falls in
+		noon = self.noon / 24.
+		return numpy.floor(numpy.asarray(JDs, dtype=float) + 0.5 - noon).astype(numpy.int64) - self.first
+
+	def night(self, JD):
+		# the record of the night JD falls in, None if it's not covered
+		i = int(self.rows(JD))
+		return self.nights[i] if 0 <= i < len(self.nights) else None
+
+	def dates(self, JDs):
+		# (year, month, day) arrays of the date each JD's night starts on
+		nights = self.nights[self.rows(numpy.atleast_1d(JDs))]
+		return nights['year'], nights['month'], nights['day']
+
+	def hours_array(self, JDs, dates=None):
+		# UT hours of the end of evening and start of morning twilight for
+		# the night following noontime on the UT date of each JD, as
+		# TwilightCache.hours_array
+		day = numpy.floor(numpy.asarray(JDs, dtype=float) + 0.5).astype(numpy.int64) - self.first
+		nights = self.nights[day]
+		return numpy.stack((nights['twi1'], nights['twi2']), axis=-1)
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from icalendar import Event
+import numpy
+import eph_records
+import eph_output
+import eph_almanac
+
+"""
+Module to export transits to iCal (.ics) files, for any observatory
+
+The events are written as they are added rather than built up into
+one big calendar, each with a UID made from the site, object and
+mid-time so re-exporting a run gives the same UIDs. A calendar can
+hold one site or several, with the site named in each event. Events
+go on the local date their night starts, from the site's eph_almanac
+when there is one
+"""
+
+# which transits go in by default, as the original La Palma calendar
+default_types = [eph_records.FULL]
+default_moon_sep = 30.
+
+##################################
+
+def Select(records, types=None, min_moon_sep=None, min_alt=None):
+	# mask of the records to export. types is a list of eph_records
+	# types, min_alt is compared with the lowest altitude over the
+	# sampled window (see eph_engine.Window_samples)
+	keep = numpy.ones(len(records), dtype=bool)
+	if types is not None:
+		keep &= numpy.isin(records['type'], types)
+	if min_moon_sep is not None:
+		keep &= records['moon_sep'] >= min_moon_sep
+	if min_alt is not None:
+		keep &= records['min_alt'] >= min_alt
+	return keep
+
+##################################
+
+def Night_start(line, date):
+	# UT of the mid-time of a listing line as a datetime on the date
+	# (year, month, day) its night starts, so the morning transits sit
+	# on the same date as the evening ones
+	hour, minute, second = [int(x) for x in line.split()[2].split(':')]
+	return datetime(int(date[0]), int(date[1]), int(date[2]), hour, minute, second)
+
+##################################
+
+class CalendarFile(object):
+	"""
+	An .ics file written an event at a time, close() finishes it
+	"""
+	def __init__(self, filename, name='NITES Transit Calendar'):
+		self.filename = filename
+		self.events = 0
+		self.f = open(filename, 'wb')
+		self.f.write(b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:meadeCalendar\r\n")
+		self.f.write(("X-WR-CALNAME:%s\r\n" % (name)).encode('utf-8'))
+
+	def add(self, site, objects, records, types=default_types, min_moon_sep=default_moon_sep,
+		min_alt=None, label=False, almanac=None):
+		# one event per selected record, in time order. With label the
+		# site name goes into each event's summary. almanac is the site's
+		# eph_almanac.Almanac for the dates of the nights, if it has one
+		records = records[Select(records, types, min_moon_sep, min_alt)]
+		records = records[eph_output.Time_order(records)]
+		lines = eph_records.Format_lines(records, objects, site['lowlim'])
+		if almanac is not None and len(records) and almanac.covers(records['utc'].min() - 1., records['utc'].max()):
+			dates = almanac.dates(records['utc'])
+		else:
+			dates = eph_almanac.Night_dates(records['utc'], site['noontime'])
+		stamp = datetime.now()
+		for rec,line,date in zip(records, lines, zip(*dates)):
+			tokens = line.split()
+			d = Night_start(line, date)
+			name = tokens[0] + (" @ %s" % site['name'] if label else "")
+			event = Event()
+			event.add('summary', "%s\n%s %s" % (name, d, ' '.join(tokens[3:])))
+			event.add('dtstart', d)
+			event.add('dtend', d + timedelta(hours=1))
+			event.add('dtstamp', stamp)
+			event['uid'] = "%s-%s-%.5f@transit-ephemerides" % (site['name'], tokens[0], rec['hjd'])
+			event.add('priority', 5)
+			self.f.write(event.to_ical())
+			self.events += 1
+
+	def close(self):
+		self.f.write(b"END:VCALENDAR\r\n")
+		self.f.close()
@@ -0,0 +1,240 @@
+import os
+import csv
+import json
+import hashlib
+import numpy
+import eph_functions as JD
+import eph_timesys
+
+"""
+Module to read target catalogs into columns, parsing each file once
+
+Two formats are understood, the whitespace format of the targets/
+files:
+
+	name epoch period duration(hrs) RA(h m s) Dec(d m s) [# comment]
+
+where the comment can give the epoch's time standard, e.g.
+time=BJD_TDB (see eph_timesys), and CSV exports (e.g. a copy of an
+exoplanet archive table) with a mapping from the catalog fields to
+the CSV's columns. The parsed
+columns can be kept in a binary sidecar file (<filename>.cache.npz)
+which is reused for as long as the catalog's modification time and
+size, or failing those its contents, are unchanged
+"""
+
+# bump when the parsing changes so old sidecars are ignored
+cache_version = 4
+
+# CSV column mapping for the NASA Exoplanet Archive's planetary
+# systems tables. ra and dec there are in decimal degrees
+archive_columns = {'name': 'pl_name', 'epoch': 'pl_tranmid', 'period': 'pl_orbper',
+	'duration': 'pl_trandur', 'ra': 'ra', 'dec': 'dec', 'timesys': 'pl_tsystemref'}
+
+# units assumed for a CSV unless the mapping says otherwise
+csv_units = {'ra_unit': 'deg', 'duration_unit': 'hours', 'epoch_offset': 0.}
+
+##################################
+
+class Catalog(object):
+	"""
+	Target catalog held as columns, one entry per object. ra is in
+	hours and dec in degrees (as used by eph_engine), RA and Dec are
+	the sexagesimal text used in the output headers and timesys the
+	epoch's eph_timesys standard ('' where the catalog doesn't say)
+	"""
+	columns = ['name', 'epoch', 'period', 'duration', 'ra', 'dec', 'RA', 'Dec', 'comment', 'timesys']
+
+	def __init__(self, name, epoch, period, duration, ra, dec, RA, Dec, comment, timesys, skipped=0):
+		self.name = numpy.asarray(name)
+		self.epoch = numpy.asarray(epoch, dtype=float)
+		self.period = numpy.asarray(period, dtype=float)
+		self.duration = numpy.asarray(duration, dtype=float)
+		self.ra = numpy.asarray(ra, dtype=float)
+		self.dec = numpy.asarray(dec, dtype=float)
+		self.RA = numpy.asarray(RA)
+		self.Dec = numpy.asarray(Dec)
+		self.comment = numpy.asarray(comment)
+		self.timesys = numpy.asarray(timesys)
+		# rows of a CSV left out for missing values
+		self.skipped = skipped
+
+	def __len__(self):
+		return len(self.name)
+
+	@property
+	def ra_radians(self):
+		return self.ra * numpy.pi / 12.
+
+	@property
+	def dec_radians(self):
+		return self.dec * numpy.pi / 180.
+
+	def objects(self):
+		# the list of dictionaries used by eph_engine
+		return [{'name': str(self.name[i]), 'epoch': float(self.epoch[i]),
+			'period': float(self.period[i]), 'duration': float(self.duration[i]),
+			'RA': tuple(str(self.RA[i]).split()), 'Dec': tuple(str(self.Dec[i]).split()),
+			'ra': float(self.ra[i]), 'dec': float(self.dec[i]),
+			'comment': str(self.comment[i]), 'timesys': str(self.timesys[i])} for i in range(len(self))]
+
+	def save(self, filename, **extra):
+		with open(filename, 'wb') as f:
+			numpy.savez(f, skipped=self.skipped, **dict([(c, getattr(self, c)) for c in self.columns], **extra))
+
+##################################
+
+def Parse_text(filename):
+	# the whitespace targets/ format, each line split once
+	rows = []
+	with open(filename) as f:
+		for line in f:
+			if line[0] == '#':
+				continue
+			elif line[0] != '\n' and line[0] != ' ':
+				fields = line.split(None, 10)
+				name,epoch,period,duration,r0,r1,r2,d0,d1,d2 = fields[:10]
+				comment = fields[10].strip().lstrip('#').strip() if len(fields) > 10 else ''
+				rows.append((name, float(epoch), float(period), float(duration),
+					JD.Deg((r0,r1,r2)), JD.Deg((d0,d1,d2)),
+					' '.join((r0,r1,r2)), ' '.join((d0,d1,d2)), comment, eph_timesys.From_comment(comment)))
+	return Catalog(*Columns(rows))
+
+##################################
+
+def Columns(rows):
+	# list of row tuples to one list per Catalog column
+	if not rows:
+		return [[] for c in Catalog.columns]
+	return [list(c) for c in zip(*rows)]
+
+##################################
+
+def Sexagesimal_parts(value):
+	# the three parts of sexagesimal (h:m:s, d:m:s, 06h30m32.79s or
+	# space separated) text, None for anything else, e.g. a decimal
+	parts = value.replace(':', ' ').replace('h', ' ').replace('d', ' ').replace('m', ' ').replace('s', ' ').split()
+	return parts if len(parts) == 3 else None
+
+##################################
+
+def Angle(value):
+	# decimal or sexagesimal text, the sign taken from the text so
+	# -00 20 34 comes out negative
+	parts = Sexagesimal_parts(value)
+	if parts is None:
+		return float(value)
+	angle = abs(float(parts[0])) + float(parts[1]) / 60. + float(parts[2]) / 3600.
+	return -angle if value.strip().startswith('-') else angle
+
+##################################
+
+def Parse_csv(filename, columns=None):
+	# CSV with a header row, columns maps name, epoch, period, duration,
+	# ra and dec (and optionally comment and timesys, the epoch's time
+	# standard) to the CSV's column names (default archive_columns)
+	# and can also set ra_unit ('deg' or 'hours', of decimal RAs, the
+	# sexagesimal ones are always hours), duration_unit ('hours' or
+	# 'days') and epoch_offset (added to the epochs, e.g. 2454833 for
+	# BKJD). Rows missing a value are skipped, spaces are taken out of
+	# the names so they work as single words in the listings
+	mapping = dict(archive_columns)
+	mapping.update(csv_units)
+	mapping.update(columns or {})
+	rows, skipped = [], 0
+	with open(filename) as f:
+		reader = csv.DictReader(line for line in f if not line.startswith('#'))
+		for row in reader:
+			try:
+				values = [row[mapping[c]].strip() for c in ('name', 'epoch', 'period', 'duration', 'ra', 'dec')]
+			except KeyError as column:
+				raise ValueError("No column %s in %s" % (column, filename))
+			if '' in values:
+				skipped += 1
+				continue
+			name,epoch,period,duration,ra,dec = values
+			ra, dec = Angle(ra), Angle(dec)
+			# sexagesimal RAs are always hours, decimals in ra_unit
+			if mapping['ra_unit'] == 'deg' and Sexagesimal_parts(values[4]) is None:
+				ra = ra / 15.
+			duration = float(duration) * (24. if mapping['duration_unit'] == 'days' else 1.)
+			comment = row.get(mapping.get('comment'), '') or ''
+			timesys = (row.get(mapping.get('timesys'), '') or '').strip()
+			timesys = eph_timesys.Parse(timesys) if timesys else eph_timesys.From_comment(comment)
+			rows.append((''.join(name.split()), float(epoch) + float(mapping['epoch_offset']),
+				float(period), duration, ra, dec, JD.Sexagesimal(ra), JD.Sexagesimal(dec, sign=True),
+				comment.strip(), timesys))
+	return Catalog(*Columns(rows), skipped=skipped)
+
+##################################
+
+def Parse_columns(text):
+	# command line column mapping, e.g.
+	# name=pl_name,epoch=pl_tranmid,ra_unit=hours
+	mapping = {}
+	for item in text.split(','):
+		key, value = item.split('=', 1)
+		mapping[key.strip()] = value.strip()
+	return mapping
+
+##################################
+
+def File_hash(filename):
+	h = hashlib.sha1()
+	with open(filename, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+##################################
+
+def Is_csv(filename, columns=None):
+	# whether Load reads filename as a CSV, if it ends .csv or a column
+	# mapping is given
+	return columns is not None or filename.lower().endswith('.csv')
+
+##################################
+
+def Load(filename, columns=None, cache=False):
+	# the Catalog in filename, CSV if Is_csv. With cache the parsed
+	# columns are kept in a sidecar file and reused until the catalog
+	# changes
+	is_csv = Is_csv(filename, columns)
+	def parse():
+		return Parse_csv(filename, columns) if is_csv else Parse_text(filename)
+	if not cache:
+		return parse()
+
+	sidecar = filename + '.cache.npz'
+	info = os.stat(filename)
+	key = json.dumps([cache_version, is_csv, sorted((columns or {}).items())])
+	digest = None
+	if os.path.exists(sidecar):
+		try:
+			data = numpy.load(sidecar)
+			meta = json.loads(data['meta'].item())
+			if meta['key'] == key:
+				same = meta['mtime'] == info.st_mtime and meta['size'] == info.st_size
+				if not same:
+					digest = File_hash(filename)
+					same = meta['sha1'] == digest
+				if same:
+					catalog = Catalog(*[data[c] for c in Catalog.columns], skipped=int(data['skipped']))
+					data.close()
+					return catalog
+			data.close()
+		except (IOError, OSError, ValueError, KeyError):
+			pass
+
+	catalog = parse()
+	meta = {'key': key, 'mtime': info.st_mtime, 'size': info.st_size,
+		'sha1': digest or File_hash(filename)}
+	try:
+		catalog.save(sidecar + '.tmp', meta=numpy.array(json.dumps(meta)))
+		if os.path.exists(sidecar):
+			os.remove(sidecar)
+		os.rename(sidecar + '.tmp', sidecar)
+	except (IOError, OSError):
+		# e.g. a read only catalog directory, just go without
+		pass
+	return catalog
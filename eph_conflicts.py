@@ -0,0 +1,176 @@
+import json
+import numpy
+import eph_functions as JD
+import eph_twilight
+
+"""
+Module to find the transit windows that overlap each other at a
+site, i.e. the nights a telescope is double booked, along with how
+much of each night is taken and the free gaps left
+
+The windows (padded by any baseline either side) are sorted by start
+and swept once, a new group starting whenever a window starts after
+the latest end so far. Groups of more than one window are the
+conflicts and the group spans are the busy parts of the nights, so
+everything is O(n log n) in the number of transits. Nights are
+numbered as JD.Night_array, with the dark part of each running
+between the astronomical twilights from eph_twilight
+"""
+
+##################################
+
+def Sweep(starts, ends):
+	# group number of each window, windows in the same group overlap
+	# (directly or through others), numbered in order of start. Windows
+	# just touching don't count as overlapping
+	order = numpy.argsort(starts, kind='mergesort')
+	latest = numpy.maximum.accumulate(ends[order])
+	new = numpy.ones(len(order), dtype=bool)
+	new[1:] = starts[order][1:] >= latest[:-1]
+	group = numpy.empty(len(order), dtype=int)
+	group[order] = numpy.cumsum(new) - 1
+	return group
+
+##################################
+
+def Overlapping(starts, ends):
+	# number of other windows each window overlaps
+	s, e = numpy.sort(starts), numpy.sort(ends)
+	return numpy.searchsorted(s, ends, 'left') - numpy.searchsorted(e, starts, 'right') - 1
+
+##################################
+
+def Depth(starts, ends, group, n):
+	# most windows open at once in each of the n groups, from the
+	# running count over the start (+1) and end (-1) events
+	times = numpy.concatenate([starts, ends])
+	steps = numpy.concatenate([numpy.ones(len(starts), dtype=int), -numpy.ones(len(ends), dtype=int)])
+	groups = numpy.concatenate([group, group])
+	# ends sort before starts at the same time, as touching windows
+	# don't overlap
+	order = numpy.lexsort((steps, times))
+	depth = numpy.zeros(n, dtype=int)
+	numpy.maximum.at(depth, groups[order], numpy.cumsum(steps[order]))
+	return depth
+
+##################################
+
+def Dark_times(site, nights, store=None):
+	# JDs of the end of evening and start of morning twilight for each
+	# night number, as the engine's twilight cache works them out
+	twilight = eph_twilight.TwilightCache(site['latitude'],site['longitude'],site['elev'],site['noontime'],store)
+	nights = numpy.asarray(nights, dtype=float)
+	if len(nights):
+		twilight.fill(nights[0], nights[-1])
+	dates,UTs = JD.Jul_date_array(nights)
+	dark = numpy.zeros((len(nights), 2))
+	for n,date in enumerate(zip(*dates)):
+		dark[n] = twilight.dark(date)
+	return dark
+
+##################################
+
+class Conflicts(object):
+	"""
+	Overlaps between the transit windows (plus baseline hours either
+	side) of an eph_records array from one site. Per record:
+
+		group        index of its overlap group
+		overlapping  number of other windows it overlaps
+
+	and per group start, end (JDs of the span), size and depth (the
+	most windows open at once)
+	"""
+	def __init__(self, records, baseline=0.):
+		self.records = records
+		self.baseline = baseline
+		self.starts = records['start'] - baseline / 24.
+		self.ends = records['end'] + baseline / 24.
+		self.group = Sweep(self.starts, self.ends)
+		self.overlapping = Overlapping(self.starts, self.ends)
+		n = self.group.max() + 1 if len(records) else 0
+		self.size = numpy.bincount(self.group, minlength=n)
+		self.start = numpy.full(n, numpy.inf)
+		self.end = numpy.full(n, -numpy.inf)
+		numpy.minimum.at(self.start, self.group, self.starts)
+		numpy.maximum.at(self.end, self.group, self.ends)
+		self.depth = Depth(self.starts, self.ends, self.group, n)
+		# records by group then start, group g is order[bounds[g]:bounds[g+1]]
+		self.order = numpy.lexsort((self.starts, self.group))
+		self.bounds = numpy.append(0, numpy.cumsum(self.size))
+
+	def conflicts(self):
+		# indices of the groups with more than one window
+		return numpy.where(self.size > 1)[0]
+
+	def members(self, g):
+		# records in group g, in time order
+		return self.order[self.bounds[g]:self.bounds[g+1]]
+
+	def nights(self, site, startJD=None, endJD=None, store=None):
+		# per night occupancy: a list of dicts with the night number, the
+		# dark time (JDs and hours), the hours of it taken by windows,
+		# the transits and the most at once, and the free gaps between
+		# the windows. Nights run from startJD to endJD, by default those
+		# with transits
+		order = numpy.argsort(self.start, kind='mergesort')
+		numbers = JD.Night_array(self.start[order], site['noontime'])
+		if startJD is None or endJD is None:
+			if not len(numbers):
+				return []
+			first, last = numbers[0], numbers[-1]
+		else:
+			first = JD.Night_array(startJD, site['noontime'])
+			last = JD.Night_array(endJD, site['noontime'])
+		all_nights = numpy.arange(first, last + 1)
+		dark = Dark_times(site, all_nights, store)
+		bounds = numpy.searchsorted(numbers, numpy.arange(first, last + 2))
+		out = []
+		for n,night in enumerate(all_nights):
+			groups = order[bounds[n]:bounds[n+1]]
+			dusk, dawn = dark[n]
+			gaps, busy, t = [], 0., dusk
+			for g in groups:
+				s, e = max(self.start[g], dusk), min(self.end[g], dawn)
+				if e <= s:
+					continue
+				if s > t:
+					gaps.append((t, s))
+				busy += e - s
+				t = max(t, e)
+			if dawn > t:
+				gaps.append((t, dawn))
+			out.append({'night': int(night), 'dark_start': dusk, 'dark_end': dawn,
+				'dark_hours': max(dawn - dusk, 0.) * 24., 'busy_hours': busy * 24.,
+				'transits': int(self.size[groups].sum()), 'most_at_once': int(self.depth[groups].max()) if len(groups) else 0,
+				'gaps': gaps})
+		return out
+
+	def notes(self):
+		# annotation for the listing line of each conflicting record,
+		# keyed by (object index, hjd), giving its group, the group's
+		# size and how many of the others it overlaps
+		clash = numpy.where(self.size[self.group] > 1)[0]
+		return dict(((self.records['object'][i], self.records['hjd'][i]),
+			"  ! conflict %d: %d windows, overlaps %d" % (self.group[i], self.size[self.group[i]], self.overlapping[i]))
+			for i in clash)
+
+##################################
+
+def Write_json(filename, sites, objects, site_conflicts, site_nights):
+	# the conflicting groups and per night occupancy of every site
+	out = []
+	for site,conflicts,nights in zip(sites, site_conflicts, site_nights):
+		groups = []
+		for g in conflicts.conflicts():
+			members = conflicts.members(g)
+			groups.append({'group': int(g), 'start': conflicts.start[g], 'end': conflicts.end[g],
+				'size': int(conflicts.size[g]), 'most_at_once': int(conflicts.depth[g]),
+				'transits': [{'object': objects[conflicts.records['object'][i]]['name'],
+					'hjd': float(conflicts.records['hjd'][i]),
+					'start': float(conflicts.starts[i]), 'end': float(conflicts.ends[i]),
+					'overlapping': int(conflicts.overlapping[i])} for i in members]})
+		out.append({'site': site['name'], 'baseline': conflicts.baseline,
+			'conflicts': groups, 'nights': nights})
+	with open(filename, 'w') as f:
+		json.dump(out, f, indent=1, default=float)
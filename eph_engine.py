@@ -0,0 +1,376 @@
+import math
+import heapq
+import multiprocessing
+import numpy
+import ephem
+import eph_functions as JD
+import eph_twilight
+import eph_almanac
+import eph_timesys
+import eph_prefilter
+import eph_moon
+import eph_records
+import eph_catalog
+import eph_profile
+
+"""
+Module to work out the visible transits of a list of objects from
+a list of observatories. ephemeris2.py is the command line front end,
+other code can use the Engine directly, e.g.
+
+	import eph_engine
+	objects = eph_engine.Read_objects('targets/Planets')
+	sites = eph_engine.Read_observatories('observatories2')
+	engine = eph_engine.Engine(objects, sites)
+	transits = engine.transits(2457724, 2457754)
+"""
+
+##################################
+
+def Parse_date(date):
+	# dates are either a JD (e.g. 2456708) or Gregorian (e.g. 2014-12-12),
+	# Gregorian dates are returned as the integer JD at noon on that day
+	try:
+		return int(date)
+	except ValueError:
+		return int(ephem.julian_date(date))+1
+
+##################################
+
+def Read_objects(filename, columns=None, cache=False):
+	# read in all the objects, keeping the coordinates as given for
+	# the file headers. See eph_catalog.Load for CSV catalogs (columns)
+	# and keeping the parsed catalog for next time (cache)
+	with eph_profile.stage('catalog'):
+		return eph_catalog.Load(filename, columns, cache).objects()
+
+##################################
+
+def Read_observatories(filename):
+	# read in all the observatories, raises ValueError with the
+	# offending line if one doesn't have the expected format
+	sites = []
+	with eph_profile.stage('catalog'), open(filename) as f:
+		for line in f:
+			if line[0] == '#':
+				continue
+			elif line[0] != '\n' and line[0] != ' ':
+				try:
+					name,lat0,lat1,lat2,lon0,lon1,lon2,lowlim,obsndate,obsntime,elev = line.split()
+				except ValueError:
+					raise ValueError(line)
+				sites.append({'name': name, 'latitude': JD.Deg((lat0,lat1,lat2)),
+					'longitude': JD.Deg((lon0,lon1,lon2)), 'lowlim': float(lowlim),
+					'noontime': obsntime, 'elev': float(elev)})
+	return sites
+
+# how the transit windows are sampled: baseline (hours) added either
+# side of the window, step (minutes) between the samples and the
+# smallest observable fraction of the window (plus baseline) to keep a
+# transit, by default any transit seen at some point of the window is
+# kept as before the sampling
+default_sampling = {'baseline': 0., 'step': 5., 'min_observable': 0.}
+
+# the Sun is counted as down below the twilight horizon
+dark_limit = float(eph_twilight.twi_horizon)
+
+##################################
+
+def Sample_offsets(duration, baseline=0., step=5.):
+	# hours from the mid-time of the samples across a window of the
+	# duration (hours): an odd number at most step minutes apart, so
+	# the first, middle and last are at the start, mid-time and end,
+	# then as many baseline hours either side. Returns the offsets and
+	# a mask of those inside the window
+	half = duration/2.
+	n = 2*int(numpy.ceil(half*60./step)) + 1
+	m = int(numpy.ceil(baseline*60./step))
+	pad = baseline * numpy.arange(1, m + 1) / max(m, 1)
+	offsets = numpy.concatenate([-half - pad[::-1], numpy.linspace(-half, half, n), half + pad])
+	inside = numpy.zeros(len(offsets), dtype=bool)
+	inside[m:m+n] = True
+	return offsets, inside
+
+##################################
+
+def Window_samples(site, obj, times, offsets):
+	# altitude, airmass and Sun altitude at the offsets (hours, see
+	# Sample_offsets) from the mid-times (UTC JDs). Returns (transits,
+	# samples) arrays, all transits at once
+	times = numpy.asarray(times)[:,numpy.newaxis] + numpy.asarray(offsets)/24.
+	LST = JD.Sid_time_array(times, site['longitude'])
+	alts = JD.Altitude(site['latitude'], obj['dec'], JD.HA_array(LST, obj['ra']))
+	sun_ra, sun_dec = JD.Sun_array(times)
+	sun_alts = JD.Altitude(site['latitude'], sun_dec, JD.HA_array(LST, sun_ra))
+	return alts, JD.Airmass(alts), sun_alts
+
+##################################
+
+def Sample_types(observable, inside):
+	# returns the eph_records transit type of each transit, NOT_VISIBLE
+	# if it can't be seen. observable is a (transits, samples) mask of
+	# the samples with the object above the altitude limit and the Sun
+	# below the twilight horizon, inside that of the samples in the
+	# window (as Sample_offsets). A part of the transit only counts as
+	# seen if every sample across it is, so a window that dips below the
+	# limit or into twilight between the start, middle and end isn't
+	# taken as full
+	window = observable[:,inside]
+	mid = window.shape[1] // 2
+	to_mid, from_mid = window[:,:mid+1].all(axis=1), window[:,mid:].all(axis=1)
+
+	# determine what type of transit it is ie Full/partial, a half seen
+	# throughout before just the ingress or egress of a window with a gap
+	types = numpy.select([to_mid & from_mid, to_mid, from_mid, window[:,0], window[:,-1]],
+		[eph_records.FULL, eph_records.INGRESS_MID, eph_records.EGRESS_MID,
+		eph_records.INGRESS, eph_records.EGRESS], eph_records.MID)
+
+	# only keep those seen at some point of the window
+	return numpy.where(window.any(axis=1), types, eph_records.NOT_VISIBLE)
+
+##################################
+
+def Object_transits(site, obj, index, startJD, endJD, moon, prefilter=None, sampling=default_sampling):
+	# returns the eph_records array of visible transits of obj,
+	# index is its position in the object list
+	with eph_profile.stage('epochs', site['name'], obj['name']):
+		HJDs = JD.Transit_times(obj['epoch'], obj['period'], startJD, endJD)
+	return Transit_records(site, obj, index, HJDs, moon, prefilter, sampling)
+
+##################################
+
+def Object_transit_blocks(site, obj, index, startJD, endJD, moon, prefilter=None, block=256, sampling=default_sampling):
+	# generator of eph_records arrays of the visible transits of obj in
+	# time order, working through block cycles at a time so the memory
+	# used doesn't grow with the length of the date range
+	first, last = JD.Transit_cycles(obj['epoch'], obj['period'], startJD, endJD)
+	for c in range(first, last + 1, block):
+		with eph_profile.stage('epochs', site['name'], obj['name']):
+			HJDs = JD.Transit_times(obj['epoch'], obj['period'], startJD, endJD, (c, min(c + block - 1, last)))
+		yield Transit_records(site, obj, index, HJDs, moon, prefilter, sampling)
+
+##################################
+
+def Transit_records(site, obj, index, HJDs, moon, prefilter=None, sampling=default_sampling):
+	# returns the eph_records array of the visible transits of obj
+	# out of those with mid-times HJDs (in the object's time standard),
+	# sampling as default_sampling. prefilter is the site's
+	# eph_prefilter.Prefilter, to rule out the transits that can't be
+	# seen before the rest of the work on them
+	lowlim = site['lowlim']
+	duration = obj['duration']
+	ra, delta = obj['ra'], obj['dec']
+	name = site['name'], obj['name']
+
+	# the mid-times in UTC, everything else follows from those
+	with eph_profile.stage('time_system', *name):
+		UTCs = eph_timesys.To_utc(HJDs, ra, delta, eph_timesys.Standard(obj))
+	examined = len(HJDs)
+	if prefilter is not None:
+		with eph_profile.stage('prefilter', *name):
+			inside = prefilter.inside(obj, UTCs)
+			HJDs, UTCs = HJDs[inside], UTCs[inside]
+		eph_profile.count('prefiltered', examined - len(HJDs), *name)
+		if not len(HJDs):
+			eph_profile.count('examined', examined, *name)
+			eph_profile.count('kept', 0, *name)
+			return eph_records.Empty()
+
+	# calculate the hour angles and sample the windows for all the
+	# transits in one go
+	with eph_profile.stage('sid_time', *name):
+		HAs = JD.HA_array(JD.Sid_time_array(UTCs, site['longitude']), ra)
+	with eph_profile.stage('sampling', *name):
+		offsets, inside = Sample_offsets(duration, sampling['baseline'], sampling['step'])
+		alts, airmass, sun_alts = Window_samples(site, obj, UTCs, offsets)
+		observable = (alts > lowlim) & (sun_alts < dark_limit)
+
+	# the type and how much can be seen follow from the samples
+	with eph_profile.stage('classification', *name):
+		types = Sample_types(observable, inside)
+		observable = observable.mean(axis=1)
+		keep = (types != eph_records.NOT_VISIBLE) & (observable >= sampling['min_observable'])
+	eph_profile.count('examined', examined, *name)
+	eph_profile.count('kept', int(keep.sum()), *name)
+	HJDs, UTCs = HJDs[keep], UTCs[keep]
+	alts, airmass = alts[keep], airmass[keep]
+	start, mid, end = numpy.where(inside)[0][[0, numpy.count_nonzero(inside)//2, -1]]
+	records = eph_records.Empty(len(HJDs))
+	records['object'] = index
+	records['hjd'] = HJDs
+	records['utc'] = UTCs
+	records['start'] = UTCs - duration/48.
+	records['end'] = UTCs + duration/48.
+	records['ha_start'] = HAs[keep] - duration/2.
+	records['ha_end'] = HAs[keep] + duration/2.
+	records['alt_start'] = alts[:,start]
+	records['alt_mid'] = alts[:,mid]
+	records['alt_end'] = alts[:,end]
+	records['type'] = types[keep]
+	with eph_profile.stage('moon', *name):
+		records['moon_sep'] = moon.separation(UTCs, ra, delta)
+		records['moon_illum'] = moon.illumination(UTCs)
+	records['observable'] = observable[keep]
+	records['min_alt'] = alts.min(axis=1)
+	records['max_airmass'] = airmass.max(axis=1)
+	return records
+
+##################################
+
+def Twilights(site, startJD, endJD, store, almanac=None):
+	# the twilight hours of the site's nights from startJD to endJD, read
+	# from its eph_almanac file in the almanac directory if that covers
+	# them, otherwise worked out into an eph_twilight.TwilightCache
+	# the transits' UTC can be a little either side of the range
+	startJD, endJD = startJD - eph_timesys.max_offset, endJD + eph_timesys.max_offset
+	if almanac is not None:
+		nights = eph_almanac.Open(almanac, site)
+		if nights is not None and nights.covers(startJD, endJD):
+			return nights
+	twilight = eph_twilight.TwilightCache(site['latitude'],site['longitude'],site['elev'],site['noontime'],store)
+	with eph_profile.stage('sun_times', site['name']):
+		twilight.fill(startJD, endJD)
+	return twilight
+
+##################################
+
+def Prefilter(site, startJD, endJD, twilight):
+	# the site's eph_prefilter.Prefilter over the same padded range as
+	# Twilights
+	with eph_profile.stage('prefilter', site['name']):
+		return eph_prefilter.Prefilter(site, startJD - eph_timesys.max_offset, endJD + eph_timesys.max_offset, twilight)
+
+##################################
+
+def Site_transits(site, objects, indices, startJD, endJD, moon, store=None, sampling=default_sampling, almanac=None):
+	# works out the transits of each object from one site, returns an
+	# eph_records array in object then time order and the store of
+	# sun times, which will include any new nights
+	if store is None:
+		store = {}
+	twilight = Twilights(site, startJD, endJD, store, almanac)
+	prefilter = Prefilter(site, startJD, endJD, twilight)
+	# objects that never get above the altitude limit have no transits
+	results = [Object_transits(site, obj, index, startJD, endJD, moon, prefilter, sampling)
+		for obj,index in zip(objects, indices) if prefilter.can_rise(obj)]
+	return numpy.concatenate([eph_records.Empty()] + results), store
+
+##################################
+
+def Site_transits_task(task):
+	# single argument version of Site_transits for Pool.map, the last
+	# item says whether to profile the task and send the profile back
+	if task[-1]:
+		eph_profile.Start()
+	records,store = Site_transits(*task[:-1])
+	return records, store, eph_profile.Stop() if task[-1] else None
+
+##################################
+
+class Engine(object):
+	"""
+	Works out the visible transits of a catalog of objects from a list
+	of observatories (as from Read_objects and Read_observatories)
+
+	The Moon table and the sun times are kept between calls, so a long
+	running process only pays for them once. store is a twilight store
+	(see eph_twilight.LoadStore), jobs the number of processes to use,
+	sampling any changes to default_sampling and almanac a directory of
+	eph_almanac files to read the twilights from where they cover the
+	dates
+	"""
+	def __init__(self, objects, sites, store=None, jobs=1, sampling=None, almanac=None):
+		self.objects = objects
+		self.sites = sites
+		self.store = {} if store is None else store
+		self.jobs = jobs
+		self.sampling = dict(default_sampling, **(sampling or {}))
+		self.almanac = almanac
+		self.moon = None
+		
+	def moon_table(self, startJD, endJD):
+		# reuse the Moon table if it already covers the range
+		if self.moon is None or not self.moon.covers(startJD, endJD):
+			if self.moon is not None:
+				startJD = min(startJD, self.moon.jd[0])
+				endJD = max(endJD, self.moon.jd[-1])
+			with eph_profile.stage('moon'):
+				self.moon = eph_moon.MoonTable(startJD, endJD)
+		return self.moon
+		
+	def transits(self, startJD, endJD, sites=None, objects=None):
+		# returns a list (one per site) of eph_records arrays of the
+		# visible transits in startJD < t < endJD, in object then time
+		# order. The records' object field indexes self.objects. sites
+		# and objects optionally limit the run to those names
+		if sites is not None:
+			sites = [site for site in self.sites if site['name'] in sites]
+		else:
+			sites = self.sites
+		indices = [i for i,obj in enumerate(self.objects) if objects is None or obj['name'] in objects]
+		objects = [self.objects[i] for i in indices]
+		moon = self.moon_table(startJD, endJD)
+		
+		# split the objects into chunks for each observatory, one chunk
+		# per observatory unless running in parallel. In parallel the sun
+		# times are worked out first so the workers don't repeat them
+		if self.jobs > 1:
+			chunk = int(math.ceil(len(objects) / float(4 * self.jobs)))
+			for site in sites:
+				Twilights(site, startJD, endJD, self.store, self.almanac)
+		else:
+			chunk = len(objects)
+		# workers keep their own profile which is merged in afterwards
+		profile = self.jobs > 1 and eph_profile.active is not None
+		tasks = []
+		for site in sites:
+			for c in range(0, len(objects), max(chunk, 1)):
+				tasks.append((site, objects[c:c+chunk], indices[c:c+chunk], startJD, endJD, moon, self.store, self.sampling,
+					self.almanac, profile))
+		
+		# the results come back in the same order as the tasks so
+		# the outputs match a serial run
+		if self.jobs > 1:
+			pool = multiprocessing.Pool(self.jobs)
+			results = pool.map(Site_transits_task, tasks, chunksize=1)
+			pool.close()
+			pool.join()
+		else:
+			results = [Site_transits_task(task) for task in tasks]
+		
+		# gather the transits back up per observatory and keep any new
+		# sun times the workers found
+		site_transits = [[eph_records.Empty()] for site in sites]
+		t = 0
+		for s,site in enumerate(sites):
+			while t < len(tasks) and tasks[t][0] is site:
+				records,store,task_profile = results[t]
+				site_transits[s].append(records)
+				if task_profile is not None:
+					eph_profile.active.merge(task_profile)
+				for key,nights in store.items():
+					self.store.setdefault(key, {}).update(nights)
+				t += 1
+		return [numpy.concatenate(records) for records in site_transits]
+		
+	def object_blocks(self, startJD, endJD, site, objects=None, block=256):
+		# one generator per object (optionally only those named) of
+		# time ordered eph_records blocks for the named site, see
+		# Object_transit_blocks. Nothing is worked out until they're run
+		site = [s for s in self.sites if s['name'] == site][0]
+		moon = self.moon_table(startJD, endJD)
+		twilight = Twilights(site, startJD, endJD, self.store, self.almanac)
+		prefilter = Prefilter(site, startJD, endJD, twilight)
+		return [Object_transit_blocks(site, obj, i, startJD, endJD, moon, prefilter, block, self.sampling)
+			if prefilter.can_rise(obj) else iter([])
+			for i,obj in enumerate(self.objects) if objects is None or obj['name'] in objects]
+		
+	def stream(self, startJD, endJD, site, objects=None):
+		# time ordered (utc, object index, record) for every transit seen
+		# from the named site, merged from the per object generators so
+		# only one block per object is held at once
+		def records(blocks):
+			for block in blocks:
+				for rec in block:
+					yield rec['utc'], rec['object'], rec
+		return heapq.merge(*[records(blocks) for blocks in self.object_blocks(startJD, endJD, site, objects)])
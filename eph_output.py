@@ -0,0 +1,237 @@
+import json
+import heapq
+import numpy
+import eph_records
+import eph_timesys
+import eph_profile
+
+"""
+Module to write the eph_engine results out. The .eph2 text files
+are one format, the same records can also go out as JSON, CSV or a
+numpy .npz file
+"""
+
+# column headings for the text files
+site_heading = "#\n#    HJD          Object      Date     Time/UT      Window " \
+	"        HA limits             Alt            Transit type?        MoonAng      % Illuminated\n#"
+object_heading = "#\n#    HJD          Date     Time/UT      Window " \
+	"       HA limits             Alt            Transit type?        MoonAng      % Illuminated\n#"
+
+# start of a consolidated file and the format of its index lines
+consolidated_header = "# Consolidated per object transits\n" \
+	"# Index :       offset       length site object\n"
+consolidated_index = "#@ %12d %12d %s %s\n"
+
+# fields written to the JSON and CSV files, after site and object
+fields = ['hjd', 'utc', 'start', 'end', 'ha_start', 'ha_end', 'alt_start',
+	'alt_mid', 'alt_end', 'type', 'moon_sep', 'moon_illum', 'observable',
+	'min_alt', 'max_airmass']
+
+##################################
+
+def Time_order(records):
+	# indices sorting records by UTC mid-time, ties in object order. The
+	# catalog times can be in a different order across objects
+	return numpy.lexsort((records['object'], records['utc']))
+
+##################################
+
+def Site_header(site, objects, obsrange):
+	out = ["# Visible transits from " + site['name'],
+		"#   Objects :    RA         Dec"]
+	for obj in objects:
+		out.append("# %10s [%s] [%s]" % (obj['name'],' '.join(obj['RA']),' '.join(obj['Dec'])))
+	out.append("# Date range : " + obsrange)
+	out.append(site_heading)
+	return '\n'.join(out) + '\n'
+
+##################################
+
+def Write_site_text(filename, site, objects, records, obsrange):
+	# time ordered listing of all the transits seen from a site
+	with eph_profile.stage('formatting', site['name']):
+		lines = eph_records.Format_lines(records, objects, site['lowlim'])
+		out = [Site_header(site, objects, obsrange)]
+		for i in Time_order(records):
+			out.append("%.5f  %s\n" % (records['hjd'][i], lines[i]))
+	with eph_profile.stage('io', site['name']), open(filename, 'w') as f:
+		f.write(''.join(out))
+
+##################################
+
+def Write_text_stream(filename, site, objects, object_blocks, obsrange, object_files=None, collect=None, notes=None):
+	# as Write_site_text but written as the transits come in, from one
+	# generator of time ordered eph_records blocks per object (as from
+	# Engine.object_blocks). The per object generators are merged on a
+	# heap by UTC so only one block per object is held at a time.
+	# object_files optionally gives a per object listing filename for
+	# each object and collect a list per object to keep the blocks in.
+	# notes is a dict of text to add to the end of site listing lines,
+	# keyed by (object index, hjd)
+	if object_files:
+		for i,obj in enumerate(objects):
+			text = Object_text(site, objects, i, eph_records.Empty(), obsrange)
+			with eph_profile.stage('io', site['name'], obj['name']), open(object_files[i], 'w') as f:
+				f.write(text)
+	
+	def lines(index, blocks):
+		name = site['name'], objects[index]['name']
+		for records in blocks:
+			if collect is not None:
+				collect[index].append(records)
+			with eph_profile.stage('formatting', *name):
+				text = eph_records.Format_lines(records, objects, site['lowlim'])
+			if object_files and len(records):
+				with eph_profile.stage('formatting', *name):
+					out = ''.join("%.5f  %s\n" % (hjd, line[12:]) for hjd,line in zip(records['hjd'], text))
+				with eph_profile.stage('io', *name), open(object_files[index], 'a') as f:
+					f.write(out)
+			for utc,hjd,line in zip(records['utc'], records['hjd'], text):
+				yield utc, index, hjd, line
+	
+	# the site listing goes out a few thousand lines at a time
+	with open(filename, 'w') as f:
+		out = [Site_header(site, objects, obsrange)]
+		for utc,index,hjd,line in heapq.merge(*[lines(i, blocks) for i,blocks in enumerate(object_blocks)]):
+			if notes:
+				line += notes.get((index, hjd), '')
+			out.append("%.5f  %s\n" % (hjd, line))
+			if len(out) >= 4096:
+				with eph_profile.stage('io', site['name']):
+					f.write(''.join(out))
+				out = []
+		with eph_profile.stage('io', site['name']):
+			f.write(''.join(out))
+
+##################################
+
+def Object_text(site, objects, index, records, obsrange):
+	# listing of the transits of objects[index] from a site, records
+	# must only hold that object's transits
+	obj = objects[index]
+	with eph_profile.stage('formatting', site['name'], obj['name']):
+		lines = eph_records.Format_lines(records, objects, site['lowlim'])
+	out = ["# Object : " + obj['name'],
+		"# Observatory : " + site['name'],
+		"# Date range : " + obsrange,
+		"# Coords : RA " + ' '.join(obj['RA']) + ' dec ' + ' '.join(obj['Dec']),
+		"# Epoch(0) : " + eph_timesys.Standard(obj) + " " + str(obj['epoch']),
+		"# Period : " + str(obj['period']) + " days",
+		"# Duration : " + str(obj['duration']) + " hrs",
+		object_heading]
+	for i in range(len(records)):
+		out.append("%.5f  %s" % (records['hjd'][i], lines[i][12:]))
+	return '\n'.join(out) + '\n'
+
+##################################
+
+def Write_object_text(filename, site, objects, index, records, obsrange):
+	text = Object_text(site, objects, index, records, obsrange)
+	with eph_profile.stage('io', site['name'], objects[index]['name']), open(filename, 'w') as f:
+		f.write(text)
+
+##################################
+
+def Object_bounds(records, n):
+	# records are in object order, the slice of each of the n objects
+	# is bounds[i]:bounds[i+1]
+	return numpy.searchsorted(records['object'], numpy.arange(n+1))
+
+##################################
+
+def Write_consolidated(filename, sites, objects, site_records, obsrange):
+	# all the per object listings in one file, written in one go.
+	# The file starts with an index giving the byte offset and length
+	# of each (site, object) section, each section is exactly what
+	# Write_object_text would write
+	sections, index = [], []
+	for site,records in zip(sites, site_records):
+		bounds = Object_bounds(records, len(objects))
+		for i,obj in enumerate(objects):
+			text = Object_text(site, objects, i, records[bounds[i]:bounds[i+1]], obsrange).encode('utf-8')
+			sections.append(text)
+			index.append((site['name'], obj['name'], len(text)))
+	
+	# the index lines are fixed width so the header size is known
+	# before the offsets are filled in
+	header = consolidated_header
+	size = len(header) + sum(len(consolidated_index % (0, 0, s, o)) for s,o,n in index) + 2
+	lines = []
+	offset = size
+	for s,o,n in index:
+		lines.append(consolidated_index % (offset, n, s, o))
+		offset += n
+	header = (header + ''.join(lines) + '#\n').encode('utf-8')
+	with eph_profile.stage('io'), open(filename, 'wb') as f:
+		f.write(header + b''.join(sections))
+
+##################################
+
+def Read_consolidated_index(filename):
+	# list of (site, object, offset, length) from a consolidated file
+	index = []
+	with open(filename, 'rb') as f:
+		for line in f:
+			line = line.decode('utf-8')
+			if line.startswith('#@ '):
+				offset, length, site, obj = line.split()[1:5]
+				index.append((site, obj, int(offset), int(length)))
+			elif not line.startswith('#'):
+				break
+			elif line == '#\n' and index:
+				break
+	return index
+
+##################################
+
+def Read_consolidated(filename, site, obj, index=None):
+	# the per object listing for (site, obj), as Write_object_text
+	if index is None:
+		index = Read_consolidated_index(filename)
+	for s,o,offset,length in index:
+		if s == site and o == obj:
+			with open(filename, 'rb') as f:
+				f.seek(offset)
+				return f.read(length).decode('utf-8')
+	raise KeyError("%s %s" % (site, obj))
+
+##################################
+
+def Rows(sites, objects, site_records):
+	# (site name, object name, record) for every transit, time ordered per site
+	for site,records in zip(sites, site_records):
+		for i in Time_order(records):
+			yield site['name'], objects[records['object'][i]]['name'], records[i]
+
+##################################
+
+def Write_json(filename, sites, objects, site_records):
+	transits = []
+	for site,name,rec in Rows(sites, objects, site_records):
+		transit = {'site': site, 'object': name}
+		for field in fields:
+			transit[field] = float(rec[field])
+		transit['type'] = eph_records.type_names[rec['type']]
+		transits.append(transit)
+	with open(filename, 'w') as f:
+		json.dump(transits, f, indent=1)
+
+##################################
+
+def Write_csv(filename, sites, objects, site_records):
+	with open(filename, 'w') as f:
+		f.write(','.join(['site', 'object'] + fields) + '\n')
+		for site,name,rec in Rows(sites, objects, site_records):
+			values = ["%.6f" % rec[field] for field in fields]
+			values[fields.index('type')] = eph_records.type_names[rec['type']]
+			f.write(','.join([site, name] + values) + '\n')
+
+##################################
+
+def Write_npz(filename, sites, objects, site_records):
+	# all the records in one array with an extra site field indexing
+	# the site names, plus the site and object names
+	numpy.savez(filename, transits=eph_records.Combine(site_records),
+		sites=numpy.array([site['name'] for site in sites]),
+		objects=numpy.array([obj['name'] for obj in objects]),
+		types=numpy.array([eph_records.type_names.get(t, '') for t in range(max(eph_records.type_names) + 1)]))
@@ -0,0 +1,102 @@
+import numpy
+import eph_functions as JD
+
+"""
+Module to rule out transits before the engine does any per transit
+work on them
+
+A transit is only kept by eph_engine.Sample_types if at some sample
+across its window the object is above the site's altitude limit and
+the Sun below the twilight horizon. So the objects whose declination
+never takes them over the limit at the site's latitude are dropped
+altogether (can_rise), and of the rest only the transits inside the
+object's seasonal visibility at the site are kept (inside): windows
+overlapping the dark time of the nights either side and within the
+hour angles the object is up (less than its half arc above the limit
+from the meridian). The dark time of each UT day is looked up once
+per site and the sidereal time runs on from that at the start of the
+range, so the test for any number of transits is a table lookup and a
+little arithmetic, much cheaper than the samples it saves. Everything
+is padded by a margin so only transits Sample_types would drop are
+ruled out, the results are the same as without the prefilter (see
+tests/test_eph_prefilter.py)
+"""
+
+# GMST hours per day, as JD.Sid_time_array
+sidereal_rate = 24.06570982441908
+
+# padding (hours) of the dark times and hour angles, and (degrees) of
+# the altitude limit for ruling objects out altogether
+margin = 2. / 60.
+altitude_margin = 1e-6
+
+##################################
+
+def Max_altitude(latitude, dec):
+	# altitude (degrees) at upper culmination
+	return 90. - numpy.abs(latitude - numpy.asarray(dec, dtype=float))
+
+##################################
+
+def Half_arc(latitude, dec, lowlim):
+	# hour angle (hours, 0 to 12) either side of the meridian that an
+	# object stays above lowlim, 12 for one always above it
+	lat, dec, h = numpy.radians(latitude), numpy.radians(dec), numpy.radians(lowlim)
+	cos_H = (numpy.sin(h) - numpy.sin(lat)*numpy.sin(dec)) / max(numpy.cos(lat)*numpy.cos(dec), 1e-12)
+	return numpy.degrees(numpy.arccos(numpy.clip(cos_H, -1., 1.))) / 15.
+
+##################################
+
+class Prefilter(object):
+	"""
+	Visibility prefilter for one site over the UT days from startJD to
+	endJD. twilight gives the UT hours of the dark time for the night
+	following noontime on each UT date, as a filled
+	eph_twilight.TwilightCache or an eph_almanac.Almanac
+	"""
+	def __init__(self, site, startJD, endJD, twilight):
+		self.site = site
+		days = numpy.arange(numpy.floor(startJD + 0.5), numpy.floor(endJD + 0.5) + 1)
+		self.first = int(days[0])
+		dates,UTs = JD.Jul_date_array(days)
+		self.twi = twilight.hours_array(days, dates).reshape(-1, 2)
+		# LST at the start, the equation of the equinoxes it leaves out
+		# later on is a couple of seconds at most
+		self.lst0 = JD.Sid_time_array(self.first - 0.5, site['longitude'])
+
+	def can_rise(self, obj):
+		# whether obj ever gets above the site's altitude limit
+		return Max_altitude(self.site['latitude'], obj['dec']) > self.site['lowlim'] - altitude_margin
+
+	def dark(self, day, lo, hi):
+		# whether the UT hours lo to hi of each day (JD at noon) overlap
+		# the dark time of the night starting that UT date or the one
+		# before, either of which can hold part of it depending on the
+		# site's noontime. Days not covered count as dark
+		day = numpy.asarray(day).astype(numpy.int64) - self.first
+		found = numpy.zeros(len(day), dtype=bool)
+		for row in (day - 1, day):
+			covered = (row >= 0) & (row < len(self.twi))
+			row = numpy.clip(row, 0, len(self.twi) - 1)
+			twi1, twi2 = self.twi[row,0], self.twi[row,1]
+			found |= ~covered | numpy.where(twi2 < twi1, (hi > twi1 - margin) | (lo < twi2 + margin),
+				(hi > twi1 - margin) & (lo < twi2 + margin))
+		return found
+
+	def inside(self, obj, times):
+		# mask of the mid-times (UTC JDs) of obj in its seasonal
+		# visibility
+		half = obj['duration'] / 48.
+		starts, ends = times - half, times + half
+
+		# some of the window in the dark, taking the UT days of the start
+		# and end separately (the window is less than a day long)
+		first, last = numpy.floor(starts + 0.5), numpy.floor(ends + 0.5)
+		dark = self.dark(first, (starts + 0.5 - first) * 24., numpy.where(last > first, 24., (ends + 0.5 - first) * 24.))
+		dark |= (last > first) & self.dark(last, 0., (ends + 0.5 - last) * 24.)
+
+		# and close enough to the meridian for some of it to be above the
+		# limit, the samples' hour angles run at the sidereal rate
+		HA = JD.HA_array(self.lst0 + (times + 0.5 - self.first) * sidereal_rate, obj['ra'])
+		reach = Half_arc(self.site['latitude'], obj['dec'], self.site['lowlim']) + half * sidereal_rate + margin
+		return dark & (numpy.abs(HA) < reach)
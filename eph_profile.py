@@ -0,0 +1,171 @@
+import time
+import json
+
+"""
+Module to record where the time goes in a run. Code marks out its
+stages with
+
+	with eph_profile.stage('moon', site, obj):
+		...
+
+and counts things with eph_profile.count(name, n, site, obj). Both
+do nothing unless a profile has been started, e.g.
+
+	import eph_profile
+	eph_profile.Start()
+	engine.transits(2457724, 2457754)
+	profile = eph_profile.Stop()
+	print(profile.as_dict()['stages'])
+
+Times and counts are kept per (site, object) and summed up per site
+and over the run when output. Stages recorded without a site (e.g.
+reading the catalog) only appear in the run totals
+
+Stages used:
+	catalog         reading the objects and observatories files
+	epochs          working out the transit times in the date range
+	time_system     converting the mid-times to UTC (eph_timesys)
+	prefilter       setting up each site's visibility prefilter and
+	                ruling out transits with it (eph_prefilter)
+	sid_time        sidereal time and hour angle
+	sun_times       working out the twilights of the nights not seen
+	                before (eph_sun)
+	moon            the Moon table and the separation/illumination
+	sampling        altitude, airmass and Sun altitude across each window
+	classification  deciding the transit type and observable fraction
+	                from the samples
+	formatting      turning the records into text lines
+	io              writing the files, for the JSON, CSV, npz, SQLite
+	                and incremental outputs including the conversion
+	calendar        the iCal export
+	schedule        the network schedule (eph_schedule)
+	conflicts       finding the overlapping windows and night occupancy
+	almanac         making or extending the night almanacs (eph_almanac)
+Counts used:
+	examined        transits in the date range, of the objects that
+	                can get above the site's altitude limit
+	prefiltered     transits ruled out by the prefilter
+	kept            transits visible
+	sun_nights      nights the sun times were calculated for
+"""
+
+# the running profile, None when not profiling
+active = None
+
+# best clock available, perf_counter isn't in python 2
+timer = getattr(time, 'perf_counter', time.time)
+
+##################################
+
+class Profile(object):
+	"""
+	Cumulative seconds and calls per (site, object, stage) and
+	counts per (site, object, name), site and object are None for
+	the parts of a run that don't belong to one
+	"""
+	def __init__(self):
+		self.start = time.time()
+		self.stages = {}
+		self.counts = {}
+
+	def add(self, name, seconds, site=None, obj=None, calls=1):
+		t = self.stages.setdefault((site, obj, name), [0., 0])
+		t[0] += seconds
+		t[1] += calls
+
+	def count(self, name, n=1, site=None, obj=None):
+		key = (site, obj, name)
+		self.counts[key] = self.counts.get(key, 0) + n
+
+	def merge(self, other):
+		# add in another profile, e.g. from a worker process
+		for (site, obj, name),(seconds, calls) in other.stages.items():
+			self.add(name, seconds, site, obj, calls)
+		for (site, obj, name),n in other.counts.items():
+			self.count(name, n, site, obj)
+
+	def as_dict(self):
+		# nested totals for the run, each site and each object at each site
+		run = {'elapsed': time.time() - self.start, 'stages': {}, 'counts': {}, 'sites': {}}
+		def entries(site, obj):
+			out = [run]
+			if site is not None:
+				s = run['sites'].setdefault(site, {'stages': {}, 'counts': {}, 'objects': {}})
+				out.append(s)
+				if obj is not None:
+					out.append(s['objects'].setdefault(obj, {'stages': {}, 'counts': {}}))
+			return out
+		for (site, obj, name),(seconds, calls) in self.stages.items():
+			for entry in entries(site, obj):
+				t = entry['stages'].setdefault(name, {'seconds': 0., 'calls': 0})
+				t['seconds'] += seconds
+				t['calls'] += calls
+		for (site, obj, name),n in self.counts.items():
+			for entry in entries(site, obj):
+				entry['counts'][name] = entry['counts'].get(name, 0) + n
+		return run
+
+	def write(self, filename):
+		with open(filename, 'w') as f:
+			json.dump(self.as_dict(), f, indent=1, sort_keys=True)
+
+##################################
+
+class Stage(object):
+	"""
+	Context manager timing one stage into the active profile
+	"""
+	def __init__(self, name, site=None, obj=None):
+		self.name, self.site, self.obj = name, site, obj
+
+	def __enter__(self):
+		self.t0 = timer()
+		return self
+
+	def __exit__(self, *exc):
+		if active is not None:
+			active.add(self.name, timer() - self.t0, self.site, self.obj)
+		return False
+
+##################################
+
+class NoStage(object):
+	"""
+	Stand in for Stage when not profiling
+	"""
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+no_stage = NoStage()
+
+##################################
+
+def stage(name, site=None, obj=None):
+	if active is None:
+		return no_stage
+	return Stage(name, site, obj)
+
+##################################
+
+def count(name, n=1, site=None, obj=None):
+	if active is not None:
+		active.count(name, n, site, obj)
+
+##################################
+
+def Start():
+	# start a new profile, replacing any running one
+	global active
+	active = Profile()
+	return active
+
+##################################
+
+def Stop():
+	# stop profiling and return the profile
+	global active
+	profile, active = active, None
+	return profile
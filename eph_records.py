@@ -0,0 +1,117 @@
+import numpy
+import eph_functions as JD
+
+"""
+Module defining the transit records produced by eph_engine and
+how they are turned back into the fixed width text lines of the
+.eph2 files
+
+Each transit is one row of a numpy structured array with the
+following fields:
+
+	object       index of the object in the engine's object list
+	hjd          mid-time, in the object's catalog time standard
+	utc          mid-time as a UTC JD (see eph_timesys), which all
+	             the rest are worked out for
+	start, end   start and end of the transit window (UTC JD)
+	ha_start     hour angle at the start and end of the window,
+	ha_end       hours, -ve for east
+	alt_start    altitude at the start, middle and end, degrees
+	alt_mid
+	alt_end
+	type         one of the transit types below
+	moon_sep     separation from the Moon, degrees
+	moon_illum   percentage of the Moon illuminated
+	observable   fraction of the window (plus any baseline either
+	             side) with the object above the altitude limit and
+	             the Sun below the twilight horizon
+	min_alt      lowest altitude over the window and baseline
+	max_airmass  highest airmass over the window and baseline
+"""
+
+transit_dtype = numpy.dtype([('object', 'i4'), ('hjd', 'f8'), ('utc', 'f8'),
+	('start', 'f8'), ('end', 'f8'), ('ha_start', 'f8'), ('ha_end', 'f8'),
+	('alt_start', 'f8'), ('alt_mid', 'f8'), ('alt_end', 'f8'),
+	('type', 'i1'), ('moon_sep', 'f8'), ('moon_illum', 'f8'),
+	('observable', 'f8'), ('min_alt', 'f8'), ('max_airmass', 'f8')])
+
+# transit types, NOT_VISIBLE transits are never kept
+NOT_VISIBLE = 0
+FULL = 1
+INGRESS_MID = 2
+INGRESS = 3
+EGRESS_MID = 4
+EGRESS = 5
+MID = 6
+
+# names as used in the text outputs
+type_names = {FULL: "Full Transit", INGRESS_MID: "Ingress + mid",
+	INGRESS: "Ingress only", EGRESS_MID: "Egress + mid",
+	EGRESS: "Egress only", MID: "Mid only?"}
+
+# short names for choosing types on the command line
+type_keys = {'full': FULL, 'ingress_mid': INGRESS_MID, 'ingress': INGRESS,
+	'egress_mid': EGRESS_MID, 'egress': EGRESS, 'mid': MID}
+
+# text column for each type, padded to line up in the listings
+type_formats = {FULL: "  Full Transit > %i   ",
+	INGRESS_MID: "  Ingress + mid > %i  ",
+	INGRESS: "  Ingress only > %i   ",
+	EGRESS_MID: "  Egress + mid > %i   ",
+	EGRESS: "  Egress only > %i    ",
+	MID: "  Mid only? > %i      "}
+
+##################################
+
+def Empty(n=0):
+	return numpy.zeros(n, dtype=transit_dtype)
+
+##################################
+
+def Combine(site_records):
+	# one array from a list of per site arrays, with an extra
+	# site field giving the position in the list
+	dtype = numpy.dtype([('site', 'i4')] + transit_dtype.descr)
+	combined = numpy.zeros(sum(len(records) for records in site_records), dtype=dtype)
+	n = 0
+	for s,records in enumerate(site_records):
+		combined['site'][n:n+len(records)] = s
+		for field in transit_dtype.names:
+			combined[field][n:n+len(records)] = records[field]
+		n += len(records)
+	return combined
+
+##################################
+
+def HA_limits(HAs, HAe):
+	# hour angle limits as text, e.g. [02:15E-00:40W]
+	if HAs < 0.:
+		HAs = "%.2i:%.2iE" % (int(-HAs),int(float((-HAs)%1)*60.))
+	else:
+		HAs = "%.2i:%.2iW" % (int(HAs),int(float((HAs)%1)*60.))
+	if HAe < 0.:
+		HAe = "%.2i:%.2iE" % (int(-HAe),int(float((-HAe)%1)*60.))
+	else:
+		HAe = "%.2i:%.2iW" % (int(HAe),int(float((HAe)%1)*60.))
+	return "[%s-%s]" % (HAs,HAe)
+
+##################################
+
+def Format_lines(records, objects, lowlim):
+	# the text line for each record as in the observatory listing,
+	# without the leading HJD. objects is the engine's object list
+	dates,UTs = JD.Jul_date_array(records['utc'])
+	lines = []
+	for i,rec in enumerate(records):
+		obj = objects[rec['object']]
+		UT = (UTs[0][i],UTs[1][i],UTs[2][i])
+		window = JD.window(UT, obj['duration'])
+		Date = "%.2i/%.2i/%.4i " % (dates[0][i],dates[1][i],dates[2][i])
+		HA_alt = "%s  [%+5.1f %+5.1f %+5.1f]" % (HA_limits(rec['ha_start'],rec['ha_end']),
+			rec['alt_start'],rec['alt_mid'],rec['alt_end'])
+		line = "%10s  %10s %24s %s" % (obj['name'],Date,window,HA_alt)
+		line += type_formats[rec['type']] % lowlim
+		line += "   %03d   " % (int(rec['moon_sep']))
+		line += "       %03d   " % (int(rec['moon_illum']))
+		lines.append(line)
+	return lines
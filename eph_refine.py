@@ -0,0 +1,240 @@
+import re
+import numpy
+import eph_catalog
+
+"""
+Module to refine the ephemerides of a whole catalog from observed
+transit mid-times, e.g.
+
+	import eph_catalog, eph_refine
+	catalog = eph_catalog.Load('targets/Planets')
+	names, times, errors = eph_refine.Read_timings('timings.txt')
+	results = eph_refine.Refine(catalog, names, times, errors)
+	eph_refine.Write_catalog('targets/Planets_new', 'targets/Planets', results)
+
+Each object's epoch and period (and optionally a quadratic term for
+a changing period) are fitted by weighted least squares to its
+mid-times, all the objects at once: the sums of the normal equations
+are accumulated per object with bincount and the small systems
+solved together. Cycle numbers come from the catalog ephemeris, and
+are worked out again as the fit takes in observations further and
+further (doubling each time) from the catalog epoch, so a slightly
+wrong catalog period doesn't put the far off mid-times on the wrong
+cycle. Outliers are sigma clipped at the end. The catalog epoch
+itself can go in as an observation, so one new mid-time is enough
+to refine the period
+
+The fitted epoch is moved to the cycle nearest the weighted middle
+of the observations, where it is least correlated with the period
+"""
+
+# fields of the Refine results, one row per catalog object
+result_dtype = numpy.dtype([('name', 'U64'), ('refined', '?'), ('epoch', 'f8'),
+	('period', 'f8'), ('quadratic', 'f8'), ('covariance', 'f8', (3, 3)),
+	('n_obs', 'i4'), ('n_cycles', 'i4'), ('clipped', 'i4'), ('chi2', 'f8'),
+	('dof', 'i4')])
+
+##################################
+
+def Read_timings(filename):
+	# observed mid-times, one per line as
+	#	name  mid-time  error  [# comment]
+	# in days and on the same time scale as the catalog epochs
+	names, times, errors = [], [], []
+	with open(filename) as f:
+		for line in f:
+			fields = line.split('#')[0].split()
+			if not fields:
+				continue
+			names.append(fields[0])
+			times.append(float(fields[1]))
+			errors.append(float(fields[2]))
+	return names, numpy.array(times), numpy.array(errors)
+
+##################################
+
+def Distinct(k, n, nk):
+	# number of different cycles observed for each of nk objects
+	order = numpy.lexsort((n, k))
+	k, n = k[order], n[order]
+	new = numpy.ones(len(k), dtype=bool)
+	new[1:] = (k[1:] != k[:-1]) | (n[1:] != n[:-1])
+	return numpy.bincount(k[new], minlength=nk)
+
+##################################
+
+def Fit(k, x, y, w, nk, terms):
+	# weighted least squares of y = a + b*x (+ c*x^2) for each of nk
+	# objects, k giving the object of each point. terms (per object) is
+	# how many of a, b and c to fit, the others are held at 0. Returns
+	# the parameters (nk,3), the inverse of the normal matrix (nk,3,3),
+	# chi^2 and the degrees of freedom
+	powers = [numpy.ones_like(x), x, x*x]
+	A = numpy.zeros((nk, 3, 3))
+	rhs = numpy.zeros((nk, 3))
+	for i in range(3):
+		rhs[:,i] = numpy.bincount(k, weights=w*y*powers[i], minlength=nk)
+		for j in range(i, 3):
+			A[:,i,j] = A[:,j,i] = numpy.bincount(k, weights=w*powers[i]*powers[j], minlength=nk)
+	# the terms not fitted are fixed at 0
+	for i in range(3):
+		fixed = terms <= i
+		A[fixed,i,:] = 0.
+		A[fixed,:,i] = 0.
+		A[fixed,i,i] = 1.
+		rhs[fixed,i] = 0.
+	inverse = numpy.linalg.inv(A)
+	params = numpy.einsum('kij,kj->ki', inverse, rhs)
+	model = params[k,0] + params[k,1]*x + params[k,2]*x*x
+	chi2 = numpy.bincount(k, weights=w*(y - model)**2, minlength=nk)
+	dof = numpy.bincount(k, minlength=nk) - terms
+	return params, inverse, chi2, dof
+
+##################################
+
+def Refine(catalog, names, times, errors, epoch_error=0.001, quadratic=False, clip=5., iterations=3):
+	# refined ephemerides of the eph_catalog.Catalog objects from the
+	# observed mid-times (see Read_timings), as a result_dtype array in
+	# catalog order. epoch_error is the error (days) given to the
+	# catalog epoch when it goes in as an observation, None to leave it
+	# out. Objects without enough cycles keep their catalog period (and
+	# epoch), the covariance is scaled up by the reduced chi^2 if that's
+	# over one
+	nk = len(catalog)
+	index = dict((name, i) for i,name in reversed(list(enumerate(catalog.name))))
+	known = numpy.array([name in index for name in names], dtype=bool)
+	k = numpy.array([index[name] for name in numpy.asarray(names)[known]], dtype=int)
+	t = numpy.asarray(times, dtype=float)[known]
+	err = numpy.asarray(errors, dtype=float)[known]
+	real = numpy.ones(len(k), dtype=bool)
+	if epoch_error is not None and epoch_error > 0.:
+		k = numpy.append(k, numpy.arange(nk))
+		t = numpy.append(t, catalog.epoch)
+		err = numpy.append(err, numpy.full(nk, epoch_error))
+		real = numpy.append(real, numpy.zeros(nk, dtype=bool))
+	w = 1. / err**2
+
+	# fit relative to the catalog ephemeris, in cycles from the catalog
+	# epoch, so the numbers stay small
+	epoch, period = catalog.epoch, catalog.period
+	params = numpy.zeros((nk, 3))
+	def cycles():
+		# nearest cycle of each observation with the current fit, the
+		# quadratic term is left out as it's only ever a small correction
+		return numpy.round((t - epoch[k] - params[k,0]) / (period[k] + params[k,1]))
+	def fit(use, most):
+		n = cycles()
+		distinct = Distinct(k[use], n[use].astype(int), nk)
+		terms = numpy.minimum(distinct, most)
+		return n, distinct, Fit(k[use], n[use], t[use] - epoch[k[use]] - period[k[use]]*n[use], w[use], nk, terms)
+
+	# take in the observations further out a doubling of cycles at a
+	# time, out from each object's observation nearest its catalog epoch.
+	# Only the epoch and period are fitted for this as a quadratic term
+	# from a few close together cycles throws the extrapolation out
+	n = cycles()
+	nearest = numpy.lexsort((numpy.abs(n), k))
+	nearest = nearest[numpy.unique(k[nearest], return_index=True)[1]]
+	centre = numpy.zeros(nk)
+	centre[k[nearest]] = n[nearest]
+	reach = numpy.abs(n - centre[k])
+	span = 1.
+	while True:
+		use = reach <= span
+		n, distinct, (params, inverse, chi2, dof) = fit(use, 2)
+		if not len(reach) or span >= reach.max():
+			break
+		span *= 2.
+
+	# then the full fit, sigma clipping the observations (not the
+	# catalog epochs)
+	most = 3 if quadratic else 2
+	use = numpy.ones(len(k), dtype=bool)
+	n, distinct, (params, inverse, chi2, dof) = fit(use, most)
+	for i in range(iterations):
+		n = cycles()
+		model = params[k,0] + params[k,1]*n + params[k,2]*n*n
+		keep = ~real | (numpy.abs(t - epoch[k] - period[k]*n - model) <= clip * err)
+		if (keep == use).all():
+			break
+		use = keep
+		n, distinct, (params, inverse, chi2, dof) = fit(use, most)
+
+	# move the epoch to the cycle nearest the weighted middle of the data,
+	# y = a + b*n + c*n^2 around n0 is a' + b'*(n-n0) + c*(n-n0)^2
+	sw = numpy.bincount(k[use], weights=w[use], minlength=nk)
+	n0 = numpy.round(numpy.bincount(k[use], weights=w[use]*n[use], minlength=nk) / numpy.maximum(sw, 1e-300))
+	a, b, c = params[:,0], params[:,1], params[:,2]
+	J = numpy.zeros((nk, 3, 3))
+	J[:,0,0] = 1.
+	J[:,0,1] = n0
+	J[:,0,2] = n0*n0
+	J[:,1,1] = 1.
+	J[:,1,2] = 2.*n0
+	J[:,2,2] = 1.
+	terms = numpy.minimum(distinct, most)
+	for i in range(3):
+		inverse[terms <= i,i,:] = 0.
+		inverse[terms <= i,:,i] = 0.
+	scale = numpy.where(dof > 0, numpy.maximum(chi2 / numpy.maximum(dof, 1), 1.), 1.)
+	covariance = numpy.einsum('kij,kjl,kml->kim', J, inverse, J) * scale[:,numpy.newaxis,numpy.newaxis]
+
+	results = numpy.zeros(nk, dtype=result_dtype)
+	results['name'] = catalog.name
+	results['refined'] = terms >= 2
+	results['epoch'] = epoch + period*n0 + a + b*n0 + c*n0*n0
+	results['period'] = period + b + 2.*c*n0
+	results['quadratic'] = c
+	results['covariance'] = covariance
+	results['n_obs'] = numpy.bincount(k[use & real], minlength=nk)
+	results['n_cycles'] = distinct
+	results['clipped'] = numpy.bincount(k[~use & real], minlength=nk)
+	results['chi2'] = chi2
+	results['dof'] = dof
+	# those left as they were keep the catalog ephemeris exactly
+	results['epoch'][terms < 2] = epoch[terms < 2]
+	results['period'][terms < 2] = period[terms < 2]
+	return results
+
+##################################
+
+def Write_catalog(filename, source, results):
+	# copy of the targets/ format catalog source with the refined epochs
+	# and periods put in, everything else on the lines is kept as it was.
+	# CSV catalogs aren't rewritten
+	if eph_catalog.Is_csv(source):
+		raise ValueError("%s is a CSV catalog, only targets/ format catalogs can be rewritten" % (source))
+	line_pattern = re.compile(r'(\S+\s+)(\S+)(\s+)(\S+)(.*)', re.DOTALL)
+	out = []
+	i = 0
+	with open(source) as f:
+		for line in f:
+			if line[0] != '#' and line[0] != '\n' and line[0] != ' ':
+				r = results[i]
+				i += 1
+				if r['refined']:
+					m = line_pattern.match(line)
+					line = "%s%.6f%s%.9f%s" % (m.group(1), r['epoch'], m.group(3), r['period'], m.group(5))
+			out.append(line)
+	with open(filename, 'w') as f:
+		f.write(''.join(out))
+
+##################################
+
+def Write_covariance(filename, results, quadratic=False):
+	# table of the fitted ephemerides, their errors and correlations
+	columns = "# name  n_obs  n_cycles  clipped  epoch  sigma_epoch  period  sigma_period  corr_epoch_period"
+	if quadratic:
+		columns += "  quadratic  sigma_quadratic  corr_epoch_quadratic  corr_period_quadratic"
+	with open(filename, 'w') as f:
+		f.write(columns + "  chi2  dof\n")
+		for r in results[results['refined']]:
+			C = r['covariance']
+			sigma = numpy.sqrt(numpy.diag(C))
+			norm = numpy.outer(sigma, sigma)
+			corr = numpy.where(norm > 0., C, 0.) / numpy.where(norm > 0., norm, 1.)
+			line = "%s  %d  %d  %d  %.6f  %.6f  %.9f  %.9f  %+.4f" % (r['name'], r['n_obs'], r['n_cycles'],
+				r['clipped'], r['epoch'], sigma[0], r['period'], sigma[1], corr[0,1])
+			if quadratic:
+				line += "  %+.3e  %.3e  %+.4f  %+.4f" % (r['quadratic'], sigma[2], corr[0,2], corr[1,2])
+			f.write(line + "  %.2f  %d\n" % (r['chi2'], r['dof']))
@@ -0,0 +1,125 @@
+import re
+import numpy
+import eph_records
+
+"""
+Module to schedule a network of telescopes from the eph_engine
+results, giving each transit to at most one site and each site at
+most one object at a time
+
+Every visible transit at every site is a candidate, scored by
+
+	priority x coverage x observable / max_airmass x moon
+
+where coverage weights the transit type (full transits first),
+observable and max_airmass come from the window sampling and moon
+falls from 1 to 0.5 for a full Moon right next to the object. The
+priority is taken from the object's catalog comment, e.g.
+
+	WASP-12b 2454508.97682 1.09142245 3.0 06 30 33 +29 40 20 # priority=3
+
+(1 without one). Candidates are then taken greedily in order of
+score, each going in if its transit isn't already scheduled at
+another site and its window (plus the baseline either side and the
+overhead after) is free at its site. The busy intervals of each site
+are kept in buckets by the UT day they overlap, so checking or adding
+a candidate only looks at the few intervals of its own day or two
+rather than everything scheduled so far
+"""
+
+# weight of each transit type
+type_weights = {eph_records.FULL: 1., eph_records.INGRESS_MID: 0.5,
+	eph_records.EGRESS_MID: 0.5, eph_records.INGRESS: 0.25,
+	eph_records.EGRESS: 0.25, eph_records.MID: 0.25}
+
+priority_pattern = re.compile(r'priority\s*[=:]\s*([0-9]*\.?[0-9]+)', re.IGNORECASE)
+
+# column headings for the schedule listing
+schedule_heading = "#\n#    HJD        Site              Object      Date     Time/UT      Window " \
+	"        HA limits             Alt            Transit type?        MoonAng      % Illuminated   Score\n#"
+
+# fields added to the eph_records ones in a schedule
+schedule_dtype = numpy.dtype([('site', 'i4')] + eph_records.transit_dtype.descr + [('score', 'f8')])
+
+##################################
+
+def Priority(obj, default=1.):
+	# priority=N (or priority: N) from the object's comment
+	match = priority_pattern.search(obj.get('comment', ''))
+	if match:
+		return float(match.group(1))
+	return default
+
+##################################
+
+def Scores(records, priority):
+	# score of each record, priority is an array over the objects
+	weights = numpy.zeros(max(type_weights) + 1)
+	for t,w in type_weights.items():
+		weights[t] = w
+	moon = 1. - 0.5 * records['moon_illum'] / 100. * numpy.clip(1. - records['moon_sep'] / 60., 0., 1.)
+	airmass = numpy.maximum(records['max_airmass'], 1.)
+	return priority[records['object']] * weights[records['type']] * records['observable'] * moon / airmass
+
+##################################
+
+def Schedule(sites, objects, site_records, baseline=0., overhead=0., types=None):
+	# the transits assigned to each site, in time order, as a
+	# schedule_dtype array. baseline is in hours (either side of the
+	# window), overhead in minutes (after it, e.g. for slewing and
+	# setting up). types limits the candidates to some transit types
+	candidates = eph_records.Combine(site_records)
+	if types is not None:
+		candidates = candidates[numpy.isin(candidates['type'], types)]
+	priority = numpy.array([Priority(obj) for obj in objects])
+	scores = Scores(candidates, priority)
+	order = numpy.argsort(-scores, kind='mergesort')
+	order = order[scores[order] > 0.]
+
+	starts = (candidates['start'] - baseline / 24.).tolist()
+	ends = (candidates['end'] + baseline / 24. + overhead / 1440.).tolist()
+	site_of = candidates['site'].tolist()
+	busy = {}
+	taken = set()
+	chosen = []
+	for i in order:
+		transit = (candidates['object'][i], candidates['hjd'][i])
+		if transit in taken:
+			continue
+		# the (site, day) buckets the window overlaps, windows being
+		# less than a day long there are one or two of them
+		site, start, end = site_of[i], starts[i], ends[i]
+		days = [(site, day) for day in range(int(start // 1), int(end // 1) + 1)]
+		if any(s < end and e > start for key in days for s,e in busy.get(key, ())):
+			continue
+		for key in days:
+			busy.setdefault(key, []).append((start, end))
+		taken.add(transit)
+		chosen.append(i)
+
+	chosen = numpy.array(chosen, dtype=int)
+	schedule = numpy.zeros(len(chosen), dtype=schedule_dtype)
+	for field in candidates.dtype.names:
+		schedule[field] = candidates[field][chosen]
+	schedule['score'] = scores[chosen]
+	return schedule[numpy.lexsort((schedule['site'], schedule['hjd']))]
+
+##################################
+
+def Write_schedule(filename, sites, objects, schedule, candidates=None):
+	# the schedule as a text listing, the listing line of each transit
+	# with the site before it and the score after
+	lines = [None] * len(schedule)
+	for s,site in enumerate(sites):
+		at_site = numpy.where(schedule['site'] == s)[0]
+		for i,line in zip(at_site, eph_records.Format_lines(schedule[at_site], objects, site['lowlim'])):
+			lines[i] = "%.5f  %-12s %s  %6.3f\n" % (schedule['hjd'][i], site['name'], line, schedule['score'][i])
+	with open(filename, 'w') as f:
+		f.write("# Network schedule: %d transits scheduled" % (len(schedule)))
+		if candidates is not None:
+			f.write(" from %d candidates" % (candidates))
+		f.write("\n")
+		for s,site in enumerate(sites):
+			f.write("# %12s : %d\n" % (site['name'], numpy.sum(schedule['site'] == s)))
+		f.write(schedule_heading + "\n")
+		f.write(''.join(lines))
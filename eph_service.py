@@ -0,0 +1,165 @@
+from __future__ import print_function
+import json
+import argparse as ap
+import eph_engine
+import eph_twilight
+import eph_records
+import eph_output
+import eph_functions as JD
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from urllib.parse import urlparse, parse_qs
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from urlparse import urlparse, parse_qs
+
+"""
+Small local HTTP service that keeps an eph_engine.Engine warm
+between queries, so the catalog, observatories, Moon table and sun
+times are only set up once
+
+Usage:
+	python eph_service.py targets/Planets observatories2 [--port 8765]
+
+Queries (answers are JSON):
+	/transits?start=2016-12-01&end=2016-12-31[&site=LaPalma][&object=WASP-12]
+	/tonight[?site=LaPalma][&object=WASP-12]
+	/sites
+	/objects
+
+site and object can be given more than once. Dates are as for
+ephemeris2.py, either Gregorian or JD. tonight is the current night
+at each site, from its noontime to the next as in
+eph_functions.Night_array. The transits come in UTC mid-time order
+as in the listings
+"""
+
+def ArgParse():
+	parser = ap.ArgumentParser()
+	parser.add_argument('objects', help='objects filename (e.g. targets/Planets)')
+	parser.add_argument('observatories', help='observatories filename (e.g. observatories2)')
+	parser.add_argument('--host', help='address to listen on', default='127.0.0.1')
+	parser.add_argument('--port', help='port to listen on', type=int, default=8765)
+	parser.add_argument('--twilight-cache', help='file to store/reuse twilight times')
+	return parser.parse_args()
+
+##################################
+
+def Tonight_JD(site, now=None):
+	# the night (numbered as JD.Night_array) at site containing now
+	# (default the current JD) and the JDs of the noontimes either side
+	if now is None:
+		now = JD.JD_now()
+	night = int(JD.Night_array(now, site['noontime']))
+	start = night - 0.5 + JD.Time_to_decimal(tuple(site['noontime'].split(':'))) / 24.
+	return night, start, start + 1.
+
+##################################
+
+def Site_transits(engine, startJD, endJD, sites=None, objects=None):
+	# run the engine and flatten the results into a list of
+	# dictionaries
+	if sites:
+		site_list = [site for site in engine.sites if site['name'] in sites]
+	else:
+		site_list = engine.sites
+	results = engine.transits(startJD, endJD, sites, objects)
+	transits = []
+	for site, records in zip(site_list, results):
+		lines = eph_records.Format_lines(records, engine.objects, site['lowlim'])
+		for rec, line in zip(records, lines):
+			transit = {'site': site['name'], 'object': engine.objects[rec['object']]['name'], 'line': line}
+			for field in eph_output.fields:
+				transit[field] = float(rec[field])
+			transit['type'] = eph_records.type_names[rec['type']]
+			transits.append(transit)
+	return transits
+
+##################################
+
+def Time_order(transits):
+	# sorted on the UTC mid-times, as the listings and eph_store
+	transits.sort(key=lambda t: (t['utc'], t['site'], t['object']))
+	return transits
+
+##################################
+
+def Transits_JSON(engine, startJD, endJD, sites=None, objects=None):
+	# the transits from startJD to endJD in time order
+	transits = Site_transits(engine, startJD, endJD, sites, objects)
+	return {'startJD': startJD, 'endJD': endJD, 'transits': Time_order(transits)}
+
+##################################
+
+def Tonight_JSON(engine, sites=None, objects=None, now=None):
+	# the transits of the current night at each site, which starts
+	# and ends at the site's own noontime
+	transits, nights = [], {}
+	for site in engine.sites:
+		if sites and site['name'] not in sites:
+			continue
+		night, startJD, endJD = Tonight_JD(site, now)
+		nights[site['name']] = {'night': night, 'startJD': startJD, 'endJD': endJD}
+		transits.extend(Site_transits(engine, startJD, endJD, [site['name']], objects))
+	return {'nights': nights, 'transits': Time_order(transits)}
+
+##################################
+
+class EphemerisHandler(BaseHTTPRequestHandler):
+	"""
+	Answers the queries using the server's engine
+	"""
+	def do_GET(self):
+		url = urlparse(self.path)
+		query = parse_qs(url.query)
+		engine = self.server.engine
+		try:
+			if url.path == '/transits':
+				startJD = eph_engine.Parse_date(query['start'][0])
+				endJD = eph_engine.Parse_date(query['end'][0])
+				answer = Transits_JSON(engine, startJD, endJD,
+					query.get('site'), query.get('object'))
+			elif url.path == '/tonight':
+				answer = Tonight_JSON(engine, query.get('site'), query.get('object'))
+			elif url.path == '/sites':
+				answer = engine.sites
+			elif url.path == '/objects':
+				answer = engine.objects
+			else:
+				self.send_error(404, 'Unknown query %s' % (url.path))
+				return
+		except (KeyError, ValueError) as error:
+			self.send_error(400, 'Bad query: %s' % (error))
+			return
+		body = json.dumps(answer).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+##################################
+
+def Make_server(engine, host='127.0.0.1', port=8765):
+	# set up (but don't start) a server for engine
+	server = HTTPServer((host, port), EphemerisHandler)
+	server.engine = engine
+	return server
+
+##################################
+
+if __name__ == '__main__':
+	args = ArgParse()
+	store = eph_twilight.LoadStore(args.twilight_cache)
+	engine = eph_engine.Engine(eph_engine.Read_objects(args.objects),
+		eph_engine.Read_observatories(args.observatories), store)
+	server = Make_server(engine, args.host, args.port)
+	print('Serving transits on http://%s:%d/' % (args.host, args.port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		if args.twilight_cache:
+			eph_twilight.SaveStore(args.twilight_cache, store)
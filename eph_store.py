@@ -0,0 +1,145 @@
+import sqlite3
+import eph_functions as JD
+import eph_records
+
+"""
+Module to keep the eph_engine results in an SQLite database so
+they can be queried by site, night, object, time, transit type and
+Moon separation without rescanning the text files
+
+Writing a run replaces the transits already stored for those sites
+and objects inside the run's date range, so the database can be
+topped up run by run. The night of a transit is numbered as in
+eph_functions.Night_array, i.e. by the integer JD at 12:00 UT on
+the date the night starts at that site. Times are queried and sorted
+by the UTC mid-time, the hjd column keeps the catalog standard's
+"""
+
+schema = """
+CREATE TABLE IF NOT EXISTS sites (name TEXT PRIMARY KEY, latitude REAL,
+	longitude REAL, lowlim REAL, noontime TEXT, elev REAL);
+CREATE TABLE IF NOT EXISTS objects (name TEXT PRIMARY KEY, epoch REAL,
+	period REAL, duration REAL, ra REAL, dec REAL);
+CREATE TABLE IF NOT EXISTS transits (site TEXT, object TEXT, night INTEGER,
+	hjd REAL, utc REAL, start REAL, end REAL, ha_start REAL, ha_end REAL,
+	alt_start REAL, alt_mid REAL, alt_end REAL, type INTEGER,
+	moon_sep REAL, moon_illum REAL, line TEXT, observable REAL,
+	min_alt REAL, max_airmass REAL);
+"""
+
+# made once any missing columns have been added, the (object, hjd)
+# index of older databases is replaced by the UTC one
+indexes = """
+CREATE INDEX IF NOT EXISTS transits_site_night ON transits (site, night);
+DROP INDEX IF EXISTS transits_object_time;
+CREATE INDEX IF NOT EXISTS transits_object_utc ON transits (object, utc);
+CREATE INDEX IF NOT EXISTS transits_type ON transits (type);
+"""
+
+columns = ['site', 'object', 'night', 'hjd', 'utc', 'start', 'end', 'ha_start',
+	'ha_end', 'alt_start', 'alt_mid', 'alt_end', 'type', 'moon_sep',
+	'moon_illum', 'line', 'observable', 'min_alt', 'max_airmass']
+
+##################################
+
+def Connect(filename):
+	conn = sqlite3.connect(filename)
+	conn.row_factory = sqlite3.Row
+	conn.executescript(schema)
+	# databases from before a column was added get it empty
+	have = [row['name'] for row in conn.execute("PRAGMA table_info(transits)")]
+	for column in columns:
+		if column not in have:
+			conn.execute("ALTER TABLE transits ADD COLUMN %s REAL" % column)
+	# transits stored before the time standards were taken into account
+	# used the catalog times as they were
+	if 'utc' not in have:
+		conn.execute("UPDATE transits SET utc=hjd")
+	conn.executescript(indexes)
+	return conn
+
+##################################
+
+def Write(filename, sites, objects, site_records, startJD, endJD):
+	# store a run's results, one eph_records array per site
+	conn = Connect(filename)
+	names = [obj['name'] for obj in objects]
+	with conn:
+		conn.executemany("INSERT OR REPLACE INTO sites VALUES (?,?,?,?,?,?)",
+			[(site['name'], site['latitude'], site['longitude'], site['lowlim'],
+			site['noontime'], site['elev']) for site in sites])
+		conn.executemany("INSERT OR REPLACE INTO objects VALUES (?,?,?,?,?,?)",
+			[(obj['name'], obj['epoch'], obj['period'], obj['duration'],
+			obj['ra'], obj['dec']) for obj in objects])
+		for site,records in zip(sites, site_records):
+			# the run's date range is on the catalog times
+			conn.executemany("DELETE FROM transits WHERE site=? AND object=? AND hjd>? AND hjd<?",
+				[(site['name'], name, startJD, endJD) for name in names])
+			lines = eph_records.Format_lines(records, objects, site['lowlim'])
+			nights = JD.Night_array(records['utc'], site['noontime'])
+			rows = []
+			for rec,night,line in zip(records, nights, lines):
+				rows.append((site['name'], names[rec['object']], int(night),
+					float(rec['hjd']), float(rec['utc']), float(rec['start']), float(rec['end']),
+					float(rec['ha_start']), float(rec['ha_end']),
+					float(rec['alt_start']), float(rec['alt_mid']), float(rec['alt_end']),
+					int(rec['type']), float(rec['moon_sep']), float(rec['moon_illum']), line,
+					float(rec['observable']), float(rec['min_alt']), float(rec['max_airmass'])))
+			conn.executemany("INSERT INTO transits (%s) VALUES (%s)" % (','.join(columns),
+				','.join('?'*len(columns))), rows)
+	conn.close()
+
+##################################
+
+def Query(conn, site=None, object=None, night=None, types=None, start=None,
+	end=None, min_moon_sep=None, limit=None):
+	# transits matching all the given conditions, in time order. start
+	# and end are UTC JDs, types is a list of eph_records transit types
+	where, params = [], []
+	if site is not None:
+		where.append("site=?")
+		params.append(site)
+	if object is not None:
+		where.append("object=?")
+		params.append(object)
+	if night is not None:
+		where.append("night=?")
+		params.append(int(night))
+	if types:
+		where.append("type IN (%s)" % ','.join('?'*len(types)))
+		params.extend(int(t) for t in types)
+	if start is not None:
+		where.append("utc>?")
+		params.append(start)
+	if end is not None:
+		where.append("utc<?")
+		params.append(end)
+	if min_moon_sep is not None:
+		where.append("moon_sep>?")
+		params.append(min_moon_sep)
+	sql = "SELECT * FROM transits"
+	if where:
+		sql += " WHERE " + " AND ".join(where)
+	sql += " ORDER BY utc, site, object"
+	if limit is not None:
+		sql += " LIMIT %d" % int(limit)
+	return conn.execute(sql, params).fetchall()
+
+##################################
+
+def Tonight(conn, site, jd=None):
+	# transits in the night containing jd (default now) at site
+	row = conn.execute("SELECT noontime FROM sites WHERE name=?", (site,)).fetchone()
+	if row is None:
+		return []
+	if jd is None:
+		jd = JD.JD_now()
+	return Query(conn, site=site, night=JD.Night_array(jd, row['noontime']))
+
+##################################
+
+def Next_transits(conn, object, n=10, types=None, jd=None, site=None):
+	# the next n transits of object after jd (default now)
+	if jd is None:
+		jd = JD.JD_now()
+	return Query(conn, site=site, object=object, types=types, start=jd, limit=n)
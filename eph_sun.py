@@ -0,0 +1,100 @@
+import numpy
+import eph_functions as JD
+
+"""
+Module to work out sunset, sunrise and the astronomical twilights
+for whole date ranges at once
+
+The Sun's position comes from the low precision formulae of
+JD.Sun_array, its altitude is found on a grid through each night and
+the first crossing of each horizon after noon is bracketed from the
+grid then narrowed down by bisection and a final interpolation, all
+nights together. The horizons are those eph_twilight uses with
+PyEphem: sunset/sunrise when the Sun's upper limb is at -0:34 with
+the refraction for a pressure of 750 mbar (which puts its centre at
+sun_altitude) and the twilights when its centre is at -18 deg.
+Against PyEphem's next_setting/next_rising the times agree to a few
+seconds away from the poles and well inside a minute up to the
+polar circles
+
+Where the Sun doesn't cross a horizon in the 24 hours after noon
+(the midnight Sun, polar night, or the summer nights at higher
+latitudes that never get astronomically dark) the time is NaN and
+Always says whether it stayed above or below
+"""
+
+# geometric altitude of the Sun's centre at sunset/sunrise and at
+# the twilights, degrees
+sun_altitude = -1.414
+twilight_altitude = -18.
+
+# grid spacing (days) for bracketing the crossings, short enough
+# that the Sun can't cross a horizon twice between samples
+grid_step = 20. / 1440.
+
+##################################
+
+def Sun_altitude(JD_times, latitude, longitude):
+	# altitude (degrees) of the Sun's centre at the JDs from a site,
+	# longitude east +ve as in the observatories file
+	ra, dec = JD.Sun_array(JD_times)
+	return JD.Altitude(latitude, dec, JD.HA_array(JD.Sid_time_array(JD_times, longitude), ra))
+
+##################################
+
+def Grid(starts, latitude, longitude, span=1., step=grid_step, function=Sun_altitude):
+	# times and Sun (or function's, see Crossings) altitudes, rows per
+	# start, every step days from each start to span days after it
+	n = int(numpy.ceil(span / step)) + 1
+	times = numpy.asarray(starts, dtype=float)[:,numpy.newaxis] + numpy.arange(n) * step
+	return times, function(times, latitude, longitude)
+
+##################################
+
+def Crossings(times, alts, latitude, longitude, altitude, rising=False, iterations=10, function=Sun_altitude):
+	# JD of the first time in each row of the grid that the Sun passes
+	# altitude going down (or up with rising), NaN where it doesn't.
+	# function gives the altitudes of some other body the same way
+	above = alts > altitude
+	if rising:
+		cross = ~above[:,:-1] & above[:,1:]
+	else:
+		cross = above[:,:-1] & ~above[:,1:]
+	found = cross.any(axis=1)
+	first = numpy.argmax(cross, axis=1)
+	rows = numpy.where(found)[0]
+	lo = times[rows, first[rows]]
+	hi = times[rows, first[rows] + 1]
+	# lo is always on the starting side of the horizon
+	sign = 1. if rising else -1.
+	for i in range(iterations):
+		mid = 0.5 * (lo + hi)
+		past = sign * (function(mid, latitude, longitude) - altitude) > 0.
+		hi = numpy.where(past, mid, hi)
+		lo = numpy.where(past, lo, mid)
+	a_lo = function(lo, latitude, longitude) - altitude
+	a_hi = function(hi, latitude, longitude) - altitude
+	out = numpy.full(len(times), numpy.nan)
+	out[rows] = lo + (hi - lo) * a_lo / numpy.where(a_lo != a_hi, a_lo - a_hi, 1.)
+	return out
+
+##################################
+
+def Always(alts, altitude):
+	# +1 where the Sun stays above altitude over the whole row of the
+	# grid, -1 where it stays below and 0 where it crosses
+	return numpy.where((alts > altitude).all(axis=1), 1, numpy.where((alts <= altitude).all(axis=1), -1, 0))
+
+##################################
+
+def Sun_times(starts, latitude, longitude):
+	# sunset, end of evening twilight, start of morning twilight and
+	# sunrise (JDs, NaN for none) following each start, e.g. the
+	# noontimes of a run of nights, along with Always for the
+	# twilight horizon
+	times, alts = Grid(starts, latitude, longitude)
+	sunset = Crossings(times, alts, latitude, longitude, sun_altitude)
+	evening = Crossings(times, alts, latitude, longitude, twilight_altitude)
+	morning = Crossings(times, alts, latitude, longitude, twilight_altitude, rising=True)
+	sunrise = Crossings(times, alts, latitude, longitude, sun_altitude, rising=True)
+	return sunset, evening, morning, sunrise, Always(alts, twilight_altitude)
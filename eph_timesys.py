@@ -0,0 +1,189 @@
+import re
+import numpy
+
+"""
+Module to turn catalog mid-times into UTC, so the transits are placed
+at the right time for the visibility and the listings
+
+Catalog epochs come in a time standard, a reference frame and a time
+scale, e.g. HJD_UTC (the heliocentric Julian date on the UTC scale,
+the usual for older ephemerides) or BJD_TDB (barycentric on the
+barycentric dynamical time scale, the usual now). The frame is undone
+by taking off the light travel time between the observer and the
+Sun (HJD) or the solar system barycentre (BJD) towards the target, up
+to about 8.3 minutes, and the scale by taking off TT-UTC (the leap
+seconds plus 32.184 s) and for TDB its small periodic difference
+from TT. JD_UTC means no correction at all.
+
+The Earth's position comes from the J2000 mean orbital elements of
+the Earth-Moon barycentre and the barycentre from those of the four
+giant planets (Standish's approximate elements, for 1800-2050), both
+solved for all the times at once, so a whole target's transits are
+converted in one go. Against PyEphem's Sun and planets the light
+times are good to a few hundredths of a second
+"""
+
+# the standard assumed for objects without one
+default_standard = 'HJD_UTC'
+
+# frames and scales understood, e.g. BJD_TDB
+frames = ['JD', 'HJD', 'BJD']
+scales = ['UTC', 'TT', 'TDB']
+
+# catalog text for a standard, alone (e.g. CSV columns) or in a comment
+standard_pattern = re.compile(r'^(JD|HJD|BJD)(?:[\s_-]*(UTC|UT|TT|TDB))?$', re.IGNORECASE)
+comment_pattern = re.compile(r'\btime(?:sys)?\s*[=:]\s*([A-Za-z][A-Za-z_-]*)', re.IGNORECASE)
+
+# largest difference (days) between a mid-time and its UTC, for padding
+# ranges: light travel time across the orbit and TT-UTC
+max_offset = 0.01
+
+# TAI-UTC (seconds) from each JD on
+leap_seconds = numpy.array([(2441317.5, 10), (2441499.5, 11), (2441683.5, 12),
+	(2442048.5, 13), (2442413.5, 14), (2442778.5, 15), (2443144.5, 16), (2443509.5, 17),
+	(2443874.5, 18), (2444239.5, 19), (2444786.5, 20), (2445151.5, 21), (2445516.5, 22),
+	(2446247.5, 23), (2447161.5, 24), (2447892.5, 25), (2448257.5, 26), (2448804.5, 27),
+	(2449169.5, 28), (2449534.5, 29), (2450083.5, 30), (2450630.5, 31), (2451179.5, 32),
+	(2453736.5, 33), (2454832.5, 34), (2456109.5, 35), (2457204.5, 36), (2457754.5, 37)])
+tt_minus_tai = 32.184
+
+# J2000 mean elements and their rates per century: a (AU), e, I, L,
+# longitude of perihelion and of the ascending node (degrees), on the
+# ecliptic and equinox of J2000
+earth_elements = numpy.array([
+	[1.00000261, 0.01671123, -0.00001531, 100.46457166, 102.93768193, 0.],
+	[0.00000562, -0.00004392, -0.01294668, 35999.37244981, 0.32327364, 0.]])
+planet_elements = numpy.array([
+	# Jupiter, Saturn, Uranus, Neptune
+	[[5.20288700, 0.04838624, 1.30439695, 34.39644051, 14.72847983, 100.47390909],
+	[9.53667594, 0.05386179, 2.48599187, 49.95424423, 92.59887831, 113.66242448],
+	[19.18916464, 0.04725744, 0.77263783, 313.23810451, 170.95427630, 74.01692503],
+	[30.06992276, 0.00859048, 1.77004347, -55.12002969, 44.96476227, 131.78422574]],
+	[[-0.00011607, -0.00013253, -0.00183714, 3034.74612775, 0.21252668, 0.20469106],
+	[-0.00125060, -0.00050991, 0.00193609, 1222.49362201, -0.41897216, -0.28867794],
+	[-0.00196176, -0.00004397, -0.00242939, 428.48202785, 0.40805281, 0.04240589],
+	[0.00026291, 0.00005105, 0.00035372, 218.45945325, -0.32241464, -0.00508664]]])
+
+# the giant planets' masses (with their moons) over the Sun's
+planet_masses = numpy.array([1./1047.3486, 1./3497.898, 1./22902.98, 1./19412.24])
+
+# obliquity of the ecliptic at J2000 (degrees) and the light travel
+# time for 1 AU (seconds)
+obliquity = 23.43928
+au_seconds = 499.004784
+
+##################################
+
+def Parse(text):
+	# canonical FRAME_SCALE for catalog text such as 'BJD-TDB', 'bjd_tdb'
+	# or 'HJD' (UTC when no scale is given), ValueError if not understood
+	match = standard_pattern.match(text.strip())
+	if not match:
+		raise ValueError("Unknown time standard %s" % (text))
+	scale = (match.group(2) or 'UTC').upper()
+	return "%s_%s" % (match.group(1).upper(), 'UTC' if scale == 'UT' else scale)
+
+##################################
+
+def From_comment(comment):
+	# standard given in a catalog comment, e.g. # time=BJD_TDB, '' if none
+	match = comment_pattern.search(comment)
+	return Parse(match.group(1)) if match else ''
+
+##################################
+
+def Standard(obj, default=default_standard):
+	# the object's time standard, default if the catalog doesn't give one
+	return obj.get('timesys') or default
+
+##################################
+
+def TT_minus_UTC(JD_times):
+	# seconds, the leap seconds before 1972 are taken as the first
+	i = numpy.searchsorted(leap_seconds[:,0], JD_times, 'right') - 1
+	return leap_seconds[numpy.maximum(i, 0), 1] + tt_minus_tai
+
+##################################
+
+def TDB_minus_TT(JD_times):
+	# seconds, the main periodic term
+	g = numpy.radians(357.53 + 0.98560028 * (numpy.asarray(JD_times) - 2451545.))
+	return 0.001657 * numpy.sin(g) + 0.000014 * numpy.sin(2. * g)
+
+##################################
+
+def Orbit_positions(JD_times, elements):
+	# heliocentric equatorial (J2000) positions in AU of bodies with the
+	# mean elements (as earth_elements, planet_elements) at the JDs, on
+	# a last axis of 3 after the times' and the bodies' shapes
+	T = (numpy.asarray(JD_times, dtype=float) - 2451545.) / 36525.
+	T = T.reshape(T.shape + (1,) * (elements.ndim - 2))
+	a, e, I, L, perihelion, node = [elements[0][...,k] + elements[1][...,k] * T for k in range(6)]
+	M = numpy.radians((L - perihelion + 180.) % 360. - 180.)
+	E = M + e * numpy.sin(M)
+	for i in range(5):
+		E = E - (E - e * numpy.sin(E) - M) / (1. - e * numpy.cos(E))
+	x = a * (numpy.cos(E) - e)
+	y = a * numpy.sqrt(1. - e*e) * numpy.sin(E)
+	w, O, I = numpy.radians(perihelion - node), numpy.radians(node), numpy.radians(I)
+	xe = (numpy.cos(w)*numpy.cos(O) - numpy.sin(w)*numpy.sin(O)*numpy.cos(I)) * x \
+		- (numpy.sin(w)*numpy.cos(O) + numpy.cos(w)*numpy.sin(O)*numpy.cos(I)) * y
+	ye = (numpy.cos(w)*numpy.sin(O) + numpy.sin(w)*numpy.cos(O)*numpy.cos(I)) * x \
+		+ (numpy.cos(w)*numpy.cos(O)*numpy.cos(I) - numpy.sin(w)*numpy.sin(O)) * y
+	ze = numpy.sin(w)*numpy.sin(I) * x + numpy.cos(w)*numpy.sin(I) * y
+	eps = numpy.radians(obliquity)
+	return numpy.stack((xe, numpy.cos(eps)*ye - numpy.sin(eps)*ze, numpy.sin(eps)*ye + numpy.cos(eps)*ze), axis=-1)
+
+##################################
+
+def Observer_position(JD_times, frame):
+	# equatorial position (AU) of the Earth relative to the Sun (HJD) or
+	# the barycentre (BJD), times along the first axes
+	earth = Orbit_positions(JD_times, earth_elements)
+	if frame == 'BJD':
+		planets = Orbit_positions(JD_times, planet_elements)
+		weights = planet_masses / (1. + planet_masses.sum())
+		earth = earth - (weights[:,numpy.newaxis] * planets).sum(axis=-2)
+	return earth
+
+##################################
+
+def Light_time(JD_times, ra, dec, frame):
+	# seconds to add to a JD at the Earth for the frame's time, i.e.
+	# how much later the light reaches the Sun/barycentre. ra (hours)
+	# and dec (degrees) J2000 of the target, which broadcast with the
+	# times
+	if frame == 'JD':
+		return numpy.zeros(numpy.shape(JD_times))
+	ra, dec = numpy.radians(numpy.asarray(ra) * 15.), numpy.radians(dec)
+	r = Observer_position(JD_times, frame)
+	return au_seconds * (r[...,0]*numpy.cos(dec)*numpy.cos(ra) + r[...,1]*numpy.cos(dec)*numpy.sin(ra)
+		+ r[...,2]*numpy.sin(dec))
+
+##################################
+
+def To_utc(times, ra, dec, standard):
+	# UTC JDs of times in the standard (e.g. 'BJD_TDB') for the target
+	# at ra (hours), dec (degrees), all of a target's times at once
+	frame, scale = standard.split('_')
+	times = numpy.asarray(times, dtype=float)
+	# the light time is worked out at the catalog time, the Earth moves
+	# too little in the few minutes it shifts the time by to matter
+	utc = times - Light_time(times, ra, dec, frame) / 86400.
+	if scale == 'TDB':
+		utc = utc - TDB_minus_TT(utc) / 86400.
+	if scale != 'UTC':
+		utc = utc - TT_minus_UTC(utc - TT_minus_UTC(utc) / 86400.) / 86400.
+	return utc
+
+##################################
+
+def From_utc(utc, ra, dec, standard):
+	# the inverse of To_utc, to a few hundredths of a second
+	frame, scale = standard.split('_')
+	times = numpy.asarray(utc, dtype=float)
+	if scale != 'UTC':
+		times = times + TT_minus_UTC(utc) / 86400.
+	if scale == 'TDB':
+		times = times + TDB_minus_TT(times) / 86400.
+	return times + Light_time(times, ra, dec, frame) / 86400.
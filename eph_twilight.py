@@ -0,0 +1,172 @@
+import os
+import json
+import numpy
+import ephem
+import eph_functions as JD
+import eph_profile
+import eph_sun
+
+"""
+Module to calculate the sunset, sunrise and twilight times for
+an observatory, with a per night cache shared by all targets
+
+The times come from eph_sun, a whole date range at once. GetSunTimes
+gives the same times from PyEphem for one night, for checking
+"""
+
+# horizons used for the sun times, -0:34 with pressure=750 for
+# sunset/sunrise and -18 (astronomical) for the twilights (see
+# eph_sun for the same in altitudes of the Sun's centre)
+sun_horizon = '-0:34'
+sun_pressure = 750
+twi_horizon = '-18'
+
+# JD of ephem's day 0
+dublin_jd = 2415020.
+
+##################################
+
+# function to get the sunset, sunrise and twilight times from
+# PyEphem, assumed astronomical for obvious reasons
+def GetSunTimes(date,lat,lon,elev):
+
+	obs=ephem.Observer()
+	obs.lon=str(lon)
+	obs.lat=str(lat)
+	obs.elev=elev
+	obs.pressure=sun_pressure
+	obs.horizon = sun_horizon
+	
+	obs.date=date
+	sunset  =obs.next_setting(ephem.Sun()) 
+	sunrise =obs.next_rising(ephem.Sun())  
+	
+	#-6=civil twilight, -12=nautical, -18=astronomical
+	obs.horizon = twi_horizon
+	end_evening_twi=obs.next_setting(ephem.Sun(), use_center=True) 
+	start_morning_twi=obs.next_rising(ephem.Sun(), use_center=True) 
+	
+	return obs,sunset,end_evening_twi,start_morning_twi,sunrise
+
+##################################
+
+def LoadStore(filename):
+	# read an on disk store of previously calculated nights,
+	# an empty store is returned if there isn't one yet
+	if filename and os.path.exists(filename):
+		with open(filename) as f:
+			return json.load(f)
+	return {}
+
+##################################
+
+def SaveStore(filename, store):
+	with open(filename, 'w') as f:
+		json.dump(store, f, sort_keys=True)
+
+##################################
+
+class TwilightCache(object):
+	"""
+	Sun times for one observatory, calculated once per night
+
+	The night is identified by the UT date, the times returned are
+	those following noontime (UTC) on that date, as GetSunTimes.
+	If a store (see LoadStore) is given the nights are kept in it
+	under a key built from the site coordinates, elevation, noontime
+	and horizon definitions, so they can be saved and reused. Times
+	that don't happen in the 24 hours (the twilights in a summer
+	that never gets astronomically dark, or near the poles) are NaN
+	"""
+	def __init__(self, lat, lon, elev, noontime, store=None):
+		self.lat = lat
+		self.lon = lon
+		self.elev = elev
+		self.noontime = noontime
+		self.key = "%.6f:%.6f:%.1f:%s:%s:%s:%s:%s" % (lat, lon, elev,
+			noontime, sun_horizon, sun_pressure, twi_horizon, 'center:analytic')
+		if store is None:
+			store = {}
+		self.nights = store.setdefault(self.key, {})
+		self.twilight_hours = {}
+		# hours of the nights filled, by day number from first_day
+		self.first_day = 0
+		self.table = numpy.zeros((0, 2))
+		
+	def noon(self, date):
+		# key of the night and the JD of its noontime
+		noon = "%04d/%02d/%02d %s" % (date[2], date[1], date[0], self.noontime)
+		return noon, ephem.julian_date(ephem.Date(noon))
+
+	def night(self, date):
+		# date is a (day, month, year) tuple as from Jul_date
+		# returns sunset, end_evening_twi, start_morning_twi, sunrise
+		noon, jd = self.noon(date)
+		if noon not in self.nights:
+			self.calculate([noon], [jd])
+		return tuple(ephem.Date(t) for t in self.nights[noon][:4])
+
+	def dark(self, date):
+		# JDs of the start and end of the dark (Sun below the twilight
+		# horizon) time following noontime, all of it up to the next
+		# noontime in a polar night and none in a night that never gets
+		# dark
+		noon, jd = self.noon(date)
+		self.night(date)
+		t1,t2,t3,t4,always = self.nights[noon]
+		if t2 != t2 and t3 != t3:
+			return (jd, jd + 1.) if always < 0 else (jd, jd)
+		dusk = jd if t2 != t2 else t2 + dublin_jd
+		dawn = jd + 1. if t3 != t3 else t3 + dublin_jd
+		return dusk, dawn
+
+	def hours(self, date):
+		# UT hours of the end of evening and start of morning twilight
+		try:
+			return self.twilight_hours[date]
+		except KeyError:
+			t1,t2,t3,t4 = self.night(date)
+			if t2 == t2 and t3 == t3:
+				twi1=JD.Time_to_decimal(tuple(str(t2).split()[1].split(':')))
+				twi2=JD.Time_to_decimal(tuple(str(t3).split()[1].split(':')))
+			else:
+				# the dark time as the engine's prefilter sees it, all day
+				# or none, or from/to noontime when only one end is missing
+				dusk, dawn = self.dark(date)
+				if dawn - dusk >= 1.:
+					twi1, twi2 = 0., 24.
+				elif dawn == dusk:
+					twi1, twi2 = 0., 0.
+				else:
+					twi1, twi2 = [((t + 0.5) % 1.) * 24. for t in (dusk, dawn)]
+			self.twilight_hours[date] = (twi1, twi2)
+			return twi1, twi2
+
+	def hours_array(self, JDs, dates):
+		# hours for an array of JDs with their dates (from Jul_date_array),
+		# straight from the table when fill has covered them
+		day = numpy.floor(numpy.asarray(JDs) + 0.5).astype(numpy.int64) - self.first_day
+		if len(day) and day.min() >= 0 and day.max() < len(self.table):
+			return self.table[day]
+		return numpy.array([self.hours(date) for date in zip(*dates)]).reshape(-1, 2)
+
+	def calculate(self, noons, jds):
+		# work out the nights with the given keys and noontime JDs
+		sunset, evening, morning, sunrise, always = eph_sun.Sun_times(numpy.asarray(jds), self.lat, self.lon)
+		for i,noon in enumerate(noons):
+			self.nights[noon] = [float(t - dublin_jd) for t in (sunset[i], evening[i], morning[i], sunrise[i])] + [int(always[i])]
+		eph_profile.count('sun_nights', len(noons))
+		
+	def fill(self, startJD, endJD):
+		# work out every night with a UT date in the range up front
+		days = numpy.arange(numpy.floor(startJD + 0.5), numpy.floor(endJD + 0.5) + 1)
+		(d, m, y), hms = JD.Jul_date_array(days)
+		noon = JD.Time_to_decimal(tuple(self.noontime.split(':'))) / 24.
+		missing = [("%04d/%02d/%02d %s" % (y[i], m[i], d[i], self.noontime), days[i] - 0.5 + noon)
+			for i in range(len(days))]
+		missing = [(key, jd) for key,jd in missing if key not in self.nights]
+		if missing:
+			self.calculate(*zip(*missing))
+		if len(days):
+			self.first_day = int(days[0])
+			self.table = numpy.array([self.hours(date) for date in zip(d, m, y)]).reshape(-1, 2)
@@ -39,26 +39,39 @@
 #                   for simplicity. - JMCC
 # 20141215: v1.1    Added iCal event creator. Only flags full transits
 #                   that are >= 30 deg from moon for La Palma. - JMCC
+# 20261018: v2.0    The calculations now live in eph_engine so they can
+#                   be imported, this file is the command line front end.
+#                   Runs under python 2 or 3.
 #
 
 # import functions needed
+from __future__ import print_function
 import sys,os,time
 import eph_functions as JD
 import argparse as ap
-from datetime import datetime, timedelta
+import numpy
 
 # look for pyephem, warn and die happily if not installed
 try:
 	import ephem
 except ImportError:
-	print "You need to install PyEphem. It is easy if you have pip:"
-	print "\n\tsudo pip install ephem\n"
-	print "If you don't have pip, get pip :)\n"
-	print "\thttps://pip.pypa.io/en/latest/installing.html\n" 
+	print("You need to install PyEphem. It is easy if you have pip:")
+	print("\n\tsudo pip install ephem\n")
+	print("If you don't have pip, get pip :)\n")
+	print("\thttps://pip.pypa.io/en/latest/installing.html\n")
 	sys.exit()
-
-# start counting
-start = time.time()
+import eph_twilight
+import eph_engine
+import eph_records
+import eph_output
+import eph_store
+import eph_incremental
+import eph_profile
+import eph_catalog
+import eph_schedule
+import eph_conflicts
+import eph_almanac
+import eph_timesys
 
 # function to parse the command line
 def ArgParse():
@@ -69,341 +82,245 @@ def ArgParse():
 	parser.add_argument("start", help="date range lower limit (e.g. 2014-12-12 or 2456708)")
 	parser.add_argument("end", help="date range upper limit (e.g. 2014-12-30 or 2456724)")
 	parser.add_argument("--calendar", help="iCal filename")
+	parser.add_argument("--calendar-per-site", action="store_true", help="write one calendar per observatory (<calendar>_<site>.ics) rather than one for all")
+	parser.add_argument("--calendar-type", action="append", choices=sorted(eph_records.type_keys), help="transit type(s) to put in the calendar (default full)")
+	parser.add_argument("--calendar-moon-sep", type=float, default=30., help="minimum Moon separation for the calendar, degrees (default 30)")
+	parser.add_argument("--calendar-min-alt", type=float, help="minimum altitude across the window (and baseline) for the calendar, degrees")
+	parser.add_argument("--columns", help="objects file is a CSV with these columns, e.g. name=pl_name,epoch=pl_tranmid,period=pl_orbper,duration=pl_trandur,ra=ra,dec=dec (the exoplanet archive's, the default for .csv files)")
+	parser.add_argument("--time-standard", default=eph_timesys.default_standard, help="time standard of the epochs of objects whose catalog entry doesn't give one (# time=BJD_TDB in the comment, or a CSV timesys column), e.g. HJD_UTC (default), BJD_TDB, or JD_UTC for no correction")
+	parser.add_argument("--catalog-cache", action="store_true", help="keep the parsed objects file in <objects>.cache.npz and reuse it until the file changes")
+	parser.add_argument("--twilight-cache", help="file to store/reuse twilight times between runs")
+	parser.add_argument("--almanac", help="directory of per observatory night almanacs (<site>.alm) to read the twilights and night dates from, any missing or not covering the dates are made for the whole years first")
+	parser.add_argument("--consolidated", help="write the per object listings to this one file instead of planet_eph2/")
+	parser.add_argument("--json", help="also write the transits to this JSON file")
+	parser.add_argument("--csv", help="also write the transits to this CSV file")
+	parser.add_argument("--npz", help="also write the transit records to this numpy .npz file")
+	parser.add_argument("--sqlite", help="also store the transits in this SQLite database")
+	parser.add_argument("--incremental", help="state file to reuse the last run's transits from, only new/changed objects and sites and any new dates are worked out")
+	parser.add_argument("--baseline", type=float, default=0., help="hours of out of transit baseline either side of each window to include in the sampling (default 0)")
+	parser.add_argument("--sample-step", type=float, default=5., help="minutes between the altitude/Sun samples across each window (default 5)")
+	parser.add_argument("--min-observable", type=float, default=eph_engine.default_sampling['min_observable'], help="drop transits with less than this fraction of the window (plus baseline, so it changes with --baseline) observable (default %s, keep all)" % (eph_engine.default_sampling['min_observable']))
+	parser.add_argument("--schedule", help="assign the transits to the observatories as a network, one object at a time per telescope, and write the schedule to this file")
+	parser.add_argument("--schedule-overhead", type=float, default=0., help="minutes needed between scheduled windows (plus baseline) at a telescope (default 0)")
+	parser.add_argument("--schedule-type", action="append", choices=sorted(eph_records.type_keys), help="transit type(s) to schedule (default all)")
+	parser.add_argument("--conflicts", help="find the transit windows (plus baseline) overlapping at each observatory, write them with the per night occupancy and free gaps to this JSON file and mark them in the <site>.eph2 listings")
+	parser.add_argument("--profile", help="write the time spent and calls made per stage, site and object to this JSON file")
+	parser.add_argument("--jobs", type=int, default=1, help="number of processes to use (default 1)")
 	args=parser.parse_args()
 
 	return args
 
-# function to get the sunset, sunrise and twilight times
-# assumed astronomical for obvious reasons
-def GetSunTimes(date,lat,lon,elev):
-
-	obs=ephem.Observer()
-	obs.lon=str(lon)
-	obs.lat=str(lat)
-	obs.elev=elev
-	obs.pressure=750
-	obs.horizon = '-0:34'
-	
-	obs.date=date
-	sunset  =obs.next_setting(ephem.Sun()) 
-	sunrise =obs.next_rising(ephem.Sun())  
-	
-	#-6=civil twilight, -12=nautical, -18=astronomical
-	obs.horizon = '-18' 
-	end_evening_twi=obs.next_setting(ephem.Sun(), use_center=True) 
-	start_morning_twi=obs.next_rising(ephem.Sun(), use_center=True) 
-	
-	return obs,sunset,end_evening_twi,start_morning_twi,sunrise
-
-# parse command line
-args=ArgParse()
-
-# check for output directory
-suffix = ".eph2"
-dir = 'planet_eph2'
-if os.path.exists(dir) == False:
-	os.mkdir(dir)
-
-# checks on command line inputs
-if os.path.exists(args.objects) == True:
-	objects = open(args.objects)
-else:
-	print "No objects file %s, exiting..." % (args.objects)
-	sys.exit()
+def main():
+	# start counting
+	start = time.time()
 
-if os.path.exists(args.observatories) == True:
-	observatories = open(args.observatories)
-else:
-	print "No observatories file %s, exiting..." % (args.observatories)
-	sys.exit()
+	# parse command line
+	args=ArgParse()
+	if args.profile:
+		eph_profile.Start()
 
+	# check for output directory
+	suffix = ".eph2"
+	dir = 'planet_eph2'
+	if os.path.exists(dir) == False and not args.consolidated:
+		os.mkdir(dir)
 
-# check for type of start and end dates
-try:
-	startJD=int(args.start)
-	endJD=int(args.end)
-except ValueError:
-	print "Dates in Gregorian format, converting..."
-	startJD=int(ephem.julian_date(args.start))+1
-	endJD=int(ephem.julian_date(args.end))+1
-	print "%s-->%d" % (args.start,startJD)
-	print "%s-->%d" % (args.end,endJD)
-
-if endJD < startJD:
-	print "Date range [%d-->%d] invalid" % (startJD,endJD) 
-	print "Range ends before it starts, exiting..." 
-	sys.exit()
+	# checks on command line inputs
+	if os.path.exists(args.objects) == False:
+		print("No objects file %s, exiting..." % (args.objects))
+		sys.exit()
 
-if len(str(endJD)) != 7 or len(str(startJD)) != 7:
-	print "Invalid JD, check number of digits, exiting..."
-	sys.exit()
+	if os.path.exists(args.observatories) == False:
+		print("No observatories file %s, exiting..." % (args.observatories))
+		sys.exit()
 
+	# check for type of start and end dates
+	try:
+		startJD=int(args.start)
+		endJD=int(args.end)
+	except ValueError:
+		print("Dates in Gregorian format, converting...")
+		startJD=eph_engine.Parse_date(args.start)
+		endJD=eph_engine.Parse_date(args.end)
+		print("%s-->%d" % (args.start,startJD))
+		print("%s-->%d" % (args.end,endJD))
 
-# get date and time tuples
-sdate,stime = JD.Jul_date(startJD)
-edate,etime = JD.Jul_date(endJD)
+	if endJD < startJD:
+		print("Date range [%d-->%d] invalid" % (startJD,endJD))
+		print("Range ends before it starts, exiting...")
+		sys.exit()
 
-# create range string
-obsrange = "%.2i/%.2i/%.4i - %.2i/%.2i/%.4i " % (sdate[0],sdate[1],sdate[2],edate[0],edate[1],edate[2])
+	if len(str(endJD)) != 7 or len(str(startJD)) != 7:
+		print("Invalid JD, check number of digits, exiting...")
+		sys.exit()
 
-# define following useful lists
-lat = [0.,0.,0.]
-lon = [0.,0.,0.]
-RA = [0.,0.,0.]
-Dec = [0.,0.,0.]
+	# get date and time tuples
+	sdate,stime = JD.Jul_date(startJD)
+	edate,etime = JD.Jul_date(endJD)
 
-# set up dictionaries for noontimes in UTC
-# and observatory elevations
-noontime={}
-obselev={}
+	# create range string
+	obsrange = "%.2i/%.2i/%.4i - %.2i/%.2i/%.4i " % (sdate[0],sdate[1],sdate[2],edate[0],edate[1],edate[2])
 
-# loop over all obsevatories in list
-for line in observatories:
-	# read in observatory info
-	if line[0] == '#':
-		continue
-	elif line[0] != '\n' and line[0] != ' ':
-		# for each observatory get its information
+	# read in the objects and observatories
+	targets = eph_engine.Read_objects(args.objects,
+		eph_catalog.Parse_columns(args.columns) if args.columns else None, args.catalog_cache)
+	try:
+		sites = eph_engine.Read_observatories(args.observatories)
+	except ValueError as line:
 		# if looks wrong, warn about the new format of observatory file
+		print("Problem splitting observatory file %s..." % (args.observatories))
+		print(line)
+		print("Ensure the file has the following format with 1 line per observatory:\n")
+		print("\tname latitude longitude alt_limit noondate noontime(UTC) elevation")
+		print("e.g.")
+		print("\tLaPalma 28 40 00 -17 52 00 30. 2014-12-12 12:00:00 2326.\n")
+		print("noondate can be any date in the above format, noontime must be")
+		print("the approximate UTC of noon at the observatory. This is best approximated")
+		print("by 12:00:00 minus the time zone difference")
+		print("Exiting...")
+		sys.exit()
+
+	# the epochs' time standard where the catalog doesn't give it
+	try:
+		standard = eph_timesys.Parse(args.time_standard)
+	except ValueError as error:
+		print("%s, exiting..." % (error))
+		sys.exit()
+	for obj in targets:
+		obj['timesys'] = obj['timesys'] or standard
+
+	# sun times already worked out, per observatory and night
+	twilight_store = eph_twilight.LoadStore(args.twilight_cache)
+
+	# the almanac of each observatory, made or extended as needed
+	almanacs = {}
+	if args.almanac:
+		with eph_profile.stage('almanac'):
+			for site in sites:
+				almanacs[site['name']] = eph_almanac.Ensure(args.almanac, site, startJD, endJD, twilight_store)
+
+	# work out the transits
+	# when running serially and only writing the text files the transits
+	# are streamed straight to the files, the other outputs (and the
+	# incremental state) need them all
+	engine = eph_engine.Engine(targets, sites, twilight_store, args.jobs, {'baseline': args.baseline,
+		'step': args.sample_step, 'min_observable': args.min_observable}, args.almanac)
+	keep = args.calendar or args.consolidated or args.json or args.csv or args.npz or args.sqlite or args.schedule
+	if args.incremental:
+		state = eph_incremental.Load(args.incremental)
+		site_transits,new_sites,new_objects,ranges = eph_incremental.Transits(engine, startJD, endJD, state)
+		print("Incremental: %d new/changed observatories, %d new/changed objects, %d new date ranges" % (len(new_sites),
+			len(new_objects),len(ranges)))
+	elif args.jobs > 1:
+		site_transits = engine.transits(startJD, endJD)
+	else:
+		site_transits = [None] * len(sites)
+
+	# calendars, one for all the observatories or one each
+	calendars = {}
+	if args.calendar:
 		try:
-			observatory,lat[0],lat[1],lat[2],lon[0],lon[1],lon[2],lowlim,obsndate,obsntime,elev = line.split()
-		except ValueError:
-			print "Problem splitting observatory file %s..." % (args.observatories)
-                        print line
-			print "Ensure the file has the following format with 1 line per observatory:\n"
-			print "\tname latitude longitude alt_limit noondate noontime(UTC) elevation"
-			print "e.g."
-			print "\tLaPalma 28 40 00 -17 52 00 30. 2014-12-12 12:00:00 2326.\n"
-			print "noondate can be any date in the above format, noontime must be"
-			print "the approximate UTC of noon at the observatory. This is best approximated"
-			print "by 12:00:00 minus the time zone difference"
-			print "Exiting..."
+			import eph_calendar
+		except ImportError:
+			print("No iCal module, disabling calendar functionality")
+			print("You can install iCal for python using pip\n")
+			print("\tsudo pip install icalendar\n")
+			print("Exiting...")
 			sys.exit()
+		if args.calendar_type:
+			calendar_types = [eph_records.type_keys[t] for t in args.calendar_type]
+		else:
+			calendar_types = eph_calendar.default_types
+		if args.calendar_per_site:
+			for site in sites:
+				calendars[site['name']] = eph_calendar.CalendarFile('%s_%s.ics' % (args.calendar,site['name']),
+					'NITES Transit Calendar (%s)' % (site['name']))
+		else:
+			calendars[None] = eph_calendar.CalendarFile('%s.ics' % (args.calendar))
+
+	site_conflicts = [None] * len(sites)
+	site_nights = [None] * len(sites)
+
+	# output the results for each observatory
+	for s,site in enumerate(sites):
+		observatory = site['name']
+		print("%s [%.6fN:%.6fE]" % (observatory,site['latitude'],site['longitude']))
+		# overlapping windows need all the site's transits up front
+		if args.conflicts and site_transits[s] is None:
+			site_transits[s] = engine.transits(startJD, endJD, [observatory])[0]
+		if site_transits[s] is not None:
+			bounds = eph_output.Object_bounds(site_transits[s], len(targets))
+			blocks = [iter([site_transits[s][bounds[i]:bounds[i+1]]]) for i in range(len(targets))]
+		else:
+			blocks = engine.object_blocks(startJD, endJD, observatory)
+		notes = None
+		if args.conflicts:
+			with eph_profile.stage('conflicts', observatory):
+				site_conflicts[s] = eph_conflicts.Conflicts(site_transits[s], args.baseline)
+				site_nights[s] = site_conflicts[s].nights(site, startJD, endJD, twilight_store)
+				notes = site_conflicts[s].notes()
+			print("%d overlapping groups of transit windows" % (len(site_conflicts[s].conflicts())))
 		
-		# set up some numbers for the calcs to follow	
-		noontime[observatory] = "%s %s" % (obsndate, obsntime)
-		obselev[observatory] = float(elev)
-		latitude = JD.Deg(lat)
-		longitude = JD.Deg(lon)
-		lowlim=float(lowlim)
-		
-		# set up an "Observer" location for moon distance calcs	
-		telescope=ephem.Observer()
-		telescope.lon=str(longitude)
-		telescope.lat=str(latitude)
-		telescope.elev=obselev[observatory]
-		print "%s [%.6fN:%.6fE]" % (observatory,latitude,longitude)
-		
-		# where all the transity stuff will go
-		Transits={}
-
-		# open a per observatory file and create a header
-		obs_output = open(observatory + suffix, "w") 
-		print >> obs_output, "# Visible transits from " + observatory
-		print >> obs_output, "#   Objects :    RA         Dec"
-		objects.seek(0)
-		for line in objects:
-			if line[0] == '#':
-				continue
-			elif line[0] != '\n' and line[0] != ' ':
-				print >> obs_output, "# %10s [%s] [%s]" % (line.split()[0],' '.join(line.split()[4:7]),' '.join(line.split()[7:10]))
-		print >> obs_output, "# Date range : " + obsrange
-		print >> obs_output, "#\n#    HJD          Object      Date     Time/UT      Window",
-		print >> obs_output, "        HA limits             Alt            Transit type?        MoonAng      % Illuminated\n#"
-		
-		# start looping over objects
-		objects.seek(0)
-		for line in objects:
-			if line[0] == '#':
-				continue
-			elif line[0] != '\n' and line[0] != ' ':
-				# for each object do
-				object,HJD,period,duration,RA[0],RA[1],RA[2],Dec[0],Dec[1],Dec[2] = line.split()[:10]
-				HJD,period,duration = float(HJD),float(period),float(duration)
-				ra = JD.Deg(RA)
-				delta = JD.Deg(Dec)		
-		
-				# open a per object file and create a header
-				obj_output = open(dir + "/" + object + "_" + observatory + suffix, "w")
-				print >> obj_output, "# Object : " + object
-				print >> obj_output, "# Observatory : " + observatory
-				print >> obj_output, "# Date range : " + obsrange
-				print >> obj_output, "# Coords : RA " + ' '.join(RA) + ' dec ' + ' '.join(Dec)
-				print >> obj_output, "# Epoch(0) : HJD " + str(HJD)
-				print >> obj_output, "# Period : " + str(period) + " days"
-				print >> obj_output, "# Duration : " + str(duration) + " hrs"
-				print >> obj_output, "#\n#    HJD          Date     Time/UT      Window",
-				print >> obj_output, "       HA limits             Alt            Transit type?        MoonAng      % Illuminated\n#"
-				
-				# make an ephem object per target for moon calcs
-				star=ephem.FixedBody()
-				rin="%s:%s:%s" % (RA[0],RA[1],RA[2])
-				din="%s:%s:%s" % (Dec[0],Dec[1],Dec[2])
-				star._ra=ephem.hours(rin)
-				star._dec=ephem.degrees(din)
-				
-				# now loop over transits
-				while HJD < endJD:
-					HJD += period
-					# calculate times, alts etc
-					date,UT = JD.Jul_date(HJD)
-					
-					# moon separation calcs
-					tnow="%04d/%02d/%02d %02d:%02d:%.2f" % (date[2],date[1],date[0],UT[0],UT[1],UT[2])
-					m=ephem.Moon(tnow)
-					telescope.date = tnow
-					star.compute(telescope)
-					moon_sep=ephem.separation(m,star)
-					sep_calc=str(moon_sep).split(":")
-					moon_sep_deg=JD.Deg(tuple((sep_calc[0],sep_calc[1],sep_calc[2])))
-					
-					hrs = float(UT[0]) + float(UT[1])/60. + float(UT[2])/60./60.
-					LST = JD.Sid_time(HJD, longitude)
-					HA = JD.HA(LST,ra)
-					alt, alt_s, alt_e = JD.Altitude(latitude, delta, HA),JD.Altitude(latitude, delta, HA-duration/2.),JD.Altitude(latitude, delta, HA+duration/2.)
-
-					# send noon of this day to get the sun times
-					twidate="%04d/%02d/%02d %s" % (date[2],date[1],date[0],noontime[observatory].split()[1])
-					noontime[observatory]=twidate
-					obs,t1,t2,t3,t4=GetSunTimes(noontime[observatory],latitude,longitude,obselev[observatory])
-					twi1=JD.Time_to_decimal(tuple(str(t2).split()[1].split(':')))
-					twi2=JD.Time_to_decimal(tuple(str(t3).split()[1].split(':')))
-
-					# only save and print under observable conditions
-					# need to calculate things differently for (twi2<twi1) and vice verca
-					if (twi2 < twi1): # eg La Palma
-						if (HJD > startJD) and (alt>lowlim or alt_s > lowlim or alt_e > lowlim) and (hrs > twi1 or hrs < twi2):
-							# add output string to dicionary
-							window = JD.window(UT, duration)
-							Date = "%.2i/%.2i/%.4i " % (date[0],date[1],date[2]) 
-							HA_alt = JD.HA_alt(HA,duration,alt_s,alt,alt_e) # just returns a string
-							Transits[HJD] = "%10s  %10s %24s %s" % (object,Date,window,HA_alt)
-						
-							# determine what type of transit it is ie Full/partial
-							if (alt_s > lowlim and alt > lowlim and alt_e > lowlim and ((hrs-duration/2.) > twi1 or (hrs-duration/2.) < twi2) and ((hrs+duration/2.) < twi2 or (hrs+duration/2.) > twi1) ):
-								Transits[HJD] += "  Full Transit > %i   " % lowlim
-							elif (alt_s > lowlim) and ((hrs-duration/2.) > twi1 or (hrs-duration/2.) < twi2):
-								if (hrs > twi1 or hrs < twi2) and alt > lowlim:
-									Transits[HJD] += "  Ingress + mid > %i  " % lowlim
-								else:
-									Transits[HJD] += "  Ingress only > %i   " % lowlim
-							elif (alt_e > lowlim) and ((hrs+duration/2.) > twi1 or (hrs+duration/2.) < twi2):
-								if (hrs > twi1 or hrs < twi2) and alt > lowlim:
-									Transits[HJD] += "  Egress + mid > %i   " % lowlim
-								else:
-									Transits[HJD] += "  Egress only > %i    " % lowlim
-							else:
-								Transits[HJD] += "  Mid only? > %i      " % lowlim
-								
-							# add moon
-							Transits[HJD] += "   %03d   " % (int(moon_sep_deg))	
-							Transits[HJD] += "       %03d   " % (int(m.phase))
-								
- 							# now output to file
- 							print >> obj_output, "%.5f  %s" % (HJD, Transits[HJD][12:])
- 					
- 					# need to calculate things differently for (twi2<twi1) and vice verca
-					if (twi2 > twi1): # eg Hawaii
-						if (HJD > startJD) and (alt>lowlim or alt_s > lowlim or alt_e > lowlim) and (hrs > twi1 and hrs < twi2):
-							# add output string to dicionary
-							window = JD.window(UT, duration)
-							Date = "%.2i/%.2i/%.4i " % (date[0],date[1],date[2])
-							HA_alt = JD.HA_alt(HA,duration,alt_s,alt,alt_e)
-							Transits[HJD] = "%10s  %10s %24s %s" % (object,Date,window,HA_alt)
-						
-							# determine what type of transit it is ie Full/partial
-							if (alt_s > lowlim and alt > lowlim and alt_e > lowlim and ((hrs-duration/2.) > twi1 and (hrs-duration/2.) < twi2) and ((hrs+duration/2.) < twi2 and (hrs+duration/2.) > twi1) ):
-								Transits[HJD] += "  Full Transit > %i   " % lowlim
-							elif (alt_s > lowlim) and ((hrs-duration/2.) > twi1 and (hrs-duration/2.) < twi2):
-								if (hrs > twi1 or hrs < twi2) and alt > lowlim:
-									Transits[HJD] += "  Ingress + mid > %i  " % lowlim
-								else:
-									Transits[HJD] += "  Ingress only > %i   " % lowlim
-							elif (alt_e > lowlim) and ((hrs+duration/2.) > twi1 and (hrs+duration/2.) < twi2):
-								if (hrs > twi1 or hrs < twi2) and alt > lowlim:
-									Transits[HJD] += "  Egress + mid > %i   " % lowlim
-								else:
-									Transits[HJD] += "  Egress only > %i    " % lowlim
-							else:
-								Transits[HJD] += "  Mid only? > %i      " % lowlim
- 							
- 							# add moon
-							Transits[HJD] += "   %03d   " % (int(moon_sep_deg))
-							Transits[HJD] += "       %03d   " % (int(m.phase))
- 							
- 							# now output to file
- 							print >> obj_output, "%.5f  %s" % (HJD, Transits[HJD][12:])
-				obj_output.close()
-
-		# calendar outputs 
-		if args.calendar:
-			
-			if observatory != "LaPalma":
-				print "WARNING CALENDAR IS ONLY WORKING FOR LA PALMA OBSERVATIONS SO FAR, BREAKING..."
-				break
-						
-			try:
-				from icalendar import Calendar, Event
-			except ImportError:
-				print "No iCal module, disabling calendar functionality"
-				print "You can install iCal for python using pip\n"
-				print "\tsudo pip install icalendar\n"
-				print "Exiting..."
-				sys.exit()	
-			
-			cal = Calendar()
-			cal.add('version', '2.0')
-			cal.add('prodid', 'meadeCalendar')
-			cal.add('X-WR-CALNAME','NITES Transit Calendar')
-
-				
-		# output sorted observatory list
-		key = sorted(Transits.keys())
-		for HJD in key:
-			print >> obs_output, "%.5f  %s" % (HJD, Transits[HJD])
-		
-			if args.calendar:
-				uid=0
-				for HJD in key:
-					if "Full Transit" in Transits[HJD]:
-						md,mi=Transits[HJD].split()[-2:]
-						
-						# only objects further than 30 deg from the moon!
-						if md >= 30:
-							tar,dmid,tmid,trange,harange,el1,el2,el3,ft1,ft2,ft3,ft4,md,mi=Transits[HJD].split()
-							
-							# correct the night starting date
-							d=datetime(int(dmid.split('/')[2]),int(dmid.split('/')[1]),int(dmid.split('/')[0]),int(tmid.split(':')[0]),int(tmid.split(':')[1]),int(tmid.split(':')[2]))
-							if d.hour <= 12:
-								d=d-timedelta(days=1)	
-							
-							summary="%s\n%s %s %s %s %s %s %s %s %s %s %s %s" % (tar,d,trange,harange,el1,el2,el3,ft1,ft2,ft3,ft4,md,mi)
-								
-							event = Event()
-							event.add('summary', summary)
-							event.add('dtstart', d)
-							event.add('dtend', d+timedelta(hours=1))
-							event.add('dtstamp', datetime.now())
-							event['uid'] = uid 
-							event.add('priority', 5)
-							cal.add_component(event)
-							uid += 1
-		
-		# write out the iCal file
-		if args.calendar:					
-			calname='%s.ics' % (args.calendar)
-			calfile=open(calname,'w')
-			calfile.write(cal.to_ical())
-			calfile.close()				
-			print "Import %s into iCal to see the transits" % (calname)
-		
-		obs_output.close()
+		# output sorted observatory list along with the per object files,
+		# unless they're going in one consolidated file
+		object_files = None
+		if not args.consolidated:
+			object_files = [dir + "/" + obj['name'] + "_" + observatory + suffix for obj in targets]
+		collect = [[] for obj in targets] if keep and site_transits[s] is None else None
+		eph_output.Write_text_stream(observatory + suffix, site, targets, blocks, obsrange, object_files, collect, notes)
+		if collect is not None:
+			site_transits[s] = numpy.concatenate([eph_records.Empty()] + sum(collect, []))
+
+		# calendar events, into the combined calendar or the site's own
+		for key in (None, observatory):
+			if key in calendars:
+				with eph_profile.stage('calendar', observatory):
+					calendars[key].add(site, targets, site_transits[s], calendar_types, args.calendar_moon_sep,
+						args.calendar_min_alt, key is None and len(sites) > 1, almanacs.get(observatory))
+
+	for calendar in calendars.values():
+		calendar.close()
+		print("Import %s into iCal to see the transits" % (calendar.filename))
+
+	# one network schedule for all the observatories
+	if args.schedule:
+		with eph_profile.stage('schedule'):
+			types = [eph_records.type_keys[t] for t in args.schedule_type] if args.schedule_type else None
+			schedule = eph_schedule.Schedule(sites, targets, site_transits, args.baseline,
+				args.schedule_overhead, types)
+			eph_schedule.Write_schedule(args.schedule, sites, targets, schedule,
+				sum(len(records) for records in site_transits))
+		print("%d transits scheduled in %s" % (len(schedule),args.schedule))
+
+	# other output formats
+	if args.consolidated:
+		eph_output.Write_consolidated(args.consolidated, sites, targets, site_transits, obsrange)
+	with eph_profile.stage('io'):
+		if args.conflicts:
+			eph_conflicts.Write_json(args.conflicts, sites, targets, site_conflicts, site_nights)
+		if args.json:
+			eph_output.Write_json(args.json, sites, targets, site_transits)
+		if args.csv:
+			eph_output.Write_csv(args.csv, sites, targets, site_transits)
+		if args.npz:
+			eph_output.Write_npz(args.npz, sites, targets, site_transits)
+		if args.sqlite:
+			eph_store.Write(args.sqlite, sites, targets, site_transits, startJD, endJD)
+
+		# keep the transits for the next incremental run
+		if args.incremental:
+			eph_incremental.Save(args.incremental, sites, targets, site_transits, startJD, endJD, engine.sampling)
 
-# close the open files
-observatories.close()
-objects.close()
+		# keep the sun times for next time
+		if args.twilight_cache:
+			eph_twilight.SaveStore(args.twilight_cache, twilight_store)
 
-# show time elapsed
-end = time.time()
-print "t = %im %.1fs" % (int((end - start)/60),(end - start)%60)
+	# show time elapsed
+	end = time.time()
+	print("t = %im %.1fs" % (int((end - start)/60),(end - start)%60))
+	if args.profile:
+		eph_profile.Stop().write(args.profile)
+		print("Profile written to %s" % (args.profile))
 
+if __name__ == '__main__':
+	main()
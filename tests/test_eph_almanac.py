@@ -0,0 +1,125 @@
+import os
+import sys
+import shutil
+import struct
+import tempfile
+import subprocess
+import unittest
+import numpy
+import eph_engine
+import eph_almanac
+
+repo_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, os.path.join(repo_dir, 'utils'))
+import whatsUpTonight
+
+"""
+Checks of the night almanacs: written and read back through the
+memory map, the same records read with struct (as whatsUpTonight.py
+does) and the same listings from ephemeris2.py with and without them
+"""
+
+# sites both sides of the equator with noons away from 12:00 UT
+observatories = """LaPalma 28 40 00 -17 52 00 35. 2014-12-12 12:00:00 2326
+Paranal -24 37 38 -70 24 15 30. 2014-12-12 08:00:00 2518
+TNT 18 34 00 98 28 00 20. 2014-12-12 19:00:00 2457
+"""
+
+##################################
+
+def Same(a, b):
+	# record arrays equal field by field, NaNs matching
+	for field in eph_almanac.night_fields:
+		x, y = numpy.asarray(a[field]), numpy.asarray(b[field])
+		if not ((x == y) | ((x != x) & (y != y))).all():
+			return False
+	return True
+
+##################################
+
+class AlmanacTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.dir = tempfile.mkdtemp(prefix='eph_almanac')
+		cls.observatories = os.path.join(cls.dir, 'observatories')
+		with open(cls.observatories, 'w') as f:
+			f.write(observatories)
+		cls.sites = eph_engine.Read_observatories(cls.observatories)
+		cls.records = [eph_almanac.Build(site, 2457700., 2457760.) for site in cls.sites]
+		for site,records in zip(cls.sites, cls.records):
+			eph_almanac.Write(eph_almanac.Filename(cls.dir, site), site, records)
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.dir)
+
+	def test_round_trip(self):
+		for site,records in zip(self.sites, self.records):
+			almanac = eph_almanac.Open(self.dir, site)
+			self.assertIsNotNone(almanac)
+			self.assertIsInstance(almanac.nights, numpy.memmap)
+			self.assertEqual(almanac.first, records['night'][0])
+			self.assertEqual(len(almanac.nights), len(records))
+			self.assertTrue(Same(almanac.nights, records))
+			self.assertTrue(almanac.covers(2457701., 2457759.))
+			self.assertFalse(almanac.covers(2457690., 2457759.))
+			# each JD finds the night starting at the last noontime
+			noon = eph_almanac.Noon_hours(site['noontime']) / 24.
+			for night in (2457710, 2457740):
+				self.assertEqual(almanac.night(night - 0.5 + noon + 1e-6)['night'], night)
+				self.assertEqual(almanac.night(night - 0.5 + noon - 1e-6)['night'], night - 1)
+
+	def test_other_site(self):
+		# a file made for different site details isn't used
+		site = dict(self.sites[0], elev=self.sites[0]['elev'] + 1.)
+		self.assertIsNone(eph_almanac.Open(self.dir, site))
+		site = dict(self.sites[0], noontime='13:00:00')
+		self.assertIsNone(eph_almanac.Open(self.dir, site))
+
+	def test_struct(self):
+		# the layout whatsUpTonight.py reads without numpy
+		self.assertEqual(struct.calcsize(eph_almanac.night_format), eph_almanac.night_dtype.itemsize)
+		self.assertEqual(whatsUpTonight.almanac_night, eph_almanac.night_format)
+		self.assertEqual(whatsUpTonight.almanac_fields, eph_almanac.night_fields)
+		for site in self.sites:
+			filename = eph_almanac.Filename(self.dir, site)
+			almanac = eph_almanac.Open(self.dir, site)
+			self.assertEqual(whatsUpTonight.almanacNoon(filename), almanac.noon)
+			with open(filename, 'rb') as f:
+				data = f.read()
+			size = struct.calcsize(eph_almanac.night_format)
+			for i in range(len(almanac.nights)):
+				values = struct.unpack_from(eph_almanac.night_format, data, eph_almanac.header_size + i * size)
+				read = dict(zip(eph_almanac.night_fields, values))
+				self.assertTrue(Same(read, almanac.nights[i]))
+				self.assertTrue(Same(whatsUpTonight.readAlmanac(filename, int(almanac.nights['night'][i])), read))
+			self.assertIsNone(whatsUpTonight.readAlmanac(filename, int(almanac.nights['night'][-1]) + 1))
+
+	def test_listings(self):
+		# ephemeris2.py gives the same listings with and without them
+		runs = []
+		for extra in ([], ['--almanac', os.path.join(self.dir, 'run_almanac')]):
+			run = tempfile.mkdtemp(dir=self.dir)
+			subprocess.check_output([sys.executable, os.path.join(repo_dir, 'ephemeris2.py'),
+				os.path.join(repo_dir, 'targets', 'Planets'), self.observatories,
+				'2016-12-01', '2016-12-31'] + extra, cwd=run, stderr=subprocess.STDOUT)
+			runs.append(run)
+		self.assertTrue(os.path.exists(os.path.join(self.dir, 'run_almanac', 'TNT.alm')))
+		for site in self.sites:
+			listings = []
+			for run in runs:
+				with open(os.path.join(run, site['name'] + '.eph2')) as f:
+					listings.append(f.read())
+			self.assertGreater(listings[0].count('\n'), 50)
+			self.assertEqual(listings[0], listings[1])
+		names = sorted(os.listdir(os.path.join(runs[0], 'planet_eph2')))
+		self.assertEqual(names, sorted(os.listdir(os.path.join(runs[1], 'planet_eph2'))))
+		for name in names:
+			with open(os.path.join(runs[0], 'planet_eph2', name)) as f, open(os.path.join(runs[1], 'planet_eph2', name)) as g:
+				self.assertEqual(f.read(), g.read(), name)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+import eph_catalog
+
+"""
+Checks of the CSV catalogs: the same coordinates given as decimals
+(degrees or hours) or in the colon, space and h/m/s sexagesimal forms
+come out the same, and the same as the targets/ format
+"""
+
+# WASP-12 b as 06 30 32.79 +29 40 20.4 in each form
+ra_hours = 6. + 30./60. + 32.79/3600.
+dec_degrees = 29. + 40./60. + 20.4/3600.
+forms = [('%.8f' % (ra_hours * 15.), '%.8f' % (dec_degrees)), ('06:30:32.79', '+29:40:20.4'),
+	('06 30 32.79', '+29 40 20.4'), ('06h30m32.79s', '+29d40m20.4s')]
+
+##################################
+
+class CsvTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp(prefix='eph_catalog')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def write(self, rows, header='pl_name,pl_tranmid,pl_orbper,pl_trandur,ra,dec'):
+		filename = os.path.join(self.dir, 'cat.csv')
+		with open(filename, 'w') as f:
+			f.write(header + '\n' + ''.join(','.join(row) + '\n' for row in rows))
+		return filename
+
+	def test_forms(self):
+		# the archive default of decimal RAs in degrees, the sexagesimal
+		# ones are hours whatever ra_unit says
+		rows = [('WASP-12 b', '2454508.97682', '1.0914203', '3.0', '"%s"' % (ra), '"%s"' % (dec)) for ra,dec in forms]
+		catalog = eph_catalog.Load(self.write(rows))
+		self.assertEqual(len(catalog), len(forms))
+		for i in range(len(forms)):
+			self.assertAlmostEqual(catalog.ra[i], ra_hours, 7, forms[i])
+			self.assertAlmostEqual(catalog.dec[i], dec_degrees, 7, forms[i])
+			self.assertEqual(catalog.RA[i], '06 30 33')
+			self.assertEqual(catalog.Dec[i], '+29 40 20')
+			self.assertEqual(catalog.name[i], 'WASP-12b')
+
+	def test_hours(self):
+		# decimal RAs in hours with ra_unit=hours
+		rows = [('WASP-12 b', '2454508.97682', '1.0914203', '3.0', '%.8f' % (ra_hours), '%.8f' % (dec_degrees)),
+			('WASP-12 b', '2454508.97682', '1.0914203', '3.0', '06h30m32.79s', '+29d40m20.4s')]
+		catalog = eph_catalog.Load(self.write(rows), {'ra_unit': 'hours'})
+		for i in range(len(rows)):
+			self.assertAlmostEqual(catalog.ra[i], ra_hours, 7)
+
+	def test_negative(self):
+		# a Dec just south of the equator keeps its sign in every form
+		rows = [('T b', '2454508.', '1.', '3.', ra, dec) for ra,dec in
+			(('97.5', '-0.34277778'), ('06:30:00', '-00:20:34'), ('06 30 00', '-00 20 34'), ('06h30m00s', '-00d20m34s'))]
+		catalog = eph_catalog.Load(self.write(rows))
+		for i in range(len(rows)):
+			self.assertAlmostEqual(catalog.ra[i], 6.5, 9)
+			self.assertAlmostEqual(catalog.dec[i], -(20./60. + 34./3600.), 6)
+			self.assertEqual(catalog.Dec[i], '-00 20 34')
+
+	def test_targets(self):
+		# as the same object in the targets/ format
+		filename = os.path.join(self.dir, 'cat')
+		with open(filename, 'w') as f:
+			f.write('WASP-12b  2454508.97682  1.0914203  3.0  06 30 32.79  +29 40 20.4\n')
+		text = eph_catalog.Load(filename)
+		rows = [('WASP-12 b', '2454508.97682', '1.0914203', '3.0', '06h30m32.79s', '+29d40m20.4s')]
+		csv = eph_catalog.Load(self.write(rows))
+		self.assertAlmostEqual(csv.ra[0], text.ra[0], 12)
+		self.assertAlmostEqual(csv.dec[0], text.dec[0], 12)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+import numpy
+import eph_records
+import eph_conflicts
+
+"""
+Checks of the sort and sweep conflict finding against pairwise
+comparisons of random windows, of the depth counting, of touching and
+gapped windows and of the free gaps in the nights
+"""
+
+# a site at 50N on the Greenwich meridian
+site = {'name': 'Test', 'latitude': 50., 'longitude': 0., 'lowlim': 21., 'noontime': '12:00:00', 'elev': 0.}
+
+##################################
+
+def Windows(rng, n, days=5.):
+	# random windows on a 5 minute grid so some start where others end
+	starts = numpy.round(rng.uniform(0., days, n) * 288.) / 288.
+	ends = starts + numpy.round(rng.uniform(1., 6., n) * 12.) / 288.
+	return starts, ends
+
+##################################
+
+def Records(starts, ends):
+	records = eph_records.Empty(len(starts))
+	records['object'] = numpy.arange(len(starts))
+	records['start'], records['end'] = starts, ends
+	records['hjd'] = 0.5 * (starts + ends)
+	return records
+
+##################################
+
+def Pairs(starts, ends):
+	# which windows overlap which, touching ones not
+	return (starts[:,numpy.newaxis] < ends) & (starts < ends[:,numpy.newaxis]) & ~numpy.eye(len(starts), dtype=bool)
+
+##################################
+
+def Components(pairs):
+	# group of each window, as the connected sets of overlapping ones
+	group = numpy.arange(len(pairs))
+	changed = True
+	while changed:
+		linked = numpy.where(pairs, group, len(pairs)).min(axis=1)
+		new = numpy.minimum(group, linked)
+		changed = (new != group).any()
+		group = new
+	return group
+
+##################################
+
+class SweepTest(unittest.TestCase):
+
+	def test_random(self):
+		rng = numpy.random.RandomState(19)
+		for n in (1, 2, 10, 300):
+			starts, ends = Windows(rng, n)
+			pairs = Pairs(starts, ends)
+			self.assertEqual(list(eph_conflicts.Overlapping(starts, ends)), list(pairs.sum(axis=1)))
+			# the same partition as the pairwise components
+			group = eph_conflicts.Sweep(starts, ends)
+			components = Components(pairs)
+			self.assertTrue(((group[:,numpy.newaxis] == group) == (components[:,numpy.newaxis] == components)).all())
+			# numbered in order of start
+			first = [starts[group == g].min() for g in range(group.max() + 1)]
+			self.assertEqual(first, sorted(first))
+
+	def test_depth(self):
+		# the most open at once, counted at every start
+		rng = numpy.random.RandomState(3)
+		starts, ends = Windows(rng, 200)
+		group = eph_conflicts.Sweep(starts, ends)
+		n = group.max() + 1
+		depth = eph_conflicts.Depth(starts, ends, group, n)
+		open_at = ((starts[:,numpy.newaxis] <= starts) & (starts < ends[:,numpy.newaxis])).sum(axis=0)
+		expected = numpy.zeros(n, dtype=int)
+		numpy.maximum.at(expected, group, open_at)
+		self.assertEqual(list(depth), list(expected))
+
+	def test_touching(self):
+		# one ending as the next starts don't conflict, a minute later
+		# they do, a gap splits them
+		for second, groups, overlapping, depth in ((1., [0, 1], [0, 0], [1, 1]),
+				(1. - 1./1440., [0, 0], [1, 1], [2]), (1.1, [0, 1], [0, 0], [1, 1])):
+			conflicts = eph_conflicts.Conflicts(Records(numpy.array([0.5, second]), numpy.array([1., second + 0.1])))
+			self.assertEqual(list(conflicts.group), groups)
+			self.assertEqual(list(conflicts.overlapping), overlapping)
+			self.assertEqual(list(conflicts.depth), depth)
+			self.assertEqual(len(conflicts.conflicts()), 1 if len(depth) == 1 else 0)
+
+	def test_baseline(self):
+		# a gap less than twice the baseline becomes a conflict
+		records = Records(numpy.array([0.5, 0.6]), numpy.array([0.55, 0.65]))
+		self.assertEqual(len(eph_conflicts.Conflicts(records).conflicts()), 0)
+		conflicts = eph_conflicts.Conflicts(records, baseline=0.7)
+		self.assertEqual(list(conflicts.members(conflicts.conflicts()[0])), [0, 1])
+
+##################################
+
+class NightsTest(unittest.TestCase):
+
+	def test_gaps(self):
+		# the gaps and busy time add up to the dark time, the gaps
+		# falling between the windows
+		night = 2457739
+		dusk, dawn = eph_conflicts.Dark_times(site, [night])[0]
+		starts = numpy.array([dusk - 0.02, dusk + 0.1, dusk + 0.15, dusk + 0.3])
+		ends = numpy.array([dusk + 0.05, dusk + 0.2, dusk + 0.18, dusk + 0.35])
+		conflicts = eph_conflicts.Conflicts(Records(starts, ends))
+		out = conflicts.nights(site)
+		self.assertEqual(len(out), 1)
+		self.assertEqual(out[0]['night'], night)
+		self.assertEqual(out[0]['transits'], 4)
+		self.assertEqual(out[0]['most_at_once'], 2)
+		gaps = out[0]['gaps']
+		self.assertEqual(len(gaps), 3)
+		for (s, e), (ws, we) in zip(gaps, [(dusk + 0.05, dusk + 0.1), (dusk + 0.2, dusk + 0.3), (dusk + 0.35, dawn)]):
+			self.assertAlmostEqual(s, ws, 9)
+			self.assertAlmostEqual(e, we, 9)
+		free = sum(e - s for s,e in gaps) * 24.
+		self.assertAlmostEqual(free + out[0]['busy_hours'], out[0]['dark_hours'], 6)
+		self.assertAlmostEqual(out[0]['busy_hours'], (0.05 + 0.1 + 0.05) * 24., 6)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import numpy
+import eph_functions as JD
+import eph_engine
+import eph_records
+import eph_moon
+import eph_prefilter
+
+"""
+Checks of the window sampling and the transit types and observable
+fractions worked out from it
+"""
+
+# a site at 50N on the Greenwich meridian and a night in December, dark
+# for hours either side of 00:00 UT
+site = {'name': 'Test', 'latitude': 50., 'longitude': 0., 'lowlim': 21., 'noontime': '12:00:00', 'elev': 0.}
+midnight = 2457739.5
+moon = eph_moon.MoonTable(midnight - 1., midnight + 1.)
+
+##################################
+
+def Target(hour_angle, dec, duration):
+	# a target with no time standard correction at hour_angle (hours)
+	# from the site at midnight
+	ra = (float(JD.Sid_time_array(midnight, site['longitude'])) - hour_angle) % 24.
+	return {'name': 'Target', 'ra': ra, 'dec': dec, 'duration': duration, 'timesys': 'JD_UTC'}
+
+##################################
+
+def Records(obj, **sampling):
+	return eph_engine.Transit_records(site, obj, 0, numpy.array([midnight]), moon, None,
+		dict(eph_engine.default_sampling, **sampling))
+
+##################################
+
+class SampleOffsetsTest(unittest.TestCase):
+
+	def test_window(self):
+		offsets, inside = eph_engine.Sample_offsets(3., 0., 5.)
+		self.assertTrue(inside.all())
+		self.assertEqual(len(offsets) % 2, 1)
+		self.assertEqual((offsets[0], offsets[len(offsets)//2], offsets[-1]), (-1.5, 0., 1.5))
+		self.assertLessEqual(numpy.diff(offsets).max(), 5./60. + 1e-12)
+
+	def test_baseline(self):
+		# the baseline widens the span either side, the window itself
+		# is sampled the same
+		window, window_inside = eph_engine.Sample_offsets(3., 0., 5.)
+		offsets, inside = eph_engine.Sample_offsets(3., 1., 5.)
+		self.assertAlmostEqual(offsets[0], -2.5)
+		self.assertAlmostEqual(offsets[-1], 2.5)
+		self.assertEqual(list(offsets[inside]), list(window))
+		self.assertLessEqual(numpy.diff(offsets).max(), 5./60. + 1e-12)
+		self.assertTrue((numpy.diff(offsets) > 0.).all())
+
+##################################
+
+class SampleTypesTest(unittest.TestCase):
+
+	def types(self, *rows):
+		return list(eph_engine.Sample_types(numpy.array(rows, dtype=bool), numpy.ones(len(rows[0]), dtype=bool)))
+
+	def test_types(self):
+		self.assertEqual(self.types([1, 1, 1, 1, 1], [1, 1, 1, 0, 1], [1, 0, 1, 1, 1], [1, 0, 1, 0, 1],
+			[0, 0, 1, 1, 1], [1, 1, 0, 0, 0], [0, 0, 1, 0, 0], [0, 0, 0, 0, 0], [0, 1, 0, 0, 0]),
+			[eph_records.FULL, eph_records.INGRESS_MID, eph_records.EGRESS_MID, eph_records.INGRESS,
+			eph_records.EGRESS_MID, eph_records.INGRESS, eph_records.MID, eph_records.NOT_VISIBLE,
+			eph_records.MID])
+
+	def test_baseline_ignored(self):
+		# only the samples inside the window set the type
+		observable = numpy.array([[0, 1, 1, 1, 0], [1, 0, 0, 0, 1]], dtype=bool)
+		inside = numpy.array([0, 1, 1, 1, 0], dtype=bool)
+		self.assertEqual(list(eph_engine.Sample_types(observable, inside)), [eph_records.FULL, eph_records.NOT_VISIBLE])
+
+##################################
+
+class TransitRecordsTest(unittest.TestCase):
+
+	def test_dip(self):
+		# circumpolar at 50N, dec 60 gets down to 20 deg at lower
+		# culmination, 1.5 hours after mid-time here. The start, middle
+		# and end are all above the 21 deg limit but it dips below
+		# between the middle and the end
+		obj = Target(10.5, 60., 6.)
+		records = Records(obj, min_observable=0.)
+		self.assertEqual(len(records), 1)
+		for alt in ('alt_start', 'alt_mid', 'alt_end'):
+			self.assertGreater(records[alt][0], site['lowlim'])
+		self.assertEqual(records['type'][0], eph_records.INGRESS_MID)
+		self.assertLess(records['observable'][0], 1.)
+		self.assertGreater(records['observable'][0], 0.5)
+		self.assertAlmostEqual(records['min_alt'][0], 20., delta=0.05)
+		self.assertLess(records['min_alt'][0], site['lowlim'])
+
+	def test_full(self):
+		# near the meridian for the whole window
+		records = Records(Target(0., 40., 3.))
+		self.assertEqual(records['type'][0], eph_records.FULL)
+		self.assertEqual(records['observable'][0], 1.)
+		self.assertAlmostEqual(records['alt_mid'][0], 80., delta=0.05)
+		self.assertAlmostEqual(records['min_alt'][0], min(records['alt_start'][0], records['alt_end'][0]))
+
+	def test_baseline(self):
+		# the baseline is sampled too, so goes into the observable
+		# fraction and the lowest altitude but not the type
+		obj = Target(4., 30., 3.)
+		plain = Records(obj)
+		padded = Records(obj, baseline=2.)
+		self.assertEqual(plain['type'][0], eph_records.FULL)
+		self.assertEqual(padded['type'][0], eph_records.FULL)
+		self.assertEqual(plain['observable'][0], 1.)
+		self.assertLess(padded['observable'][0], 1.)
+		self.assertLess(padded['min_alt'][0], plain['min_alt'][0])
+		self.assertGreater(padded['max_airmass'][0], plain['max_airmass'][0])
+
+	def test_min_observable(self):
+		# only the end of the window above the limit
+		obj = Target(-5.2, 10., 3.)
+		records = Records(obj, min_observable=0.)
+		self.assertEqual(records['type'][0], eph_records.EGRESS)
+		self.assertEqual(len(Records(obj, min_observable=records['observable'][0] + 0.01)), 0)
+		# kept by default, whatever the baseline
+		self.assertEqual(len(Records(obj)), 1)
+		self.assertEqual(len(Records(obj, baseline=3.)), 1)
+
+	def test_twilight(self):
+		# on the meridian at 05:30 UT, the window runs into morning
+		# twilight (just before 06:00) after the mid-time
+		obj = Target(-5.5 * eph_prefilter.sidereal_rate / 24., 40., 3.)
+		records = eph_engine.Transit_records(site, obj, 0, numpy.array([midnight + 5.5/24.]), moon, None,
+			dict(eph_engine.default_sampling, min_observable=0.))
+		self.assertAlmostEqual(records['alt_mid'][0], 80., delta=0.05)
+		self.assertEqual(records['type'][0], eph_records.INGRESS_MID)
+		self.assertLess(records['observable'][0], 1.)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
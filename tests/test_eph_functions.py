@@ -0,0 +1,157 @@
+import datetime
+import unittest
+import numpy
+import eph_functions as JD
+
+"""
+Checks of the array versions of Jul_date, Sid_time, HA and Altitude
+against the scalar ones, to the tolerances stated in eph_functions,
+and of Sexagesimal against Deg
+"""
+
+# random JDs from 1900 to 2100, longitudes, latitudes and RA/Dec over
+# both hemispheres
+rng = numpy.random.RandomState(2016)
+n = 5000
+JDs = rng.uniform(2415020.5, 2488069.5, n)
+longitudes = rng.uniform(-180., 180., n)
+latitudes = rng.uniform(-90., 90., n)
+RAs = rng.uniform(0., 24., n)
+decs = rng.uniform(-90., 90., n)
+
+##################################
+
+def Seconds(date, time):
+	# seconds since 0001-01-01 of a Jul_date result
+	(d, m, y), (h, mins, secs) = date, time
+	return datetime.date(int(y), int(m), int(d)).toordinal() * 86400. + h*3600. + mins*60. + secs
+
+##################################
+
+def Wrapped(a, b, period):
+	# difference of a and b on a circle of the period
+	return numpy.mod(numpy.asarray(a) - b + period/2., period) - period/2.
+
+##################################
+
+class JulDateTest(unittest.TestCase):
+
+	def check(self, times):
+		(d, m, y), (h, mins, secs) = JD.Jul_date_array(times)
+		for i,t in enumerate(times):
+			date, time = JD.Jul_date(t)
+			self.assertEqual((d[i], m[i], y[i]), date)
+			self.assertEqual((h[i], mins[i]), time[:2])
+			self.assertAlmostEqual(secs[i], time[2], delta=1e-6)
+			self.assertTrue(0 <= h[i] < 24 and 0 <= mins[i] < 60 and 0. <= secs[i] < 60.)
+
+	def test_random(self):
+		self.check(JDs)
+
+	def test_rollover(self):
+		# either side of UT midnight (the date changes) and of noon (the
+		# JD's day changes), on whole minutes and seconds and just short
+		# of them
+		days = numpy.floor(JDs[:200])
+		minutes = rng.randint(0, 1440, len(days)) / 1440.
+		seconds = rng.randint(0, 86400, len(days)) / 86400.
+		times = numpy.concatenate([days + 0.5 - 1e-9, days + 0.5 + 1e-9, days + 1e-9, days - 1e-9,
+			days + minutes, days + minutes - 1e-9, days + seconds, days + seconds - 1e-9])
+		self.check(times)
+
+	def test_whole_jd(self):
+		# the scalar version moves a JD with no fractional part on a day,
+		# the array version gives 12:00 UT on the right date
+		for t in numpy.floor(JDs[:200]):
+			(d, m, y), (h, mins, secs) = JD.Jul_date_array(numpy.array([t]))
+			date, time = JD.Jul_date(t + 1e-9)
+			self.assertEqual((d[0], m[0], y[0]), date)
+			self.assertEqual((h[0], mins[0]), (12, 0))
+			self.assertAlmostEqual(secs[0], 0., delta=1e-3)
+			self.assertAlmostEqual(Seconds((d[0], m[0], y[0]), (h[0], mins[0], secs[0])),
+				Seconds(*JD.Jul_date(t)) - 86400., delta=1e-3)
+
+##################################
+
+class SidTimeTest(unittest.TestCase):
+
+	def test_random(self):
+		# the scalar version only brings the LST down to 24, so compare
+		# around the circle (it's left negative before J2000)
+		LSTs = JD.Sid_time_array(JDs, longitudes)
+		scalar = numpy.array([JD.Sid_time(t, l) for t,l in zip(JDs, longitudes)])
+		self.assertTrue((LSTs >= 0.).all() and (LSTs < 24.).all())
+		self.assertLess(numpy.abs(Wrapped(LSTs, scalar, 24.)).max(), 1e-9)
+		after = JDs > 2451545.
+		self.assertLess(numpy.abs(LSTs - scalar)[after & (scalar < 24.)].max(), 1e-9)
+
+	def test_scalar_input(self):
+		self.assertAlmostEqual(float(JD.Sid_time_array(2457724.5, -17.88)), JD.Sid_time(2457724.5, -17.88), delta=1e-9)
+
+##################################
+
+class HATest(unittest.TestCase):
+
+	def test_random(self):
+		LSTs = JD.Sid_time_array(JDs, longitudes)
+		HAs = JD.HA_array(LSTs, RAs)
+		scalar = numpy.array([JD.HA(lst, ra) for lst,ra in zip(LSTs, RAs)])
+		self.assertTrue((HAs >= -12.).all() and (HAs < 12.).all())
+		self.assertLess(numpy.abs(HAs - scalar).max(), 1e-9)
+
+	def test_edges(self):
+		# +12 in the scalar version is -12 here, the same hour angle
+		self.assertEqual(JD.HA(18., 6.), 12.)
+		self.assertEqual(float(JD.HA_array(18., 6.)), -12.)
+
+##################################
+
+class AltitudeTest(unittest.TestCase):
+
+	def test_random(self):
+		HAs = JD.HA_array(JD.Sid_time_array(JDs, longitudes), RAs)
+		alts = JD.Altitude(latitudes, decs, HAs)
+		scalar = numpy.array([JD.Altitude(float(lat), float(dec), float(ha))
+			for lat,dec,ha in zip(latitudes, decs, HAs)])
+		self.assertLess(numpy.abs(alts - scalar).max(), 1e-9)
+		for hemisphere in (latitudes < 0., latitudes >= 0.):
+			self.assertTrue(hemisphere.any())
+			self.assertLess(numpy.abs(alts - scalar)[hemisphere].max(), 1e-9)
+
+	def test_meridian(self):
+		# on the meridian the altitude is 90 less the zenith distance
+		alts = JD.Altitude(latitudes, decs, numpy.zeros(n))
+		self.assertLess(numpy.abs(alts - (90. - numpy.abs(latitudes - decs))).max(), 1e-6)
+
+##################################
+
+class SexagesimalTest(unittest.TestCase):
+
+	def test_round_trip(self):
+		# back through Deg to within half the last place shown, away
+		# from the -0 degrees Deg gets wrong
+		values = numpy.concatenate([RAs, decs])
+		values = values[numpy.abs(values) >= 1.]
+		for decimals in (0, 2):
+			for v in values:
+				text = JD.Sexagesimal(v, sign=True, decimals=decimals)
+				self.assertLess(abs(JD.Deg(text.split()) - v), (0.5 + 1e-6) * 10**-decimals / 3600.)
+				self.assertLess(float(text.split()[2]), 60.)
+
+	def test_carry(self):
+		# seconds rounding up to 60 carry into the minutes and degrees
+		self.assertEqual(JD.Sexagesimal(10. + 59./60. + 59.9999/3600.), '11 00 00')
+		self.assertEqual(JD.Sexagesimal(10. + 59./60. + 59.9999/3600., decimals=2), '11 00 00.00')
+		self.assertEqual(JD.Sexagesimal(-(59./60. + 59.6/3600.), sign=True), '-01 00 00')
+		self.assertEqual(JD.Sexagesimal(23.9999999), '24 00 00')
+		self.assertEqual(JD.Sexagesimal(12. + 34./60. + 56.786/3600., sign=True, decimals=2), '+12 34 56.79')
+
+	def test_catalog(self):
+		# as the Planets catalog gives them
+		self.assertEqual(JD.Sexagesimal(JD.Deg(('06', '30', '32.79')), decimals=2), '06 30 32.79')
+		self.assertEqual(JD.Sexagesimal(JD.Deg(('-24', '37', '37')), sign=True), '-24 37 37')
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import numpy
+import eph_engine
+import eph_moon
+import eph_prefilter
+
+"""
+Checks that the prefilter only rules out transits the sampling would
+drop anyway: the engine's records with and without it are the same
+for circumpolar, never rising, seasonal and borderline targets at
+sites from the tropics to inside the arctic circle
+"""
+
+# sites either side of the equator, one with no dark nights in summer
+# and one with noon well away from 12:00 UT
+sites = [{'name': 'North', 'latitude': 50., 'longitude': -5., 'lowlim': 30., 'noontime': '12:00:00', 'elev': 0.},
+	{'name': 'South', 'latitude': -30., 'longitude': -70., 'lowlim': 25., 'noontime': '16:00:00', 'elev': 2000.},
+	{'name': 'Arctic', 'latitude': 69., 'longitude': 19., 'lowlim': 20., 'noontime': '11:00:00', 'elev': 0.},
+	{'name': 'East', 'latitude': 18.5, 'longitude': 98.5, 'lowlim': 20., 'noontime': '05:00:00', 'elev': 2457.}]
+
+# a year, and the same with a baseline
+startJD, endJD = 2457754.5, 2458119.5
+samplings = [{}, {'baseline': 1.5}]
+
+##################################
+
+def Objects(rng, site, n):
+	# targets over the sky plus circumpolar ones, ones that never rise
+	# above the site's limit and ones culminating just either side of it
+	lat, lowlim = site['latitude'], site['lowlim']
+	hemisphere = 1. if lat >= 0. else -1.
+	decs = list(rng.uniform(-90., 90., n))
+	decs += [hemisphere * 85., hemisphere * (95. - abs(lat)), -hemisphere * 80.]
+	decs += [lat - hemisphere * (90. - lowlim) + d for d in (-0.05, 0.05, 0.5)]
+	objects = []
+	for i,dec in enumerate(decs):
+		objects.append({'name': 'T%03d' % (i), 'epoch': 2457000. + rng.uniform(0., 10.),
+			'period': rng.uniform(0.5, 5.), 'duration': rng.uniform(1., 6.), 'ra': rng.uniform(0., 24.),
+			'dec': float(numpy.clip(dec, -89.9, 89.9)), 'timesys': ['', 'BJD_TDB', 'JD_UTC'][i % 3]})
+	return objects
+
+##################################
+
+class PrefilterTest(unittest.TestCase):
+
+	def test_same_records(self):
+		rng = numpy.random.RandomState(25)
+		moon = eph_moon.MoonTable(startJD - 1., endJD + 1.)
+		examined = kept = total = 0
+		for site in sites:
+			twilight = eph_engine.Twilights(site, startJD, endJD, {})
+			prefilter = eph_engine.Prefilter(site, startJD, endJD, twilight)
+			objects = Objects(rng, site, 40)
+			self.assertFalse(all(prefilter.can_rise(obj) for obj in objects))
+			for sampling in samplings:
+				sampling = dict(eph_engine.default_sampling, **sampling)
+				for i,obj in enumerate(objects):
+					plain = eph_engine.Object_transits(site, obj, i, startJD, endJD, moon, None, sampling)
+					if not prefilter.can_rise(obj):
+						self.assertEqual(len(plain), 0, (site['name'], obj))
+						continue
+					filtered = eph_engine.Object_transits(site, obj, i, startJD, endJD, moon, prefilter, sampling)
+					self.assertEqual(filtered.tobytes(), plain.tobytes(), (site['name'], obj))
+					examined += len(plain)
+			# the prefilter does rule transits out
+			times = numpy.arange(startJD, endJD, 0.37)
+			kept += sum(prefilter.inside(obj, times).sum() for obj in objects if prefilter.can_rise(obj))
+			total += len(times) * len(objects)
+		self.assertGreater(examined, 1000)
+		self.assertLess(kept, 0.7 * total)
+
+	def test_half_arc(self):
+		# always up, never up and an object on the limit at culmination
+		self.assertEqual(eph_prefilter.Half_arc(50., 85., 30.), 12.)
+		self.assertEqual(eph_prefilter.Half_arc(50., -50., 30.), 0.)
+		self.assertAlmostEqual(eph_prefilter.Half_arc(50., 10., 50.), 0., 6)
+		self.assertAlmostEqual(float(eph_prefilter.Max_altitude(50., 10.)), 50.)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import eph_catalog
+import eph_refine
+
+"""
+Checks of the catalog refinement on synthetic timings of known
+ephemerides: the recovered epochs and periods and their pulls, the
+clipping of an outlier, the cycle numbers across a gap and the
+rewritten catalog
+"""
+
+##################################
+
+def Catalog(epochs, periods):
+	# a Catalog of the ephemerides, named T000 on
+	n = len(epochs)
+	names = ['T%03d' % (i) for i in range(n)]
+	return eph_catalog.Catalog(names, epochs, periods, numpy.full(n, 2.), numpy.zeros(n), numpy.zeros(n),
+		['00 00 00'] * n, ['+00 00 00'] * n, [''] * n, [''] * n)
+
+##################################
+
+def Timings(rng, epoch, period, cycles, error):
+	# mid-times at the cycles with gaussian errors
+	errors = numpy.full(len(cycles), error)
+	return epoch + period * numpy.asarray(cycles) + rng.normal(0., error, len(cycles)), errors
+
+##################################
+
+class RefineTest(unittest.TestCase):
+
+	def test_pulls(self):
+		# the catalog ephemerides a little off the true ones, the fits
+		# come back within their errors
+		rng = numpy.random.RandomState(20)
+		n = 300
+		epochs = rng.uniform(2454000., 2456000., n)
+		periods = rng.uniform(0.7, 10., n)
+		names, times, errors = [], [], []
+		for i in range(n):
+			cycles = numpy.unique(rng.randint(-300, 300, 15))
+			t, e = Timings(rng, epochs[i], periods[i], cycles, rng.uniform(0.0005, 0.002))
+			names += ['T%03d' % (i)] * len(t)
+			times.append(t)
+			errors.append(e)
+		catalog = Catalog(epochs + rng.normal(0., 0.002, n), periods + rng.normal(0., 2e-5, n))
+		results = eph_refine.Refine(catalog, names, numpy.concatenate(times), numpy.concatenate(errors),
+			epoch_error=None)
+		self.assertTrue(results['refined'].all())
+		self.assertEqual(results['clipped'].sum(), 0)
+		# the true mid-time at the cycle of the fitted epoch
+		cycle = numpy.round((results['epoch'] - epochs) / periods)
+		epoch_pulls = (results['epoch'] - epochs - periods * cycle) / numpy.sqrt(results['covariance'][:,0,0])
+		period_pulls = (results['period'] - periods) / numpy.sqrt(results['covariance'][:,1,1])
+		for pulls in (epoch_pulls, period_pulls):
+			self.assertLess(abs(pulls.mean()), 0.2)
+			self.assertTrue(0.8 < pulls.std() < 1.2, pulls.std())
+
+	def test_outlier(self):
+		rng = numpy.random.RandomState(1)
+		t, e = Timings(rng, 2455000., 3.2, numpy.arange(0, 40, 2), 0.001)
+		t[7] += 0.02
+		catalog = Catalog([2455000.001], [3.20001])
+		results = eph_refine.Refine(catalog, ['T000'] * len(t), t, e, epoch_error=None)
+		self.assertEqual(results['clipped'][0], 1)
+		self.assertEqual(results['n_obs'][0], len(t) - 1)
+		self.assertLess(abs(results['period'][0] - 3.2), 5. * numpy.sqrt(results['covariance'][0,1,1]))
+		self.assertLess(results['chi2'][0] / results['dof'][0], 3.)
+
+	def test_gap(self):
+		# a catalog period 5e-4 d out puts timings 3000 cycles on over
+		# half a cycle off, the fit to the near ones gets them right
+		rng = numpy.random.RandomState(2)
+		cycles = numpy.concatenate([numpy.arange(0, 20), numpy.arange(3000, 3010)])
+		t, e = Timings(rng, 2455000., 2.5, cycles, 0.0005)
+		catalog = Catalog([2455000.], [2.5005])
+		self.assertGreater(abs((t[-1] - 2455000.) / 2.5005 - 3009.), 0.5)
+		results = eph_refine.Refine(catalog, ['T000'] * len(t), t, e, epoch_error=None)
+		self.assertEqual(results['n_cycles'][0], len(cycles))
+		self.assertEqual(results['clipped'][0], 0)
+		self.assertLess(abs(results['period'][0] - 2.5), 5. * numpy.sqrt(results['covariance'][0,1,1]))
+
+	def test_catalog_epoch(self):
+		# one new timing with the catalog epoch refines the period, an
+		# object without timings keeps its catalog ephemeris
+		catalog = Catalog([2455000., 2456000.], [2.5, 4.1])
+		results = eph_refine.Refine(catalog, ['T000'], numpy.array([2455000. + 2.50001 * 1000]),
+			numpy.array([0.001]))
+		self.assertTrue(results['refined'][0])
+		self.assertAlmostEqual(results['period'][0], 2.50001, 8)
+		self.assertFalse(results['refined'][1])
+		self.assertEqual((results['epoch'][1], results['period'][1]), (2456000., 4.1))
+
+##################################
+
+class WriteTest(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp(prefix='eph_refine')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_targets(self):
+		# the refined values put in, the rest of the file as it was
+		source = os.path.join(self.dir, 'cat')
+		with open(source, 'w') as f:
+			f.write("# test\nA  2455000.0  2.5  2.0  01 00 00  +10 00 00  # time=BJD_TDB\n"
+				"B  2456000.0  4.1  3.0  02 00 00  -10 00 00\n")
+		catalog = eph_catalog.Load(source)
+		results = eph_refine.Refine(catalog, ['A'], numpy.array([2455000. + 2.50001 * 1000]), numpy.array([0.001]))
+		output = os.path.join(self.dir, 'refined')
+		eph_refine.Write_catalog(output, source, results)
+		with open(output) as f:
+			lines = f.readlines()
+		self.assertEqual(lines[0], "# test\n")
+		self.assertEqual(lines[1].split()[0], 'A')
+		self.assertAlmostEqual(float(lines[1].split()[2]), 2.50001, 8)
+		self.assertEqual(lines[1].split()[3:], "2.0  01 00 00  +10 00 00  # time=BJD_TDB".split())
+		self.assertEqual(lines[2], "B  2456000.0  4.1  3.0  02 00 00  -10 00 00\n")
+
+	def test_csv(self):
+		# CSV catalogs are refused rather than written as targets/ lines
+		source = os.path.join(self.dir, 'cat.csv')
+		with open(source, 'w') as f:
+			f.write("pl_name,pl_tranmid,pl_orbper,pl_trandur,ra,dec\nA b,2455000.0,2.5,2.0,15.0,10.0\n")
+		catalog = eph_catalog.Load(source)
+		results = eph_refine.Refine(catalog, ['Ab'], numpy.array([2455000. + 2.50001 * 1000]), numpy.array([0.001]))
+		output = os.path.join(self.dir, 'refined')
+		self.assertRaises(ValueError, eph_refine.Write_catalog, output, source, results)
+		self.assertFalse(os.path.exists(output))
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import numpy
+import eph_records
+import eph_schedule
+
+"""
+Checks of the network schedule: no telescope watching two windows at
+once, no transit scheduled twice and the higher scores winning the
+clashes, as a plain greedy pass over every pair would have it
+"""
+
+sites = [{'name': 'North', 'lowlim': 20.}, {'name': 'South', 'lowlim': 20.}, {'name': 'East', 'lowlim': 20.}]
+
+##################################
+
+def Candidates(rng, n_objects, n, days=30.):
+	# random transit windows of up to 6 hours at each site, transits
+	# of an object at different sites sharing its mid-times
+	objects = [{'name': 'T%03d' % (i), 'comment': 'priority=%d' % (rng.randint(1, 4))} for i in range(n_objects)]
+	mids = numpy.unique(rng.uniform(0., days, n)) + 2457724.5
+	owners = rng.randint(0, n_objects, len(mids))
+	site_records = []
+	for site in sites:
+		seen = rng.uniform(size=len(mids)) < 0.6
+		records = eph_records.Empty(seen.sum())
+		records['object'], records['hjd'] = owners[seen], mids[seen]
+		half = rng.uniform(0.5, 3., seen.sum()) / 24.
+		records['start'], records['end'] = mids[seen] - half, mids[seen] + half
+		records['type'] = rng.choice(sorted(eph_schedule.type_weights), seen.sum())
+		records['observable'] = rng.uniform(0.1, 1., seen.sum())
+		records['max_airmass'] = rng.uniform(1., 3., seen.sum())
+		records['moon_sep'] = rng.uniform(0., 180., seen.sum())
+		records['moon_illum'] = rng.uniform(0., 100., seen.sum())
+		site_records.append(records)
+	return objects, site_records
+
+##################################
+
+def Greedy(candidates, scores, baseline, overhead):
+	# indices of the candidates a greedy pass takes, checking each one
+	# against everything already taken
+	chosen = []
+	for i in numpy.argsort(-scores, kind='mergesort'):
+		if scores[i] <= 0.:
+			continue
+		start = candidates['start'][i] - baseline / 24.
+		end = candidates['end'][i] + baseline / 24. + overhead / 1440.
+		clash = False
+		for j in chosen:
+			if candidates['object'][j] == candidates['object'][i] and candidates['hjd'][j] == candidates['hjd'][i]:
+				clash = True
+			elif candidates['site'][j] == candidates['site'][i] and \
+					candidates['start'][j] - baseline / 24. < end and \
+					candidates['end'][j] + baseline / 24. + overhead / 1440. > start:
+				clash = True
+		if not clash:
+			chosen.append(i)
+	return chosen
+
+##################################
+
+class ScheduleTest(unittest.TestCase):
+
+	def test_no_double_booking(self):
+		rng = numpy.random.RandomState(18)
+		objects, site_records = Candidates(rng, 40, 600)
+		for baseline, overhead in ((0., 0.), (1., 10.)):
+			schedule = eph_schedule.Schedule(sites, objects, site_records, baseline, overhead)
+			self.assertGreater(len(schedule), 0)
+			# each transit at one site at most
+			transits = set(zip(schedule['object'], schedule['hjd']))
+			self.assertEqual(len(transits), len(schedule))
+			# and the windows at each site apart, padded as scheduled
+			for s in range(len(sites)):
+				at_site = schedule[schedule['site'] == s]
+				at_site = at_site[numpy.argsort(at_site['start'])]
+				ends = at_site['end'][:-1] + baseline / 24. + overhead / 1440.
+				self.assertTrue((at_site['start'][1:] - baseline / 24. >= ends).all())
+
+	def test_greedy(self):
+		# the same transits as the pairwise greedy pass
+		rng = numpy.random.RandomState(2016)
+		objects, site_records = Candidates(rng, 20, 300, days=10.)
+		candidates = eph_records.Combine(site_records)
+		priority = numpy.array([eph_schedule.Priority(obj) for obj in objects])
+		scores = eph_schedule.Scores(candidates, priority)
+		for baseline, overhead in ((0., 0.), (0.5, 15.)):
+			schedule = eph_schedule.Schedule(sites, objects, site_records, baseline, overhead)
+			expected = candidates[Greedy(candidates, scores, baseline, overhead)]
+			self.assertEqual(sorted(zip(schedule['site'], schedule['object'], schedule['hjd'])),
+				sorted(zip(expected['site'], expected['object'], expected['hjd'])))
+
+	def test_clash(self):
+		# overlapping windows at one site go to the higher priority, the
+		# same transit at two sites to the lower airmass
+		objects = [{'name': 'Low', 'comment': ''}, {'name': 'High', 'comment': '# priority=3'}]
+		north = eph_records.Empty(2)
+		north['object'], north['hjd'] = [0, 1], [2457724.5, 2457724.55]
+		north['start'], north['end'] = north['hjd'] - 0.05, north['hjd'] + 0.05
+		north['type'], north['observable'], north['max_airmass'] = eph_records.FULL, 1., 1.5
+		south = north[:1].copy()
+		south['max_airmass'] = 1.2
+		schedule = eph_schedule.Schedule(sites[:2], objects, [north, south])
+		self.assertEqual(sorted(zip(schedule['site'], schedule['object'])), [(0, 1), (1, 0)])
+		# with the high priority transit gone the low one takes the north
+		schedule = eph_schedule.Schedule(sites[:2], objects, [north[:1], south[:0]])
+		self.assertEqual(list(zip(schedule['site'], schedule['object'])), [(0, 0)])
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,70 @@
+import os
+import unittest
+import eph_engine
+import eph_service
+
+"""
+Checks of the service's nights and the time order of its answers
+"""
+
+repo_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+##################################
+
+class TonightTest(unittest.TestCase):
+
+	def test_noon(self):
+		# a site with noon at 12:00 UT has its nights from 12:00 to 12:00
+		site = {'name': 'Noon', 'noontime': '12:00:00'}
+		self.assertEqual(eph_service.Tonight_JD(site, 2457724.3), (2457724, 2457724., 2457725.))
+		self.assertEqual(eph_service.Tonight_JD(site, 2457724.0), (2457724, 2457724., 2457725.))
+		self.assertEqual(eph_service.Tonight_JD(site, 2457723.99)[0], 2457723)
+
+	def test_east(self):
+		# noon at 05:00 UT, 2457724.3 (19:12 UT) is the evening and
+		# 2457724.65 (03:36 UT) the morning of the night starting that
+		# date, 2457724.75 (06:00 UT) is after the next noon
+		site = {'name': 'East', 'noontime': '05:00:00'}
+		for now in (2457724.3, 2457724.65):
+			night, start, end = eph_service.Tonight_JD(site, now)
+			self.assertEqual(night, 2457724)
+			self.assertAlmostEqual(start, 2457723.5 + 5. / 24.)
+			self.assertAlmostEqual(end, 2457724.5 + 5. / 24.)
+			self.assertTrue(start <= now < end)
+		self.assertEqual(eph_service.Tonight_JD(site, 2457724.75)[0], 2457725)
+
+##################################
+
+class TransitsTest(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		objects = eph_engine.Read_objects(os.path.join(repo_dir, 'targets', 'Planets'))
+		sites = [{'name': 'LaPalma', 'latitude': 28.666667, 'longitude': -17.866667, 'lowlim': 35.,
+			'noontime': '12:00:00', 'elev': 2326.}, {'name': 'TNT', 'latitude': 18.566667,
+			'longitude': 98.466667, 'lowlim': 30., 'noontime': '05:00:00', 'elev': 2457.}]
+		cls.engine = eph_engine.Engine(objects, sites)
+
+	def test_time_order(self):
+		answer = eph_service.Transits_JSON(self.engine, 2457724., 2457734.)
+		utc = [t['utc'] for t in answer['transits']]
+		self.assertGreater(len(utc), 10)
+		self.assertEqual(utc, sorted(utc))
+
+	def test_tonight(self):
+		# each site's transits are those between its own noontimes
+		now = 2457725.3
+		answer = eph_service.Tonight_JSON(self.engine, now=now)
+		self.assertEqual(sorted(answer['nights']), ['LaPalma', 'TNT'])
+		for name, night in answer['nights'].items():
+			full = eph_service.Transits_JSON(self.engine, night['startJD'], night['endJD'], [name])
+			self.assertEqual([t['line'] for t in answer['transits'] if t['site'] == name],
+				[t['line'] for t in full['transits']])
+			self.assertTrue(night['startJD'] <= now < night['endJD'])
+		utc = [t['utc'] for t in answer['transits']]
+		self.assertEqual(utc, sorted(utc))
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import eph_records
+import eph_store
+
+"""
+Checks that the transit store is queried by the UTC mid-times, which
+can be in a different order from the catalog times
+"""
+
+site = {'name': 'Test', 'latitude': 28.67, 'longitude': -17.87, 'lowlim': 35., 'noontime': '12:00:00', 'elev': 0.}
+objects = [{'name': 'A', 'epoch': 2457000., 'period': 1., 'duration': 2., 'ra': 1., 'dec': 10.},
+	{'name': 'B', 'epoch': 2457000., 'period': 1., 'duration': 2., 'ra': 13., 'dec': -10.}]
+
+##################################
+
+def Records():
+	# B's catalog time is later than A's but its UTC earlier, as for
+	# BJDs of targets on opposite sides of the sky
+	records = eph_records.Empty(2)
+	records['object'] = [0, 1]
+	records['hjd'] = [2457724.600, 2457724.602]
+	records['utc'] = [2457724.601, 2457724.597]
+	records['start'] = records['utc'] - 1./24.
+	records['end'] = records['utc'] + 1./24.
+	records['type'] = eph_records.FULL
+	return records
+
+##################################
+
+class StoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.filename = os.path.join(self.directory, 'transits.db')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_utc_order(self):
+		eph_store.Write(self.filename, [site], objects, [Records()], 2457724., 2457725.)
+		conn = eph_store.Connect(self.filename)
+		self.assertEqual([row['object'] for row in eph_store.Query(conn)], ['B', 'A'])
+		self.assertEqual([row['object'] for row in eph_store.Query(conn, start=2457724.599)], ['A'])
+		self.assertEqual([row['object'] for row in eph_store.Next_transits(conn, 'A', jd=2457724.5995)], ['A'])
+		self.assertEqual([row['object'] for row in eph_store.Next_transits(conn, 'B', jd=2457724.5995)], [])
+		self.assertEqual([row['object'] for row in eph_store.Tonight(conn, 'Test', 2457724.9)], ['B', 'A'])
+		plan = ' '.join(str(tuple(row)) for row in conn.execute(
+			"EXPLAIN QUERY PLAN SELECT * FROM transits WHERE object=? AND utc>? ORDER BY utc", ('A', 0.)))
+		self.assertIn('transits_object_utc', plan)
+		conn.close()
+
+	def test_old_database(self):
+		# one from before the utc column gets it filled from hjd and the
+		# index moved over
+		conn = sqlite3.connect(self.filename)
+		conn.executescript("""
+			CREATE TABLE transits (site TEXT, object TEXT, night INTEGER, hjd REAL, start REAL, end REAL);
+			CREATE INDEX transits_object_time ON transits (object, hjd);
+			INSERT INTO transits VALUES ('Test', 'A', 2457724, 2457724.6, 2457724.55, 2457724.65);""")
+		conn.commit()
+		conn.close()
+		conn = eph_store.Connect(self.filename)
+		rows = eph_store.Query(conn, start=2457724.5)
+		self.assertEqual([row['utc'] for row in rows], [2457724.6])
+		names = [row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")]
+		self.assertIn('transits_object_utc', names)
+		self.assertNotIn('transits_object_time', names)
+		conn.close()
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import numpy
+import ephem
+import eph_sun
+import eph_twilight
+
+"""
+Checks of the eph_sun sun times against PyEphem (eph_twilight's
+GetSunTimes) in both hemispheres through the year, and of the polar
+days and nights where there are none
+"""
+
+# latitudes, longitudes (east +ve) and the noons (JD) of the nights
+# around the solstices and equinoxes of 2017
+sites = [(28.67, -17.87), (-24.63, -70.40), (18.57, 98.47), (-31.27, 149.07), (52.38, -1.56),
+	(-45.03, 170.47), (64.15, -21.94), (-66.5, 110.53), (0., 0.)]
+noons = [2457834., 2457926., 2458019., 2458109., 2457760.]
+
+# tolerance (seconds) of the times
+tolerance = 60.
+
+##################################
+
+def Ephem_times(noon, latitude, longitude):
+	# sunset, end of evening twilight, start of morning twilight and
+	# sunrise from PyEphem, NaN where there isn't one in the 24 hours
+	# after noon or PyEphem finds the Sun always up or down
+	obs = ephem.Observer()
+	obs.lon, obs.lat, obs.elev = str(longitude), str(latitude), 0.
+	obs.pressure = eph_twilight.sun_pressure
+	times = []
+	for horizon, center in ((eph_twilight.sun_horizon, False), (eph_twilight.twi_horizon, True)):
+		obs.horizon = horizon
+		for event in (obs.next_setting, obs.next_rising):
+			obs.date = noon - eph_twilight.dublin_jd
+			try:
+				t = float(event(ephem.Sun(), use_center=center)) + eph_twilight.dublin_jd
+			except (ephem.AlwaysUpError, ephem.NeverUpError):
+				t = numpy.nan
+			times.append(t if t < noon + 1. else numpy.nan)
+	sunset, sunrise, evening, morning = times
+	return sunset, evening, morning, sunrise
+
+##################################
+
+class SunTimesTest(unittest.TestCase):
+
+	def test_ephem(self):
+		compared = 0
+		for latitude, longitude in sites:
+			# local noon
+			starts = numpy.array(noons) - 0.5 - longitude / 360.
+			times = eph_sun.Sun_times(starts, latitude, longitude)
+			for i,start in enumerate(starts):
+				expected = Ephem_times(start, latitude, longitude)
+				for t,e in zip(times[:4], expected):
+					if numpy.isnan(e):
+						self.assertTrue(numpy.isnan(t[i]), (latitude, start, t[i]))
+					else:
+						self.assertLess(abs(t[i] - e) * 86400., tolerance, (latitude, start))
+						compared += 1
+		self.assertGreater(compared, 150)
+
+	def test_polar(self):
+		# midnight Sun and polar night either side of the equator, no
+		# times and Always saying which (at 88 deg the winter Sun stays
+		# below -18)
+		for latitude, summer in ((88., 2457926.), (-88., 2458109.)):
+			winter = summer + 183.
+			sunset, evening, morning, sunrise, always = eph_sun.Sun_times(numpy.array([summer, winter]), latitude, 15.)
+			for times in (sunset, evening, morning, sunrise):
+				self.assertTrue(numpy.isnan(times).all())
+			self.assertEqual(list(always), [1, -1])
+			for start in (summer, winter):
+				self.assertTrue(numpy.isnan(Ephem_times(start, latitude, 15.)).all())
+
+	def test_never_dark(self):
+		# summer nights at 60N have a sunset and sunrise but no
+		# astronomical darkness
+		sunset, evening, morning, sunrise, always = eph_sun.Sun_times(numpy.array([2457926.]), 60., 0.)
+		self.assertFalse(numpy.isnan(sunset[0]) or numpy.isnan(sunrise[0]))
+		self.assertTrue(numpy.isnan(evening[0]) and numpy.isnan(morning[0]))
+		self.assertEqual(always[0], 1)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
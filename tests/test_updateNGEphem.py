@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+
+utils_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'utils')
+sys.path.insert(0, utils_dir)
+import etdStandIn
+
+"""
+Checks of utils/updateNGEphem.py against the recorded pages in
+utils/etd_pages served by etdStandIn: everything downloaded on the
+first run, nothing but 304s on a rerun and a page changed in between
+reported as such
+"""
+
+##################################
+
+class UpdateTest(unittest.TestCase):
+
+	def setUp(self):
+		# the pages copied so one can be changed, served on a free port
+		self.dir = tempfile.mkdtemp(prefix='eph_update')
+		self.pages = os.path.join(self.dir, 'pages')
+		shutil.copytree(os.path.join(utils_dir, 'etd_pages'), self.pages)
+		etdStandIn.PageHandler.pages = self.pages
+		self.server = etdStandIn.ThreadingServer(('localhost', 0), etdStandIn.PageHandler)
+		self.thread = threading.Thread(target=self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+		self.url = 'http://localhost:{}/'.format(self.server.server_address[1])
+		self.catalog = os.path.join(self.dir, 'ETD_test')
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		shutil.rmtree(self.dir)
+
+	def update(self):
+		# run the updater, returning its report
+		report = os.path.join(self.dir, 'report.json')
+		subprocess.check_output([sys.executable, os.path.join(utils_dir, 'updateNGEphem.py'),
+			'--url', self.url, '--catalog', self.catalog, '--cache', os.path.join(self.dir, 'cache'),
+			'--report', report, '--workers', '2'], stderr=subprocess.STDOUT)
+		with open(report) as f:
+			return json.load(f)
+
+	def test_update(self):
+		n = len(os.listdir(self.pages))
+		first = self.update()
+		self.assertEqual(first['pages']['downloaded'], n)
+		self.assertEqual(first['pages']['failed'], 0)
+		self.assertEqual(len(first['added']), n - 1)
+		with open(self.catalog) as f:
+			written = f.read()
+		# with the fractional seconds from the page
+		self.assertIn('06 30 32.79  +29 40 20.40', written)
+
+		rerun = self.update()
+		self.assertEqual(rerun['pages']['not_modified'], n)
+		self.assertEqual(rerun['pages']['downloaded'], 0)
+		self.assertEqual(rerun['changed'], [])
+		self.assertEqual(len(rerun['unchanged']), n - 1)
+		with open(self.catalog) as f:
+			self.assertEqual(f.read(), written)
+
+		# a new period on the WASP-12 page
+		page = os.path.join(self.pages, [p for p in os.listdir(self.pages) if 'WASP-12%' in p][0])
+		with open(page) as f:
+			html = f.read()
+		with open(page, 'w') as f:
+			f.write(html.replace("value='1.0914203'", "value='1.0914220'"))
+		changed = self.update()
+		self.assertEqual(changed['pages']['downloaded'], 1)
+		self.assertEqual(changed['pages']['not_modified'], n - 1)
+		self.assertEqual([c['name'] for c in changed['changed']], ['WASP-12b'])
+		self.assertEqual(sorted(changed['changed'][0]['fields']), ['period'])
+		self.assertEqual(len(changed['unchanged']), n - 2)
+
+##################################
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,219 @@
+"""
+Script to benchmark ephemeris2.py on synthetic catalogs
+
+Makes target catalogs in the targets/ format (periods, durations
+and an isotropic sky like the transiting planet surveys) and an
+observatories file in the observatories2 format with northern,
+southern, western and eastern sites, then times end to end runs
+of ephemeris2.py for each catalog size and date range along with
+the eph_functions routines. Results are written as JSON so runs on
+different commits can be compared, e.g.
+
+    python benchmark.py --output before.json
+    (change things)
+    python benchmark.py --output after.json --compare before.json
+
+The generated files are left in --workdir if one is given
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import argparse as ap
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import eph_functions as JD
+
+ephemeris = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'ephemeris2.py')
+
+# name, latitude, longitude, low_alt_limit, noontime(UTC), elevation.
+# Between them they cover both hemispheres and both signs of longitude
+# so the twilights come in both orders
+sites = [('LaPalma', (28, 40, 0), (-17, 52, 0), 35., '12:00:00', 2326),
+         ('Paranal', (-24, 37, 38), (-70, 24, 15), 30., '08:00:00', 2518),
+         ('MaunaKea', (19, 49, 20), (-155, 28, 24), 30., '22:00:00', 4205),
+         ('TNT', (18, 34, 0), (98, 28, 0), 20., '19:00:00', 2457),
+         ('SAAO', (-32, 22, 46), (20, 48, 38), 30., '10:00:00', 1798),
+         ('SidingSpring', (-31, 16, 24), (149, 4, 11), 30., '02:00:00', 1165)]
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('--sizes', help='catalog sizes (default 100 1000 5000)',
+                        type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--days', help='date range lengths (default 30 365)',
+                        type=int, nargs='+', default=[30, 365])
+    parser.add_argument('--start', help='JD to start the date ranges',
+                        type=int, default=2457724)
+    parser.add_argument('--sites', help='number of sites to use (default all {})'.format(len(sites)),
+                        type=int, default=len(sites))
+    parser.add_argument('--jobs', help='passed on to ephemeris2.py', type=int, default=1)
+    parser.add_argument('--repeat', help='times to repeat each run, the best is kept',
+                        type=int, default=1)
+    parser.add_argument('--seed', help='random seed for the catalogs', type=int, default=42)
+    parser.add_argument('--workdir', help='directory for the generated files (kept)')
+    parser.add_argument('--output', help='JSON results file (default stdout)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--no-functions', help="don't time the eph_functions routines",
+                        action='store_true')
+    return parser.parse_args()
+
+def makeCatalog(filename, n, seed=42):
+    # periods log-uniform 0.7-10 d, durations scaling roughly with
+    # P^(1/3), epochs over the last decade and positions uniform on
+    # the sky (the Deg() -0 bug is left in, as with real catalogs)
+    rng = np.random.RandomState(seed)
+    periods = np.exp(rng.uniform(np.log(0.7), np.log(10.), n))
+    durations = np.clip(2.2 * (periods / 3.) ** (1. / 3.) * rng.uniform(0.6, 1.4, n), 0.8, 6.)
+    epochs = rng.uniform(2454000., 2457500., n)
+    ras = rng.uniform(0., 24., n)
+    decs = np.degrees(np.arcsin(rng.uniform(-1., 1., n)))
+    with open(filename, 'w') as f:
+        f.write('# Synthetic catalog of {} objects (seed {})\n#\n'.format(n, seed))
+        f.write('# name epoch period duration(hrs) RA Dec\n#\n')
+        for i in range(n):
+            f.write('SYN{:05d}  {:.5f}  {:.7f}  {:.2f}  {}  {}\n'.format(
+                i, epochs[i], periods[i], durations[i],
+                JD.Sexagesimal(ras[i]), JD.Sexagesimal(decs[i], sign=True)))
+
+def makeSites(filename, n=len(sites)):
+    with open(filename, 'w') as f:
+        f.write('# Synthetic observatories for benchmarking\n#\n')
+        f.write('# name latitude longitude low_alt_limit noondate noontime(UTC) elevation\n#\n')
+        for name, lat, lon, lowlim, noon, elev in sites[:n]:
+            f.write('{} {:02d} {:02d} {:02d} {:02d} {:02d} {:02d} {:.0f}. 2014-12-12 {} {}\n'.format(
+                name, lat[0], lat[1], lat[2], lon[0], lon[1], lon[2], lowlim, noon, elev))
+
+def countTransits(workdir, n):
+    # lines in the observatory listings
+    count = 0
+    for name in [site[0] for site in sites[:n]]:
+        with open(os.path.join(workdir, name + '.eph2')) as f:
+            count += sum(1 for line in f if not line.startswith('#'))
+    return count
+
+def timeRun(workdir, catalog, observatories, startJD, endJD, jobs=1, repeat=1):
+    # best wall clock time of ephemeris2.py run in workdir
+    cmd = [sys.executable, ephemeris, catalog, observatories, str(startJD), str(endJD),
+           '--jobs', str(jobs)]
+    best = None
+    for r in range(repeat):
+        t0 = time.time()
+        with open(os.devnull, 'w') as null:
+            subprocess.check_call(cmd, cwd=workdir, stdout=null)
+        t = time.time() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+def timeCall(func, args, repeat=3, target=0.2):
+    # best time per call, looping enough times to take ~target seconds
+    n = 1
+    while True:
+        t0 = time.time()
+        for i in range(n):
+            func(*args)
+        t = time.time() - t0
+        if t > target / 10. or n > 1e6:
+            break
+        n *= 10
+    n = max(1, int(n * target / max(t, 1e-9) / 10.) or 1)
+    best = None
+    for r in range(repeat):
+        t0 = time.time()
+        for i in range(n):
+            func(*args)
+        t = (time.time() - t0) / n
+        best = t if best is None else min(best, t)
+    return best
+
+def timeFunctions(size=10000):
+    # per call times of the eph_functions routines, scalar versions on
+    # one value and array versions on size values
+    jds = np.linspace(2457724., 2458089., size)
+    lst = JD.Sid_time_array(jds, -17.87)
+    ha = JD.HA_array(lst, 6.5)
+    tests = [('Jul_date', JD.Jul_date, (2457724.73,), 1),
+             ('Sid_time', JD.Sid_time, (2457724.73, -17.87), 1),
+             ('HA', JD.HA, (12.3, 6.5), 1),
+             ('window', JD.window, ((23, 12, 5), 2.5), 1),
+             ('Altitude', JD.Altitude, (28.67, 29.67, 1.5), 1),
+             ('Deg', JD.Deg, (('-24', '37', '38'),), 1),
+             ('Transit_times', JD.Transit_times, (2454508.97682, 1.09142245, 2457724, 2458089), 1),
+             ('Jul_date_array', JD.Jul_date_array, (jds,), size),
+             ('Sid_time_array', JD.Sid_time_array, (jds, -17.87), size),
+             ('HA_array', JD.HA_array, (lst, 6.5), size),
+             ('Altitude_array', JD.Altitude, (28.67, 29.67, ha), size),
+             ('Night_array', JD.Night_array, (jds, '12:00:00'), size)]
+    results = []
+    for name, func, args, n in tests:
+        t = timeCall(func, args)
+        results.append({'name': name, 'n': n, 'seconds': t, 'seconds_per_value': t / n})
+    return results
+
+def gitCommit():
+    try:
+        with open(os.devnull, 'w') as null:
+            out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                          cwd=os.path.dirname(ephemeris), stderr=null)
+        return out.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, old):
+    # ratios new/old for the runs and functions found in both
+    old_runs = dict(((r['objects'], r['sites'], r['days']), r) for r in old.get('runs', []))
+    for r in results['runs']:
+        o = old_runs.get((r['objects'], r['sites'], r['days']))
+        if o:
+            print('{:6d} objects {:2d} sites {:4d} days: {:8.2f}s -> {:8.2f}s  x{:.2f}'.format(
+                r['objects'], r['sites'], r['days'], o['seconds'], r['seconds'],
+                r['seconds'] / o['seconds']))
+    old_funcs = dict((f['name'], f) for f in old.get('functions', []))
+    for f in results['functions']:
+        o = old_funcs.get(f['name'])
+        if o:
+            print('{:>16s}: {:10.3g}s -> {:10.3g}s  x{:.2f}'.format(
+                f['name'], o['seconds'], f['seconds'], f['seconds'] / o['seconds']))
+
+if __name__ == "__main__":
+    args = argParse()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='eph_benchmark')
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    observatories = os.path.join(workdir, 'observatories')
+    makeSites(observatories, args.sites)
+
+    results = {'commit': gitCommit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'numpy': np.__version__,
+               'machine': platform.machine(), 'system': platform.system(),
+               'seed': args.seed, 'jobs': args.jobs, 'runs': [], 'functions': []}
+    try:
+        for n in args.sizes:
+            catalog = os.path.join(workdir, 'catalog_{}'.format(n))
+            makeCatalog(catalog, n, args.seed)
+            for days in args.days:
+                t = timeRun(workdir, catalog, observatories, args.start,
+                            args.start + days, args.jobs, args.repeat)
+                run = {'objects': n, 'sites': args.sites, 'days': days, 'seconds': t,
+                       'transits': countTransits(workdir, args.sites)}
+                results['runs'].append(run)
+                sys.stderr.write('{objects} objects, {sites} sites, {days} days: '
+                                 '{seconds:.2f}s, {transits} transits\n'.format(**run))
+        if not args.no_functions:
+            results['functions'] = timeFunctions()
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=1, sort_keys=True))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
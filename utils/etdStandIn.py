@@ -0,0 +1,92 @@
+"""
+Script to serve recorded ETD pages locally, so updateNGEphem.py
+can be run (and checked) without the real site, e.g.
+
+    python etdStandIn.py etd_pages --port 8765 &
+    python updateNGEphem.py --url http://localhost:8765/ --catalog ETD_test
+
+The directory holds one file per page, named as updateNGEphem.py
+--record saves them (index.html for the home page). Responses carry
+an ETag and Last-Modified from the file, conditional requests for
+unchanged files get a 304 and connections are kept open between
+requests as a real server would. --delay adds latency to each
+response to see the effect of the worker pool
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse as ap
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from updateNGEphem import pageName
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('pages', help='directory of recorded pages')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default 8765)')
+    parser.add_argument('--host', default='localhost', help='address to listen on (default localhost)')
+    parser.add_argument('--delay', type=float, default=0., help='seconds to wait before each response')
+    return parser.parse_args()
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    pages = '.'
+    delay = 0.
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        filename = os.path.join(self.pages, pageName('http://localhost' + self.path))
+        if not os.path.isfile(filename):
+            self.reply(404, b'Not found\n')
+            return
+        with open(filename, 'rb') as f:
+            body = f.read()
+        mtime = int(os.path.getmtime(filename))
+        headers = {'ETag': '"{}"'.format(hashlib.sha1(body).hexdigest()),
+                   'Last-Modified': formatdate(mtime, usegmt=True),
+                   'Content-Type': 'text/html; charset=utf-8'}
+        since = self.headers.get('If-Modified-Since')
+        match = self.headers.get('If-None-Match')
+        if match is not None:
+            unchanged = match == headers['ETag']
+        elif since is not None and parsedate_tz(since):
+            unchanged = mktime_tz(parsedate_tz(since)) >= mtime
+        else:
+            unchanged = False
+        if unchanged:
+            self.reply(304, b'', headers)
+        else:
+            self.reply(200, body, headers)
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+if __name__ == '__main__':
+    args = argParse()
+    PageHandler.pages = args.pages
+    PageHandler.delay = args.delay
+    server = ThreadingServer((args.host, args.port), PageHandler)
+    sys.stderr.write('Serving {} on http://{}:{}/\n'.format(args.pages, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
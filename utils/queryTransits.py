@@ -0,0 +1,63 @@
+"""
+Script to query a transit database written by
+ephemeris2.py --sqlite
+
+e.g.
+    tonight at a site:
+        python queryTransits.py transits.db --site LaPalma --tonight
+    next 10 full transits of WASP-12:
+        python queryTransits.py transits.db --object WASP-12 --next 10 --type full
+    all full transits further than 30 deg from the Moon:
+        python queryTransits.py transits.db --type full --min-moon-sep 30
+"""
+import os
+import sys
+import argparse as ap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import eph_store
+import eph_records
+import eph_functions as JD
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('database', help='SQLite file from ephemeris2.py --sqlite')
+    parser.add_argument('--site', help='observatory name')
+    parser.add_argument('--object', help='object name')
+    parser.add_argument('--tonight', help='transits tonight (needs --site)',
+                        action='store_true')
+    parser.add_argument('--night', help='night by the JD of the noon starting it',
+                        type=int)
+    parser.add_argument('--next', help='next N transits from now', type=int)
+    parser.add_argument('--type', help='transit type(s)', action='append',
+                        choices=sorted(eph_records.type_keys))
+    parser.add_argument('--start', help='UTC JD lower limit', type=float)
+    parser.add_argument('--end', help='UTC JD upper limit', type=float)
+    parser.add_argument('--min-moon-sep', help='minimum Moon separation (deg)',
+                        type=float)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = argParse()
+    if not os.path.exists(args.database):
+        sys.exit('No database {}'.format(args.database))
+    conn = eph_store.Connect(args.database)
+    types = [eph_records.type_keys[t] for t in args.type] if args.type else None
+    night = args.night
+    if args.tonight:
+        if not args.site:
+            sys.exit('--tonight needs --site')
+        row = conn.execute("SELECT noontime FROM sites WHERE name=?",
+                           (args.site,)).fetchone()
+        if row is None:
+            sys.exit('Unknown site {}'.format(args.site))
+        night = JD.Night_array(JD.JD_now(), row['noontime'])
+    start = args.start
+    if args.next and start is None:
+        start = JD.JD_now()
+    rows = eph_store.Query(conn, site=args.site, object=args.object, night=night,
+                           types=types, start=start, end=args.end,
+                           min_moon_sep=args.min_moon_sep, limit=args.next)
+    for row in rows:
+        print('{:.5f}  {:>8}  {}'.format(row['utc'], row['site'], row['line']))
+    conn.close()
@@ -0,0 +1,67 @@
+"""
+Script to refine the ephemerides of every object in a catalog from
+a file of observed transit mid-times, e.g. a season of network
+timings
+
+The timings file has one mid-time per line:
+
+    name  mid-time  error  [# comment]
+
+in days, on the same time scale as the catalog epochs (e.g. HJD).
+Each object with timings gets a weighted least squares fit of its
+epoch and period (and with --quadratic a period change term), the
+catalog epoch going in as one more timing unless --epoch-error 0.
+The refined catalog is written in the targets/ format, the fitted
+values with their errors and correlations to a covariance table
+(default <output>.cov), e.g.
+
+    python refineCatalog.py ../targets/Planets timings.txt ../targets/Planets_2017
+
+For a single new mid-time of one object refineEphemeris.py is
+quicker
+"""
+import os
+import sys
+import time
+import argparse as ap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import eph_catalog
+import eph_refine
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('catalog', help='catalog in the targets/ format')
+    parser.add_argument('timings', help='observed mid-times file')
+    parser.add_argument('output', help='refined catalog filename')
+    parser.add_argument('--covariance', help='fitted values, errors and correlations '
+                        '(default <output>.cov)')
+    parser.add_argument('--quadratic', action='store_true',
+                        help='also fit a quadratic (changing period) term')
+    parser.add_argument('--epoch-error', type=float, default=0.001,
+                        help='error (days) of the catalog epoch as a timing, 0 to leave it out '
+                        '(default 0.001)')
+    parser.add_argument('--clip', type=float, default=5.,
+                        help='reject timings this many errors off the fit (default 5)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = argParse()
+    t0 = time.time()
+    if eph_catalog.Is_csv(args.catalog):
+        sys.exit('{} is a CSV catalog, the refined catalog can only be written from one '
+                 'in the targets/ format'.format(args.catalog))
+    catalog = eph_catalog.Load(args.catalog)
+    names, times, errors = eph_refine.Read_timings(args.timings)
+    unknown = sorted(set(names) - set(catalog.name))
+    if unknown:
+        print('Not in {}, ignored: {}'.format(args.catalog, ' '.join(unknown)))
+    results = eph_refine.Refine(catalog, names, times, errors, args.epoch_error or None,
+                                args.quadratic, args.clip)
+    eph_refine.Write_catalog(args.output, args.catalog, results)
+    covariance = args.covariance or args.output + '.cov'
+    eph_refine.Write_covariance(covariance, results, args.quadratic)
+    print('{} timings, {} of {} objects refined ({} timings clipped) in {:.2f}s'.format(
+        len(times), results['refined'].sum(), len(results), results['clipped'].sum(),
+        time.time() - t0))
+    print('Catalog written to {}, covariance to {}'.format(args.output, covariance))
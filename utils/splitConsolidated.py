@@ -0,0 +1,43 @@
+"""
+Script to recreate the planet_eph2/<object>_<site>.eph2 files
+from a file written by ephemeris2.py --consolidated
+
+e.g.
+    all of them:
+        python splitConsolidated.py transits.eph2c
+    just one object (at every site) to the screen:
+        python splitConsolidated.py transits.eph2c --object WASP-12 --stdout
+"""
+import os
+import sys
+import argparse as ap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import eph_output
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('consolidated', help='file from ephemeris2.py --consolidated')
+    parser.add_argument('--object', help='only this object', action='append')
+    parser.add_argument('--site', help='only this site', action='append')
+    parser.add_argument('--outdir', help='output directory', default='planet_eph2')
+    parser.add_argument('--stdout', help='print instead of writing files',
+                        action='store_true')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = argParse()
+    index = eph_output.Read_consolidated_index(args.consolidated)
+    if not args.stdout and not os.path.exists(args.outdir):
+        os.mkdir(args.outdir)
+    for site, obj, offset, length in index:
+        if args.object and obj not in args.object:
+            continue
+        if args.site and site not in args.site:
+            continue
+        text = eph_output.Read_consolidated(args.consolidated, site, obj, index)
+        if args.stdout:
+            sys.stdout.write(text)
+        else:
+            with open(os.path.join(args.outdir, '{}_{}.eph2'.format(obj, site)), 'w') as f:
+                f.write(text)
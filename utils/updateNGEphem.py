@@ -1,110 +1,431 @@
+"""
+Script to update a target catalog from the Exoplanet Transit
+Database (ETD)
 
+Reads the list of known transiters from the ETD home page, then
+fetches every planet's page with a pool of worker threads, each
+keeping its connection open between requests. Pages are kept in an
+on disk cache (--cache) with their ETag/Last-Modified headers, so
+pages that haven't changed since the last run come back as 304s
+from a conditional request rather than being downloaded again. A
+failed request is retried and if it still fails the cached copy is
+used.
 
-# ----------------------------------------------------------------------------------
-#                               Description
-# ----------------------------------------------------------------------------------
-#
-# UpdateNGEphem.py -    a python script to update the input file for NG's 
-#                       Ephem program
-#   
-#
+The epochs, periods, durations and coordinates are merged into the
+catalog (default ETD) in the targets/ format: entries that changed
+are rewritten keeping their comments, new planets are added at the
+end and everything else in the file is left alone. What changed is
+printed, and with --report written as JSON, e.g.
 
-# ----------------------------------------------------------------------------------
-#                               Update History
-# ----------------------------------------------------------------------------------
-# 16/08/12 -    code writen
-# 16/08/12 -    code tested
-#
+    python updateNGEphem.py --catalog ../targets/ETD --workers 8
+
+To run offline, serve recorded pages with etdStandIn.py and point
+--url at it:
+
+    python etdStandIn.py etd_pages --port 8765 &
+    python updateNGEphem.py --url http://localhost:8765/ --catalog ETD_test
+
+--record DIR saves the pages fetched in the layout etdStandIn.py
+serves
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import hashlib
+import threading
+import argparse as ap
 
-# check for nltk
 try:
-    import nltk
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from html.parser import HTMLParser
+    from urllib.parse import urlsplit, urljoin, parse_qs, quote
+    from queue import Queue, Empty
 except ImportError:
-    print "No nltk module, exiting!"
-    exit()
-    
-from urllib import urlopen
-import re
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from HTMLParser import HTMLParser
+    from urlparse import urlsplit, urljoin, parse_qs
+    from urllib import quote
+    from Queue import Queue, Empty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+import eph_functions as JD
+
+# pylint: disable = superfluous-parens
+
+etd_url = 'http://var2.astro.cz/ETD/'
+user_agent = 'transit-ephemerides-updateNGEphem'
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('--url', default=etd_url,
+                        help='ETD home page (default {})'.format(etd_url))
+    parser.add_argument('--catalog', default='ETD',
+                        help='catalog to merge the ETD values into, '
+                        'created if needed (default ETD)')
+    parser.add_argument('--output', help='merged catalog filename (default --catalog)')
+    parser.add_argument('--report', help='also write the changes to this JSON file')
+    parser.add_argument('--cache', default='.etd_cache',
+                        help='directory of cached pages (default .etd_cache)')
+    parser.add_argument('--record', help='also save the pages in this directory '
+                        'for etdStandIn.py')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='number of pages fetched at once (default 8)')
+    parser.add_argument('--timeout', type=float, default=20.,
+                        help='seconds to wait for a response (default 20)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='attempts per page (default 3)')
+    parser.add_argument('--quiet', action='store_true', help="don't list the unchanged entries")
+    return parser.parse_args()
+
+def pageName(url):
+    # filename a page is recorded under, from the path and query after
+    # the site's ETD/ (or root) directory
+    parts = urlsplit(url)
+    path = parts.path.rsplit('/', 1)[-1]
+    if parts.query:
+        path += '?' + parts.query
+    return quote(path, safe='') or 'index.html'
+
+class PageCache(object):
+    """
+    Pages on disk with the validators to ask for them conditionally
+    next time, <sha1 of url>.html and .json for each
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return [os.path.join(self.directory, key + ext) for ext in ('.json', '.html')]
+
+    def get(self, url):
+        # (headers dict, body) or (None, None) if not cached
+        meta, page = self.paths(url)
+        try:
+            with open(meta) as f:
+                headers = json.load(f)
+            with open(page, 'rb') as f:
+                return headers, f.read()
+        except (IOError, OSError, ValueError):
+            return None, None
+
+    def put(self, url, headers, body):
+        meta, page = self.paths(url)
+        with open(page + '.tmp', 'wb') as f:
+            f.write(body)
+        os.rename(page + '.tmp', page)
+        with open(meta, 'w') as f:
+            json.dump(dict(headers, url=url, fetched=time.time()), f)
+
+class Fetcher(object):
+    """
+    Conditional GETs through the cache, with one open connection per
+    host for each thread using it
+    """
+    def __init__(self, cache, timeout=20., retries=3, record=None):
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.record = record
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stats = {'downloaded': 0, 'not_modified': 0, 'stale': 0, 'failed': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def connection(self, parts, fresh=False):
+        connections = self.local.__dict__.setdefault('connections', {})
+        key = (parts.scheme, parts.netloc)
+        if fresh and key in connections:
+            connections.pop(key).close()
+        if key not in connections:
+            cls = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+            connections[key] = cls(parts.netloc, timeout=self.timeout)
+        return connections[key]
+
+    def close(self):
+        for conn in self.local.__dict__.get('connections', {}).values():
+            conn.close()
+
+    def get(self, url):
+        # page body, from the cache when the server says it's unchanged
+        cached, body = self.cache.get(url)
+        headers = {'User-Agent': user_agent, 'Connection': 'keep-alive'}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        parts = urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        error = None
+        for attempt in range(self.retries):
+            try:
+                conn = self.connection(parts, fresh=attempt > 0)
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                if response.status == 304 and body is not None:
+                    self.count('not_modified')
+                    return self.keep(url, body)
+                if response.status == 200:
+                    self.cache.put(url, {'etag': response.getheader('ETag'),
+                                         'last_modified': response.getheader('Last-Modified')}, data)
+                    self.count('downloaded')
+                    return self.keep(url, data)
+                error = 'HTTP {}'.format(response.status)
+                if response.status < 500:
+                    break
+            except (socket.error, HTTPException) as e:
+                error = str(e) or e.__class__.__name__
+            if attempt < self.retries - 1:
+                time.sleep(0.5 * 2 ** attempt)
+        if body is not None:
+            sys.stderr.write('{}: {}, using the cached copy\n'.format(url, error))
+            self.count('stale')
+            return self.keep(url, body)
+        self.count('failed')
+        raise IOError('{}: {}'.format(url, error))
+
+    def keep(self, url, body):
+        if self.record:
+            with open(os.path.join(self.record, pageName(url)), 'wb') as f:
+                f.write(body)
+        return body
+
+def fetchAll(fetcher, urls, workers):
+    # bodies of the urls (None for failures) from a pool of threads
+    results = [None] * len(urls)
+    queue = Queue()
+    for item in enumerate(urls):
+        queue.put(item)
+
+    def work():
+        while True:
+            try:
+                i, url = queue.get_nowait()
+            except Empty:
+                break
+            try:
+                results[i] = fetcher.get(url)
+            except IOError as e:
+                sys.stderr.write('{}\n'.format(e))
+        fetcher.close()
+
+    threads = [threading.Thread(target=work) for w in range(max(1, min(workers, len(urls))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+class PageParser(HTMLParser):
+    """
+    Links, form inputs and table rows (cells as (text, bold)) of a page
+    """
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.links, self.inputs, self.rows, self.text = [], {}, [], []
+        self.input_row = {}
+        self.cell, self.bold = None, 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'a' and attrs.get('href'):
+            self.links.append(attrs['href'])
+        elif tag == 'input' and attrs.get('name'):
+            self.inputs[attrs['name']] = attrs.get('value') or ''
+            self.input_row[attrs['name']] = len(self.rows) - 1
+        elif tag == 'tr':
+            self.rows.append([])
+        elif tag in ('td', 'th'):
+            self.cell = [[], False]
+        elif tag == 'b':
+            self.bold += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('td', 'th') and self.cell is not None:
+            if not self.rows:
+                self.rows.append([])
+            self.rows[-1].append((''.join(self.cell[0]).replace(u'\xa0', ' ').strip(), self.cell[1]))
+            self.cell = None
+        elif tag == 'b':
+            self.bold = max(0, self.bold - 1)
+
+    def handle_data(self, data):
+        self.text.append(data)
+        if self.cell is not None:
+            self.cell[0].append(data)
+            if self.bold and data.strip():
+                self.cell[1] = True
+
+    def handle_entityref(self, name):
+        # only called on python 2, where charrefs aren't converted
+        self.handle_data(u'\xa0' if name == 'nbsp' else ' ')
+
+def parse(html):
+    parser = PageParser()
+    parser.feed(html.decode('utf-8', 'replace'))
+    parser.close()
+    return parser
+
+def planetPages(home_url, html):
+    # (star, planet, url) of each known transiter linked from the home page
+    planets, seen = [], set()
+    for link in parse(html).links:
+        if 'STARNAME=' not in link:
+            continue
+        query = parse_qs(urlsplit(link).query)
+        star, planet = query.get('STARNAME', [''])[0], query.get('PLANET', [''])[0]
+        if star and planet and (star, planet) not in seen:
+            seen.add((star, planet))
+            planets.append((star, planet, urljoin(home_url, link)))
+    return planets
+
+number = re.compile(r'[-+]?[0-9]*\.?[0-9]+')
+coords = re.compile(r'(\d{1,2})\s+(\d{1,2})\s+(\d{1,2}(?:\.\d*)?)\D*?([-+]\d{1,2})\s+(\d{1,2})\s+(\d{1,2}(?:\.\d*)?)')
+
+def planetValues(html):
+    # epoch, period, duration (hrs), RA, Dec and depth from a planet page.
+    # The epoch and period are the values of its M and PER form inputs,
+    # the coordinates are in the same table row, the depth is the row's
+    # last bold cell and the duration (minutes) its last cell
+    page = parse(html)
+    if 'M' not in page.inputs or 'PER' not in page.inputs:
+        raise ValueError('no epoch/period inputs')
+    row = page.rows[page.input_row['PER']] if page.input_row['PER'] >= 0 else []
+    text = ' '.join(cell for cell, bold in row) if row else ''.join(page.text)
+    text = text.replace(u'\xa0', ' ')
+    match = coords.search(text)
+    if not match:
+        raise ValueError('no coordinates')
+    # to hundredths of a second, sign from the text as the degrees can be -00
+    ra = JD.Sexagesimal(JD.Deg(match.groups()[:3]), decimals=2)
+    dec = abs(int(match.group(4))) + int(match.group(5)) / 60. + float(match.group(6)) / 3600.
+    dec = JD.Sexagesimal(-dec if match.group(4)[0] == '-' else dec, sign=True, decimals=2)
+    bolds = [cell for cell, bold in row if bold and number.search(cell)]
+    depth = number.search(bolds[-1]).group() if bolds else ''
+    duration = float(number.search(row[-1][0]).group()) / 60. if row and number.search(row[-1][0]) else 0.
+    return {'epoch': float(number.search(page.inputs['M']).group()),
+            'period': float(number.search(page.inputs['PER']).group()),
+            'duration': round(duration, 2), 'ra': ra, 'dec': dec, 'depth': depth}
+
+def catalogName(star, planet):
+    # as the old script: star and planet run together, anything after
+    # a / in the star's name (a second name) dropped
+    return ''.join(star.split('/')[0].split()) + planet
+
+def readCatalog(filename):
+    # lines of the catalog and the line number of each entry by name
+    lines, entries = [], {}
+    if os.path.exists(filename):
+        with open(filename) as f:
+            lines = f.readlines()
+    for i, line in enumerate(lines):
+        if line[0] not in '#\n ' and len(line.split()) >= 10:
+            entries.setdefault(line.split()[0], i)
+    return lines, entries
+
+def entryValues(line):
+    fields = line.split(None, 10)
+    return {'epoch': float(fields[1]), 'period': float(fields[2]), 'duration': float(fields[3]),
+            'ra': ' '.join(fields[4:7]), 'dec': ' '.join(fields[7:10]),
+            'comment': fields[10].rstrip('\n') if len(fields) > 10 else ''}
+
+def differences(old, new):
+    # fields that differ at the precision they're written
+    changed = []
+    for field, tolerance in (('epoch', 5e-6), ('period', 5e-8), ('duration', 5e-3)):
+        if abs(old[field] - new[field]) > tolerance:
+            changed.append(field)
+    for field in ('ra', 'dec'):
+        # signs compared separately for -00, seconds to the hundredths written
+        old_value, new_value = old[field].split(), new[field].split()
+        if old_value[0].startswith('-') != new_value[0].startswith('-') or \
+                [abs(float(x)) for x in old_value[:2]] != [abs(float(x)) for x in new_value[:2]] or \
+                abs(float(old_value[2]) - float(new_value[2])) > 5e-3:
+            changed.append(field)
+    return changed
+
+def entryLine(name, values, comment):
+    line = '{}  {:.5f}  {:.7f}  {:.2f}  {}  {}'.format(name, values['epoch'], values['period'],
+                                                       values['duration'], values['ra'], values['dec'])
+    return line + ('  ' + comment if comment else '') + '\n'
+
+def merge(lines, entries, planets):
+    # merged catalog lines and the report of what changed
+    lines = list(lines)
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    report = {'changed': [], 'added': [], 'unchanged': [],
+              'not_in_etd': sorted(set(entries) - set(name for name, values in planets))}
+    for name, values in planets:
+        if name in entries:
+            old = entryValues(lines[entries[name]])
+            changed = differences(old, values)
+            if changed:
+                lines[entries[name]] = entryLine(name, values, old['comment'])
+                report['changed'].append({'name': name, 'fields': dict(
+                    (field, [old[field], values[field]]) for field in changed)})
+            else:
+                report['unchanged'].append(name)
+        else:
+            comment = '#depth: {}'.format(values['depth']) if values['depth'] else ''
+            lines.append(entryLine(name, values, comment))
+            entries[name] = len(lines) - 1
+            report['added'].append(name)
+    return lines, report
+
+if __name__ == '__main__':
+    args = argParse()
+    t0 = time.time()
+    if args.record and not os.path.exists(args.record):
+        os.makedirs(args.record)
+    fetcher = Fetcher(PageCache(args.cache), args.timeout, args.retries, args.record)
+
+    home = fetcher.get(args.url)
+    fetcher.close()
+    pages = planetPages(args.url, home)
+    print('{} known transiters on {}'.format(len(pages), args.url))
+    bodies = fetchAll(fetcher, [url for star, planet, url in pages], args.workers)
+
+    planets = []
+    for (star, planet, url), body in zip(pages, bodies):
+        if body is None:
+            continue
+        try:
+            planets.append((catalogName(star, planet), planetValues(body)))
+        except ValueError as e:
+            sys.stderr.write('{} {}: {}, skipped\n'.format(star, planet, e))
 
-url_home="http://var2.astro.cz/ETD/"
-html_home=urlopen(url_home).read()
-raw=nltk.clean_html(html_home).split('\n')
-
-star_name,planet=[],[]
-
-# find latest list of planets from ETD homepage
-for i in range(0,len(raw)):
-    if "Known transiters" in raw[i]:
-        loc=i+1
-
-for i in range(loc,len(raw)):
-    if len(raw[i].split()) == 2:
-        star_name.append(raw[i].split()[0])
-        planet.append(raw[i].split()[1])
-        
-    if len(raw[i].split()) == 3:
-        name=str(raw[i].split()[0])+"%20"+str(raw[i].split()[1])
-        star_name.append(name)
-        planet.append(raw[i].split()[2])
-            
-    if len(raw[i].split()) != 2 and len(raw[i].split()) != 3:
-        break
-
-# get the values for each planet from ETD's pages
-epoch, period, depth, duration, ra, dec=[],[],[],[],[],[]
-
-for j in range(0,len(star_name)):
-    url_planet="http://var2.astro.cz/ETD/etd.php?STARNAME=%s&PLANET=%s" % (star_name[j],planet[j])
-    html_planet=urlopen(url_planet).read()
-    raw_planet=nltk.clean_html(html_planet)
-
-    html_planet_split=html_planet.split('\n')
-    for i in range(0,len(html_planet_split)):
-        if "name=\'M\' size=\'12\' value=\'" and "name=\'PER\' size=\'7\' value=\'" in html_planet_split[i]:
-            
-            # epoch
-            epoch.append(re.sub("[^0-9.]", "",html_planet_split[i].split("name=\'M\' size=\'12\' value=\'")[1][:12]))
-            
-            # period
-            period.append(re.sub("[^0-9.]", "",html_planet_split[i].split("name=\'PER\' size=\'7\' value=\'")[1][:7]))
-            
-            # transit depth
-            depth.append(re.sub("[^0-9.]", "",html_planet_split[i].split("</td><td><b>")[-1][:6]))
-            
-            # duration in minutes
-            dur=re.sub("[^0-9.]", "",html_planet_split[i].split("</b></td><td>")[-1][:6])
-            
-            # convert duration to hours
-            duration.append("%.2f" % (float(dur)/60.0))
-            
-            # fix error on ETD pages where extra &nbsp characters are present for WASP-17
-            err=html_planet_split[i].split("&nbsp")
-            while ";" in err:
-                err.remove(";")
-            
-            # RA
-            ra.append("%s %s %s" %(re.sub("[^0-9.]", "",err[1][-2:]), re.sub("[^0-9.]", "",err[2]), re.sub("[^0-9.]", "",err[3][:7])))
-            
-            # DEC
-            dec.append("%s %s %s" % (re.sub("[^0-9+-]", "",err[3][-3:]), re.sub("[^0-9.]", "",err[4]), re.sub("[^0-9.]", "",err[5][:6])))
-            
-            # print - can comment this out later                        
-            print "[%s %s] RA: %s DEC: %s Epoch: %s Period: %s Depth: %s Duration: %s" % (star_name[j], planet[j], ra[j], dec[j], epoch[j], period[j], depth[j], duration[j]) 
-            
-
-# remove the objects with two names second name the "/" confuses ng_ephemeris.py
-for i in range(0,len(star_name)):
-    if len(star_name[i].split("/")) > 1:
-        star_name[i]=star_name[i].split("/")[0]
-
-# write a file for ng_ephemeris.py
-# example format:
-# GJ-436    2454222.6157    2.643901    1.03  11 42 11  +26 42 37  #shallow - only ~0.6%
-f=open("ETD","w")
-
-for i in range(0,len(star_name)):
-    line="%s%s  %s  %s  %s  %s  %s  #depth: %s\n" % (star_name[i],planet[i],epoch[i],period[i],duration[i],ra[i],dec[i],depth[i])
-    f.write(line)
-    
-f.close()
+    lines, entries = readCatalog(args.catalog)
+    lines, report = merge(lines, entries, planets)
+    output = args.output or args.catalog
+    with open(output, 'w') as f:
+        f.write(''.join(lines))
 
+    for change in report['changed']:
+        print('changed {}: {}'.format(change['name'], ', '.join(
+            '{} {} -> {}'.format(field, old, new) for field, (old, new) in sorted(change['fields'].items()))))
+    for name in report['added']:
+        print('added {}'.format(name))
+    if not args.quiet:
+        for name in report['unchanged']:
+            print('unchanged {}'.format(name))
+    print('{} changed, {} added, {} unchanged, {} not in ETD kept as they were'.format(
+        len(report['changed']), len(report['added']), len(report['unchanged']), len(report['not_in_etd'])))
+    print('{downloaded} pages downloaded, {not_modified} not modified, {stale} from the cache '
+          'after errors, {failed} failed'.format(**fetcher.stats))
+    print('Catalog written to {} in {:.1f}s'.format(output, time.time() - t0))
+    if args.report:
+        report['pages'] = fetcher.stats
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
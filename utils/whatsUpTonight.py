@@ -1,59 +1,233 @@
+"""
+Script to show which objects are transiting tonight, or any other
+night, from one or all of the observatories in the ephemeris2.py
+listings (<site>.eph2)
+
+e.g.
+    all sites tonight:
+        python whatsUpTonight.py
+    La Palma tomorrow night:
+        python whatsUpTonight.py tomorrow --site LaPalma
+    the night starting on a given date (or the JD of its noon):
+        python whatsUpTonight.py 2016-12-01 --site LaPalma --site TNT
+
+A night runs from the site's noontime (UTC, from the observatories
+file) on one day to the next, as in ephemeris2.py. The listings are
+sorted by the UTC date and time after the catalog mid-time, so each
+night is found by a binary search on those through the file
+rather than reading it all, and only standard library modules are
+used so it starts quickly. Where the site has a night almanac (see
+ephemeris2.py --almanac) the night's sun and Moon times are shown
+too, read straight from its record in the memory mapped file
+"""
 import os
-from astropy.time import Time
+import time
+import mmap
+import datetime
+import struct
+import argparse as ap
 
 # pylint: disable = superfluous-parens
 
-def getTonightsTransits():
-    """
-    Grab a list of tonight's transiting objects
-    """
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    f = open('{}/../LaPalma.eph2'.format(script_dir)).readlines()
-    jd_today = int(Time.now().jd)
-    todays_lines = []
-    coords = {}
-    for i in range(0, len(f)):
-        if f[i].startswith('#'):
-            if "[" in f[i] and "]" in f[i]:
-                t = f[i].split()
-                name = t[1]
-                ra = "{}:{}:{}".format(t[2][1:], t[3], t[4][:-1])
-                dec = "{}:{}:{}".format(t[5][1:], t[6], t[7][:-1])
-                coords[name] = "%s %s" % (ra, dec)
-        if not f[i].startswith('#'):
-            if int(float(f[i].split()[0])) == jd_today:
-                todays_lines.append(f[i])
-    return todays_lines, coords
-
-def splitFullPartials(todays_lines, coords):
-    """
-    Split up tonights transiting objects into
-    full and partial transits, print the results
-    to the screen
-    """
-    partials, full_coords, partial_coords = [], [], []
-    print("\nFull Transits (La Palma):")
-    for i in range(0, len(todays_lines)):
-        x = todays_lines[i].split()[9:]
-        if "Full" in x and "Transit" in x:
-            print(todays_lines[i].split('\n')[0])
-            full_coords.append(todays_lines[i].split()[1])
+repo_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+# the almanac file layout, as eph_almanac
+almanac_magic = b'EPHALM01'
+almanac_header = '<8sii4d'
+almanac_header_size = 64
+almanac_night = '<ihBB8dfb3x'
+almanac_fields = ['night', 'year', 'month', 'day', 'sunset', 'evening_twilight', 'morning_twilight',
+                  'sunrise', 'moonrise', 'moonset', 'twi1', 'twi2', 'illumination', 'always']
+
+# JD 2451545.0, for turning the listings' UTC dates and times into JDs
+j2000 = datetime.datetime(2000, 1, 1, 12)
+
+def argParse():
+    parser = ap.ArgumentParser()
+    parser.add_argument('night', nargs='?', default='tonight',
+                        help='tonight (default), tomorrow, yesterday, a date '
+                        '(e.g. 2016-12-01) or the JD of its noon')
+    parser.add_argument('--site', action='append',
+                        help='observatory name (default all with a listing)')
+    parser.add_argument('--dir', default=repo_dir,
+                        help='directory of the <site>.eph2 listings')
+    parser.add_argument('--observatories', default=os.path.join(repo_dir, 'observatories2'),
+                        help='observatories file, for the noontimes')
+    parser.add_argument('--almanac', default=os.path.join(repo_dir, 'almanac'),
+                        help='directory of the <site>.alm night almanacs, if any')
+    return parser.parse_args()
+
+def jdNow():
+    return time.time() / 86400. + 2440587.5
+
+def dateToJD(date):
+    # JD at noon UT on a Gregorian YYYY-MM-DD date
+    y, m, d = [int(x) for x in date.split('-')]
+    a = (14 - m) // 12
+    y = y + 4800 - a
+    m = m + 12 * a - 3
+    return d + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
+
+def noonTimes(filename):
+    # noontime (UTC hours) of each observatory
+    noons = {}
+    if os.path.exists(filename):
+        with open(filename) as f:
+            for line in f:
+                parts = line.split()
+                if line[0] in '# \n' or len(parts) < 11:
+                    continue
+                h, m, s = parts[9].split(':')
+                noons[parts[0]] = int(h) + int(m) / 60. + float(s) / 3600.
+    return noons
+
+def nightNumber(night, noon):
+    # integer JD of the noon starting the night, as Night_array
+    if night in ('tonight', 'tomorrow', 'yesterday'):
+        n = int((jdNow() + 0.5 - noon / 24.) // 1)
+        return n + {'tonight': 0, 'tomorrow': 1, 'yesterday': -1}[night]
+    if '-' in night[1:]:
+        return dateToJD(night)
+    return int(float(night))
+
+def almanacNoon(filename):
+    # noontime (UTC hours) the almanac was made with, None without one
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        header = struct.unpack(almanac_header, f.read(struct.calcsize(almanac_header)))
+    return header[6] if header[0] == almanac_magic else None
+
+def readAlmanac(filename, night):
+    # the almanac record of the night as a dict, None if not covered
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = struct.unpack_from(almanac_header, mm)
+            row = night - header[1]
+            if header[0] != almanac_magic or not 0 <= row < header[2]:
+                return None
+            values = struct.unpack_from(almanac_night, mm,
+                                        almanac_header_size + row * struct.calcsize(almanac_night))
+        finally:
+            mm.close()
+    return dict(zip(almanac_fields, values))
+
+def utTime(jd):
+    # HH:MM UT of a JD, -- for none (NaN)
+    if jd != jd:
+        return '--:--'
+    minutes = int(round(((jd + 0.5) % 1.) * 1440.)) % 1440
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+def printAlmanac(site, night):
+    # the night's sun and Moon times
+    print("\nNight of {:04d}-{:02d}-{:02d} at {} (UT):".format(night['year'], night['month'],
+                                                          night['day'], site))
+    dark = '{} - {}'.format(utTime(night['evening_twilight']), utTime(night['morning_twilight']))
+    if night['always'] > 0:
+        dark = 'none'
+    elif night['always'] < 0:
+        dark = 'all night'
+    print("Sunset {}  dark {}  sunrise {}".format(utTime(night['sunset']), dark,
+                                                  utTime(night['sunrise'])))
+    print("Moonrise {}  moonset {}  illumination {:.0f}%".format(utTime(night['moonrise']),
+                                                                utTime(night['moonset']),
+                                                                night['illumination']))
+
+def lineStart(f, pos):
+    # offset of the first line starting at or after pos
+    if pos == 0:
+        return 0
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+def lineTime(line):
+    # UTC JD of a transit line from its date and time columns, the
+    # first column is the mid-time in the catalog's time standard
+    fields = line.split()
+    day, month, year = [int(x) for x in fields[2].split(b'/')]
+    hours, mins, secs = [int(x) for x in fields[3].split(b':')]
+    return (datetime.datetime(year, month, day, hours, mins, secs) - j2000).total_seconds() / 86400. + 2451545.
+
+def findTime(f, size, jd):
+    # offset of the first transit line with UTC >= jd, bisecting on
+    # byte offsets. Header lines all come first so count as earlier
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        lineStart(f, mid)
+        line = f.readline()
+        if line and (line.startswith(b'#') or lineTime(line) < jd):
+            lo = mid + 1
         else:
-            partials.append(todays_lines[i])
-    print("\nPartials (La Palma):")
-    if len(partials) > 0:
-        for i in range(0, len(partials)):
-            print(partials[i].split('\n')[0])
-            partial_coords.append(partials[i].split()[1])
+            hi = mid
+    return lineStart(f, lo)
+
+def readNight(filename, start, end):
+    # transit lines with start <= UTC < end
+    lines = []
+    with open(filename, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(findTime(f, f.tell(), start))
+        for line in f:
+            if lineTime(line) >= end:
+                break
+            lines.append(line.decode('utf-8').rstrip('\n'))
+    return lines
+
+def readCoords(filename, names):
+    # RA/Dec of the named objects from the listing's header
+    coords = {}
+    with open(filename, 'rb') as f:
+        for line in f:
+            if not line.startswith(b'#') or len(coords) == len(names):
+                break
+            line = line.decode('utf-8')
+            if line.count('[') == 2 and line.count(']') == 2:
+                name = line[1:].split('[')[0].strip()
+                if name in names:
+                    ra, dec = [part.split(']')[0].split() for part in line.split('[')[1:]]
+                    coords[name] = '{} {}'.format(':'.join(ra), ':'.join(dec))
+    return coords
 
+def printNight(site, lines, coords):
+    # full transits then partials, then the coordinates
+    full = [line for line in lines if 'Full' in line.split()[9:]]
+    partials = [line for line in lines if 'Full' not in line.split()[9:]]
+    print("\nFull Transits ({}):".format(site))
+    for line in full:
+        print(line)
+    print("\nPartials ({}):".format(site))
+    for line in partials:
+        print(line)
     print("\nTarget Coordinates for Object Visibility:")
-    if len(full_coords) > 0:
-        for i in range(0, len(full_coords)):
-            print("{} {}".format(full_coords[i], coords[full_coords[i]]))
-    if len(partial_coords) > 0:
-        for i in range(0, len(partial_coords)):
-            print("{} {}".format(partial_coords[i], coords[partial_coords[i]]))
+    for line in full + partials:
+        name = line.split()[1]
+        print("{} {}".format(name, coords.get(name, '')))
 
 if __name__ == '__main__':
-    tonight, coords = getTonightsTransits()
-    splitFullPartials(tonight, coords)
+    args = argParse()
+    if args.site:
+        sites = args.site
+    else:
+        sites = sorted(f[:-5] for f in os.listdir(args.dir) if f.endswith('.eph2'))
+    noons = noonTimes(args.observatories)
+    for site in sites:
+        filename = os.path.join(args.dir, site + '.eph2')
+        if not os.path.exists(filename):
+            print("\nNo listing for {} ({})".format(site, filename))
+            continue
+        almanac = os.path.join(args.almanac, site + '.alm')
+        noon = almanacNoon(almanac)
+        if noon is None:
+            noon = noons.get(site, 12.)
+        night = nightNumber(args.night, noon)
+        start = night - 0.5 + noon / 24.
+        conditions = readAlmanac(almanac, night) if os.path.exists(almanac) else None
+        if conditions is not None:
+            printAlmanac(site, conditions)
+        lines = readNight(filename, start, start + 1.)
+        coords = readCoords(filename, set(line.split()[1] for line in lines))
+        printNight(site, lines, coords)